@@ -0,0 +1,140 @@
+"""Uptime Kuma への heartbeat をバックグラウンドで送る。"""
+
+from __future__ import annotations
+
+import http.client
+import logging
+import threading
+import time
+from typing import Callable
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+logger = logging.getLogger("homeiot_device_raspi.heartbeat")
+
+
+class HeartbeatSender:
+    """publish の成否を集計し、レート制限付きで Uptime Kuma に push する。
+
+    計測ループからは `record_publish` で結果を積むだけで、HTTP 通信は
+    専用スレッドが keep-alive 接続で行う。`min_interval` 秒の間に積まれた
+    結果は 1 回の push にまとめられ、その間の成功率で up/down を決める。
+    """
+
+    def __init__(
+        self,
+        url: str,
+        *,
+        min_interval: float = 60.0,
+        timeout: float = 5.0,
+        min_success_ratio: float = 0.5,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], object] | None = None,
+    ) -> None:
+        parsed = urlsplit(url)
+        if not parsed.hostname:
+            raise ValueError(f"Uptime Kuma の push URL が不正です: {url}")
+        self._scheme = parsed.scheme
+        self._host = parsed.hostname
+        self._port = parsed.port
+        self._path = parsed.path or "/"
+        self._query = dict(parse_qsl(parsed.query))
+        self._min_interval = min_interval
+        self._timeout = timeout
+        self._min_success_ratio = min_success_ratio
+        self._clock = clock
+
+        self._lock = threading.Lock()
+        self._pending = threading.Event()
+        self._stopping = threading.Event()
+        # 既定では stop() で起こされる待ち方にする
+        self._sleep = sleep or self._stopping.wait
+        self._successes = 0
+        self._failures = 0
+        self._next_allowed = 0.0
+        self._connection: http.client.HTTPConnection | None = None
+        self._thread = threading.Thread(
+            target=self._run, name="uptime-kuma-heartbeat", daemon=True
+        )
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self, timeout: float | None = None) -> None:
+        self._stopping.set()
+        self._pending.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+
+    def record_publish(self, success: bool) -> None:
+        """publish の結果を積む。ブロックしない。"""
+
+        with self._lock:
+            if success:
+                self._successes += 1
+            else:
+                self._failures += 1
+        self._pending.set()
+
+    def build_push_path(self, successes: int, failures: int) -> str:
+        total = successes + failures
+        ratio = successes / total if total else 0.0
+        query = dict(self._query)
+        query["status"] = "up" if ratio >= self._min_success_ratio else "down"
+        query["msg"] = f"publish {successes}/{total}"
+        return f"{self._path}?{urlencode(query)}"
+
+    def _drain(self) -> tuple[int, int]:
+        with self._lock:
+            successes, failures = self._successes, self._failures
+            self._successes = 0
+            self._failures = 0
+            self._pending.clear()
+        return successes, failures
+
+    def push_pending(self) -> bool:
+        """レート制限まで待ってから積まれた結果を 1 回 push する。停止したら False。"""
+
+        remaining = self._next_allowed - self._clock()
+        if remaining > 0:
+            self._sleep(remaining)
+            if self._stopping.is_set():
+                return False
+        successes, failures = self._drain()
+        self._next_allowed = self._clock() + self._min_interval
+        path = self.build_push_path(successes, failures)
+        try:
+            self._request(path)
+            logger.debug("Uptime Kuma への push に成功しました。")
+        except Exception as exc:
+            logger.warning("Uptime Kuma への push に失敗しました: %s", exc)
+            self._close_connection()
+        return True
+
+    def _run(self) -> None:
+        while True:
+            self._pending.wait()
+            if self._stopping.is_set() or not self.push_pending():
+                break
+        self._close_connection()
+
+    def _open_connection(self) -> http.client.HTTPConnection:
+        if self._scheme == "https":
+            return http.client.HTTPSConnection(
+                self._host, self._port, timeout=self._timeout
+            )
+        return http.client.HTTPConnection(self._host, self._port, timeout=self._timeout)
+
+    def _request(self, path: str) -> None:
+        if self._connection is None:
+            self._connection = self._open_connection()
+        self._connection.request("GET", path, headers={"Connection": "keep-alive"})
+        response = self._connection.getresponse()
+        # keep-alive で再利用するため本文を読み切る
+        response.read()
+        if response.status >= 400:
+            raise RuntimeError(f"HTTP {response.status}")
+
+    def _close_connection(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
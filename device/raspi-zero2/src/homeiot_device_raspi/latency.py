@@ -0,0 +1,89 @@
+"""計測から publish までの段階別レイテンシを集計する。"""
+
+from __future__ import annotations
+
+import bisect
+import logging
+import time
+from typing import Callable
+
+logger = logging.getLogger("homeiot_device_raspi.latency")
+
+# 秒単位のバケット上限。Wi-SUN の往復は数百 ms〜数秒になる。
+DEFAULT_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class LatencyHistogram:
+    """固定バケットのヒストグラム。分位点はバケット上限で近似する。"""
+
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float) -> None:
+        seconds = max(0.0, seconds)
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q: float) -> float:
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for index, bucket_count in enumerate(self.counts):
+            cumulative += bucket_count
+            if cumulative >= rank:
+                if index < len(self.buckets):
+                    return min(self.buckets[index], self.max)
+                return self.max
+        return self.max
+
+
+class LatencyReporter:
+    """段階ごとのヒストグラムを保持し、一定間隔でログに要約を出す。"""
+
+    def __init__(
+        self,
+        report_interval: float = 600.0,
+        *,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self._report_interval = report_interval
+        self._clock = clock
+        self._next_report = clock() + report_interval
+        self.histograms: dict[str, LatencyHistogram] = {}
+        self.missed_deadlines = 0
+        self.publish_failures = 0
+
+    def observe(self, stage: str, seconds: float) -> None:
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            histogram = self.histograms[stage] = LatencyHistogram()
+        histogram.observe(seconds)
+
+    def summary(self) -> str:
+        parts = [
+            f"{stage}: n={h.count} p50={h.quantile(0.5):.3f}s "
+            f"p99={h.quantile(0.99):.3f}s max={h.max:.3f}s"
+            for stage, h in sorted(self.histograms.items())
+        ]
+        parts.append(f"missed_deadlines={self.missed_deadlines}")
+        parts.append(f"publish_failures={self.publish_failures}")
+        return " / ".join(parts)
+
+    def maybe_report(self) -> bool:
+        """報告間隔を過ぎていれば要約をログに出してリセットする。"""
+
+        if self._clock() < self._next_report:
+            return False
+        logger.info("レイテンシ集計: %s", self.summary())
+        self.histograms = {}
+        self.missed_deadlines = 0
+        self.publish_failures = 0
+        self._next_report = self._clock() + self._report_interval
+        return True
@@ -0,0 +1,204 @@
+"""計測ループをブロックしない、SD カードに優しいログ出力。"""
+
+from __future__ import annotations
+
+import atexit
+import logging
+import queue
+import sys
+import threading
+import time
+from logging.handlers import (
+    MemoryHandler,
+    QueueHandler,
+    QueueListener,
+    RotatingFileHandler,
+)
+from typing import Callable
+
+
+class BatchingRotatingFileHandler(RotatingFileHandler):
+    """レコードを溜めて、サイズか経過時間か ERROR で 1 回の write にまとめる。"""
+
+    def __init__(
+        self,
+        filename: str,
+        *,
+        max_bytes: int,
+        backup_count: int,
+        flush_bytes: int = 64 * 1024,
+        flush_interval: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        super().__init__(
+            filename,
+            maxBytes=max_bytes,
+            backupCount=backup_count,
+            encoding="utf-8",
+            delay=True,
+        )
+        self.flush_bytes = flush_bytes
+        self.flush_interval = flush_interval
+        self._clock = clock
+        self._pending: list[str] = []
+        self._pending_bytes = 0
+        self._last_flush = clock()
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            message = self.format(record) + self.terminator
+        except Exception:
+            self.handleError(record)
+            return
+        self._pending.append(message)
+        self._pending_bytes += len(message.encode("utf-8"))
+        if (
+            record.levelno >= logging.ERROR
+            or self._pending_bytes >= self.flush_bytes
+            or self._clock() - self._last_flush >= self.flush_interval
+        ):
+            self.flush()
+
+    def flush(self) -> None:
+        self.acquire()
+        try:
+            self._last_flush = self._clock()
+            if not self._pending:
+                return
+            chunk = "".join(self._pending)
+            size = self._pending_bytes
+            self._pending = []
+            self._pending_bytes = 0
+            try:
+                if self.stream is None:
+                    self.stream = self._open()
+                if self.maxBytes > 0 and self.stream.tell() + size >= self.maxBytes:
+                    self.doRollover()
+                    if self.stream is None:
+                        self.stream = self._open()
+                self.stream.write(chunk)
+                self.stream.flush()
+            except OSError as exc:
+                # ディスク障害でも計測は止めない
+                sys.stderr.write(f"ログファイルへの書き込みに失敗しました: {exc}\n")
+        finally:
+            self.release()
+
+    def close(self) -> None:
+        self.flush()
+        super().close()
+
+
+class RingBufferHandler(MemoryHandler):
+    """直近のレコードだけをメモリに保持し、ERROR 以上で target に書き出す。"""
+
+    def __init__(self, capacity: int, target: logging.Handler) -> None:
+        super().__init__(
+            capacity,
+            flushLevel=logging.ERROR,
+            target=target,
+            flushOnClose=False,
+        )
+
+    def shouldFlush(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= self.flushLevel
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.buffer.append(record)
+        if len(self.buffer) > self.capacity:
+            del self.buffer[: len(self.buffer) - self.capacity]
+        if self.shouldFlush(record):
+            self.flush()
+
+    def close(self) -> None:
+        target = self.target
+        super().close()
+        if target is not None:
+            target.close()
+
+
+class RepeatFilter(logging.Filter):
+    """同じ内容の WARNING 以上を `interval` 秒に 1 回へ間引く。
+
+    間引いた件数は、次に通したレコードの末尾に付ける。
+    """
+
+    def __init__(
+        self,
+        interval: float = 300.0,
+        *,
+        clock: Callable[[], float] = time.monotonic,
+        max_keys: int = 256,
+    ) -> None:
+        super().__init__()
+        self.interval = interval
+        self._clock = clock
+        self._max_keys = max_keys
+        self._lock = threading.Lock()
+        # key -> (最後に通した時刻, 抑制件数)
+        self._seen: dict[tuple[str, int, str], tuple[float, int]] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < logging.WARNING or self.interval <= 0:
+            return True
+        key = (record.name, record.levelno, record.getMessage())
+        now = self._clock()
+        with self._lock:
+            last = self._seen.get(key)
+            if last is not None and now - last[0] < self.interval:
+                self._seen[key] = (last[0], last[1] + 1)
+                return False
+            if len(self._seen) >= self._max_keys:
+                self._seen.clear()
+            self._seen[key] = (now, 0)
+        if last is not None and last[1]:
+            record.msg = f"{record.msg} (同じ内容を {last[1]} 件抑制しました)"
+        return True
+
+
+class FlushingQueueListener(QueueListener):
+    """キューが空のときも `flush_interval` ごとに handler を flush する。"""
+
+    def __init__(
+        self,
+        log_queue: queue.Queue[logging.LogRecord],
+        *handlers: logging.Handler,
+        flush_interval: float,
+    ) -> None:
+        super().__init__(log_queue, *handlers, respect_handler_level=True)
+        self.flush_interval = flush_interval
+
+    def dequeue(self, block: bool) -> logging.LogRecord:
+        while True:
+            try:
+                return self.queue.get(block, timeout=self.flush_interval)
+            except queue.Empty:
+                for handler in self.handlers:
+                    handler.flush()
+
+    def stop(self) -> None:
+        super().stop()
+        for handler in self.handlers:
+            handler.close()
+
+
+def start_async_logging(
+    logger: logging.Logger,
+    handlers: list[logging.Handler],
+    *,
+    flush_interval: float,
+    repeat_interval: float,
+) -> FlushingQueueListener:
+    """logger への出力をキュー経由にし、書き込みを専用スレッドに任せる。"""
+
+    log_queue: queue.Queue[logging.LogRecord] = queue.Queue(-1)
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.addFilter(RepeatFilter(repeat_interval))
+    logger.addHandler(queue_handler)
+
+    listener = FlushingQueueListener(
+        log_queue, *handlers, flush_interval=flush_interval
+    )
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
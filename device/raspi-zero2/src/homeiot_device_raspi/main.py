@@ -2,14 +2,24 @@ import json
 import logging
 import os
 import time
-from logging.handlers import RotatingFileHandler
+from dataclasses import dataclass
+from datetime import datetime, timezone
 from urllib.parse import urlparse
-from urllib.request import urlopen
 
 import momonga
 import paho.mqtt.client as mqtt
 from dotenv import load_dotenv
 
+from homeiot_device_raspi.heartbeat import HeartbeatSender
+from homeiot_device_raspi.latency import LatencyReporter
+from homeiot_device_raspi.log_pipeline import (
+    BatchingRotatingFileHandler,
+    RingBufferHandler,
+    start_async_logging,
+)
+from homeiot_device_raspi.scheduler import SamplingScheduler
+from homeiot_device_raspi.wisun_session import WisunConnector
+
 load_dotenv()
 
 BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", ".."))
@@ -17,10 +27,33 @@ LOG_DIR = os.path.join(BASE_DIR, "logs")
 LOG_PATH = os.path.join(LOG_DIR, "device.log")
 LOG_MAX_BYTES = 5 * 1024 * 1024
 LOG_BACKUP_COUNT = 3
+LOGGER_NAME = "homeiot_device_raspi"
+
+
+def get_float_env(name: str, default: float) -> float:
+    raw_value = os.getenv(name)
+    if raw_value is None:
+        return default
+    try:
+        return float(raw_value)
+    except ValueError:
+        logging.getLogger(LOGGER_NAME).warning(
+            "%s の値が不正です: %s (default=%s)", name, raw_value, default
+        )
+        return default
+
+
+# ==== ログ設定 ====
+# ファイルへの書き込みは専用スレッドでまとめて行い、SD カードへの書き込み回数を減らす。
+LOG_FLUSH_BYTES = int(get_float_env("LOG_FLUSH_BYTES", 64 * 1024))
+LOG_FLUSH_INTERVAL = get_float_env("LOG_FLUSH_INTERVAL", 30.0)
+LOG_REPEAT_INTERVAL = get_float_env("LOG_REPEAT_INTERVAL", 300.0)
+# 0 より大きければ、ファイルには ERROR 発生時に直近 N 件だけを書き出す
+LOG_RING_SIZE = int(get_float_env("LOG_RING_SIZE", 0))
 
 
 def setup_logging() -> logging.Logger:
-    logger = logging.getLogger("homeiot_device_raspi")
+    logger = logging.getLogger(LOGGER_NAME)
     if logger.handlers:
         return logger
 
@@ -33,17 +66,33 @@ def setup_logging() -> logging.Logger:
 
     stream_handler = logging.StreamHandler()
     stream_handler.setFormatter(formatter)
-    logger.addHandler(stream_handler)
+    handlers: list[logging.Handler] = [stream_handler]
 
+    file_error: OSError | None = None
     try:
         os.makedirs(LOG_DIR, exist_ok=True)
-        file_handler = RotatingFileHandler(
-            LOG_PATH, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT
+        file_handler: logging.Handler = BatchingRotatingFileHandler(
+            LOG_PATH,
+            max_bytes=LOG_MAX_BYTES,
+            backup_count=LOG_BACKUP_COUNT,
+            flush_bytes=LOG_FLUSH_BYTES,
+            flush_interval=LOG_FLUSH_INTERVAL,
         )
         file_handler.setFormatter(formatter)
-        logger.addHandler(file_handler)
+        if LOG_RING_SIZE > 0:
+            file_handler = RingBufferHandler(LOG_RING_SIZE, target=file_handler)
+        handlers.append(file_handler)
     except OSError as exc:
-        logger.warning("ログファイルを作成できませんでした: %s", exc)
+        file_error = exc
+
+    start_async_logging(
+        logger,
+        handlers,
+        flush_interval=LOG_FLUSH_INTERVAL,
+        repeat_interval=LOG_REPEAT_INTERVAL,
+    )
+    if file_error:
+        logger.warning("ログファイルを作成できませんでした: %s", file_error)
 
     return logger
 
@@ -61,19 +110,28 @@ MQTT_TOPIC = os.getenv("MQTT_TOPIC", "home/power")
 MQTT_TLS_CA_CERT = os.getenv("MQTT_TLS_CA_CERT")
 UPTIME_KUMA_PUSH_URL = os.getenv("UPTIME_KUMA_PUSH_URL")
 
-
-def get_float_env(name: str, default: float) -> float:
-    raw_value = os.getenv(name)
-    if raw_value is None:
-        return default
-    try:
-        return float(raw_value)
-    except ValueError:
-        logger.warning("%s の値が不正です: %s (default=%s)", name, raw_value, default)
-        return default
-
-
 UPTIME_KUMA_PUSH_TIMEOUT = get_float_env("UPTIME_KUMA_PUSH_TIMEOUT", 5.0)
+UPTIME_KUMA_PUSH_INTERVAL = get_float_env("UPTIME_KUMA_PUSH_INTERVAL", 60.0)
+UPTIME_KUMA_MIN_SUCCESS_RATIO = get_float_env("UPTIME_KUMA_MIN_SUCCESS_RATIO", 0.5)
+
+# ==== サンプリング周期 ====
+# 瞬時電力は毎周期、積算電力量は 30 分ごとの更新直後だけ取得する。
+POWER_PROPERTY = "instantaneous_power"
+ENERGY_PROPERTY = "measured_cumulative_energy"
+POWER_INTERVAL = get_float_env("POWER_INTERVAL", 10.0)
+ENERGY_INTERVAL = get_float_env("ENERGY_INTERVAL", 1800.0)
+ENERGY_OFFSET = get_float_env("ENERGY_OFFSET", 60.0)
+LATENCY_REPORT_INTERVAL = get_float_env("LATENCY_REPORT_INTERVAL", 600.0)
+
+# ==== Wi-SUN 再接続 ====
+# 最後に参加できた PAN を残し、次回はスキャンせずに直接参加する
+WISUN_CACHE_PATH = os.getenv(
+    "WISUN_CACHE_PATH", os.path.join(BASE_DIR, "state", "wisun_pan.json")
+)
+# 瞬時電力の取得がこの回数続けて失敗したらセッションを張り直す
+WISUN_MAX_FAILURES = int(get_float_env("WISUN_MAX_FAILURES", 6))
+WISUN_RECONNECT_MIN_DELAY = get_float_env("WISUN_RECONNECT_MIN_DELAY", 5.0)
+WISUN_RECONNECT_MAX_DELAY = get_float_env("WISUN_RECONNECT_MAX_DELAY", 300.0)
 
 
 def validate_required_env() -> None:
@@ -172,59 +230,209 @@ def build_mqtt_client() -> mqtt.Client | None:
     return client
 
 
-def push_uptime_kuma(url: str) -> None:
+def build_heartbeat_sender() -> HeartbeatSender | None:
+    """UPTIME_KUMA_PUSH_URL があればバックグラウンド送信を開始する。"""
+
+    if not UPTIME_KUMA_PUSH_URL:
+        return None
     try:
-        with urlopen(url, timeout=UPTIME_KUMA_PUSH_TIMEOUT):
-            logger.debug("Uptime Kuma への push に成功しました。")
-    except Exception as exc:
-        logger.warning("Uptime Kuma への push に失敗しました: %s", exc)
+        sender = HeartbeatSender(
+            UPTIME_KUMA_PUSH_URL,
+            min_interval=UPTIME_KUMA_PUSH_INTERVAL,
+            timeout=UPTIME_KUMA_PUSH_TIMEOUT,
+            min_success_ratio=UPTIME_KUMA_MIN_SUCCESS_RATIO,
+        )
+    except ValueError as exc:
+        logger.error("%s", exc)
+        return None
+    sender.start()
+    return sender
+
+
+def format_timestamp(epoch: float) -> str:
+    return (
+        datetime.fromtimestamp(epoch, tz=timezone.utc)
+        .isoformat(timespec="milliseconds")
+        .replace("+00:00", "Z")
+    )
+
+
+def build_payload(
+    *,
+    power: float,
+    energy_import: float | None,
+    measured_at: float,
+    seq: int,
+) -> dict[str, object]:
+    """MQTT に送る JSON を組み立てる。
+
+    measured_at はスケジュール上のサンプル時刻、seq は起動時から単調増加する
+    番号で、ゲートウェイ側でレイテンシと欠損の計算に使う。
+    """
+
+    return {
+        "meter": "home",
+        "power_w": float(power),
+        "energy_import_kwh": energy_import,
+        "measured_at": format_timestamp(measured_at),
+        "published_at": format_timestamp(time.time()),
+        "seq": seq,
+    }
+
+
+def build_scheduler() -> SamplingScheduler:
+    scheduler = SamplingScheduler()
+    scheduler.add_property(POWER_PROPERTY, POWER_INTERVAL)
+    scheduler.add_property(ENERGY_PROPERTY, ENERGY_INTERVAL, offset=ENERGY_OFFSET)
+    return scheduler
+
+
+def build_wisun_connector() -> WisunConnector:
+    return WisunConnector(
+        lambda: momonga.Momonga(rbid, pwd, dev),
+        WISUN_CACHE_PATH,
+        min_delay=WISUN_RECONNECT_MIN_DELAY,
+        max_delay=WISUN_RECONNECT_MAX_DELAY,
+    )
+
+
+@dataclass
+class PublishState:
+    """セッションを張り直しても引き継ぐ送信側の状態。"""
+
+    seq: int = 0
+    # 瞬時電力と周期がずれた場合でも、次の瞬時電力と一緒に送る。
+    energy_import: float | None = None
+
+
+def run_session(
+    mo: momonga.Momonga,
+    *,
+    scheduler: SamplingScheduler,
+    latency: LatencyReporter,
+    state: PublishState,
+    mqtt_client: mqtt.Client | None,
+    heartbeat: HeartbeatSender | None,
+    connector: WisunConnector,
+) -> None:
+    """1 つのセッションで計測を続け、張り直しが必要になったら戻る。"""
+
+    first_reading = True
+    failures = 0
+    while True:
+        due = scheduler.wait_for_due()
+        latency.observe("sample_lateness", due.lateness)
+        latency.missed_deadlines += sum(due.missed_deadlines.values())
+        try:
+            # 積算電力量（買電）のみ取得。取得できなくても計測は継続する。
+            if ENERGY_PROPERTY in due.names:
+                try:
+                    started = time.monotonic()
+                    state.energy_import = mo.get_measured_cumulative_energy(
+                        reverse=False
+                    )
+                    latency.observe("wisun_energy", time.monotonic() - started)
+                    logger.info("積算電力量: %s kWh", state.energy_import)
+                except Exception as e:
+                    logger.warning(
+                        "積算電力量の取得に失敗しました: %s", e, exc_info=True
+                    )
+
+            if POWER_PROPERTY not in due.names:
+                continue
+
+            # 取得に失敗した周期も番号を消費し、欠損として見えるようにする
+            state.seq += 1
+            started = time.monotonic()
+            power = mo.get_instantaneous_power()  # W
+            latency.observe("wisun_power", time.monotonic() - started)
+            logger.info("現在の瞬時電力: %.1f W", power)
+            failures = 0
+            if first_reading:
+                first_reading = False
+                elapsed = time.monotonic() - connector.started_at
+                latency.observe("wisun_time_to_first_reading", elapsed)
+                logger.info(
+                    "Wi-SUN 接続開始から最初の計測まで %.1f 秒 (%s, %d 回目)",
+                    elapsed,
+                    connector.mode,
+                    connector.attempts,
+                )
+
+            if mqtt_client:
+                payload = build_payload(
+                    power=power,
+                    energy_import=state.energy_import,
+                    measured_at=due.scheduled_at,
+                    seq=state.seq,
+                )
+                publish_result = mqtt_client.publish(
+                    MQTT_TOPIC, json.dumps(payload), qos=1
+                )
+                published = publish_result.rc == mqtt.MQTT_ERR_SUCCESS
+                latency.observe("sample_to_publish", time.time() - due.scheduled_at)
+                if published:
+                    # 送れなかった積算電力量は次の瞬時電力と一緒に送り直す
+                    state.energy_import = None
+                else:
+                    latency.publish_failures += 1
+                if heartbeat:
+                    heartbeat.record_publish(published)
+
+        except momonga.MomongaNeedToReopen as e:
+            # momonga がセッションの作り直しを求めている
+            logger.warning("Wi-SUN セッションを張り直します: %s", e)
+            if heartbeat:
+                heartbeat.record_publish(False)
+            return
+        except Exception as e:
+            # 次の周期まで待って再トライ
+            logger.exception("エラーが発生しました: %s", e)
+            if heartbeat:
+                heartbeat.record_publish(False)
+            failures += 1
+            if failures >= WISUN_MAX_FAILURES:
+                logger.warning(
+                    "瞬時電力の取得が %d 回続けて失敗したため Wi-SUN セッションを"
+                    "張り直します。",
+                    failures,
+                )
+                return
+        finally:
+            latency.maybe_report()
 
 
 def main():
     validate_required_env()
     mqtt_client = build_mqtt_client()
+    heartbeat = build_heartbeat_sender()
+    scheduler = build_scheduler()
+    latency = LatencyReporter(LATENCY_REPORT_INTERVAL)
+    connector = build_wisun_connector()
+    state = PublishState()
 
     try:
-        # momongaでスマートメーターに接続
-        with momonga.Momonga(rbid, pwd, dev) as mo:
-            while True:
-                try:
-                    power = mo.get_instantaneous_power()  # W
-                    logger.info("現在の瞬時電力: %.1f W", power)
-                    # 積算電力量（買電）のみ取得。取得できなくても計測は継続する。
-                    energy_import = None
-                    try:
-                        energy_import = mo.get_measured_cumulative_energy(reverse=False)
-                    except Exception as e:
-                        logger.warning(
-                            "積算電力量の取得に失敗しました: %s", e, exc_info=True
-                        )
-
-                    if mqtt_client:
-                        payload = {
-                            "meter": "home",
-                            "power_w": float(power),
-                            "energy_import_kwh": energy_import,
-                        }
-                        publish_result = mqtt_client.publish(
-                            MQTT_TOPIC, json.dumps(payload), qos=1
-                        )
-                        if (
-                            UPTIME_KUMA_PUSH_URL
-                            and publish_result.rc == mqtt.MQTT_ERR_SUCCESS
-                        ):
-                            push_uptime_kuma(UPTIME_KUMA_PUSH_URL)
-
-                    # 30〜60秒くらいがオススメ
-                    time.sleep(10)
-
-                except Exception as e:
-                    logger.exception("エラーが発生しました: %s", e)
-                    # 少し待って再トライ
-                    time.sleep(10)
+        # セッションが切れてもプロセスは終了せず、ここで張り直す
+        while True:
+            # momongaでスマートメーターに接続（キャッシュした PAN → スキャンの順）
+            mo = connector.connect()
+            try:
+                run_session(
+                    mo,
+                    scheduler=scheduler,
+                    latency=latency,
+                    state=state,
+                    mqtt_client=mqtt_client,
+                    heartbeat=heartbeat,
+                    connector=connector,
+                )
+            finally:
+                connector.close(mo)
     except KeyboardInterrupt:
         logger.info("終了要求を受け取りました。")
     finally:
+        if heartbeat:
+            heartbeat.stop(timeout=UPTIME_KUMA_PUSH_TIMEOUT)
         if mqtt_client:
             mqtt_client.disconnect()
             mqtt_client.loop_stop()
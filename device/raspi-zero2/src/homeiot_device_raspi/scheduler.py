@@ -0,0 +1,123 @@
+"""単調時計ベースのサンプリングスケジューラ。"""
+
+from __future__ import annotations
+
+import logging
+import math
+import time
+from dataclasses import dataclass, field
+from typing import Callable
+
+logger = logging.getLogger("homeiot_device_raspi.scheduler")
+
+
+@dataclass
+class ScheduledProperty:
+    """ECHONET プロパティごとの取得周期。
+
+    `interval` 秒ごとの壁時計境界から `offset` 秒ずらした時刻に取得する。
+    """
+
+    name: str
+    interval: float
+    offset: float = 0.0
+    next_deadline: float = 0.0
+    missed_deadlines: int = 0
+
+
+@dataclass
+class DueProperties:
+    """`wait_for_due` が返す 1 回分の取得対象。"""
+
+    names: frozenset[str]
+    scheduled_at: float
+    lateness: float
+    missed_deadlines: dict[str, int] = field(default_factory=dict)
+
+
+class SamplingScheduler:
+    """各プロパティを壁時計境界に揃えて、ドリフトせずに起床させる。
+
+    期限は前回の期限に周期を足して求めるため、取得処理や送信にかかった
+    時間が周期に積み上がらない。待機は単調時計で行い、壁時計は境界合わせと
+    タイムスタンプの算出にだけ使う。
+    """
+
+    def __init__(
+        self,
+        *,
+        clock: Callable[[], float] = time.monotonic,
+        wall_clock: Callable[[], float] = time.time,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        self._clock = clock
+        self._sleep = sleep
+        self._mono_anchor = clock()
+        self._wall_anchor = wall_clock()
+        self._properties: dict[str, ScheduledProperty] = {}
+
+    @property
+    def properties(self) -> dict[str, ScheduledProperty]:
+        return dict(self._properties)
+
+    def to_wall_time(self, deadline: float) -> float:
+        """単調時計上の期限を UNIX 時刻に変換する。"""
+
+        return self._wall_anchor + (deadline - self._mono_anchor)
+
+    def add_property(self, name: str, interval: float, offset: float = 0.0) -> None:
+        if interval <= 0:
+            raise ValueError(
+                f"interval は正の値である必要があります: {name}={interval}"
+            )
+        offset = offset % interval
+        now = self._clock()
+        wall_now = self.to_wall_time(now)
+        next_wall = math.floor((wall_now - offset) / interval + 1) * interval + offset
+        self._properties[name] = ScheduledProperty(
+            name=name,
+            interval=interval,
+            offset=offset,
+            next_deadline=now + (next_wall - wall_now),
+        )
+
+    def wait_for_due(self) -> DueProperties:
+        """次の期限まで待機し、期限を迎えたプロパティを返す。"""
+
+        if not self._properties:
+            raise RuntimeError("スケジュールされたプロパティがありません。")
+
+        deadline = min(prop.next_deadline for prop in self._properties.values())
+        remaining = deadline - self._clock()
+        if remaining > 0:
+            self._sleep(remaining)
+        now = self._clock()
+
+        names: set[str] = set()
+        missed: dict[str, int] = {}
+        latest = deadline
+        for prop in self._properties.values():
+            if prop.next_deadline > now:
+                continue
+            names.add(prop.name)
+            # 遅れた分の期限は飛ばし、直近の期限の取得として扱う
+            skipped = math.floor((now - prop.next_deadline) / prop.interval)
+            if skipped > 0:
+                prop.missed_deadlines += skipped
+                missed[prop.name] = skipped
+                logger.warning(
+                    "%s の取得期限を %d 回逃しました (累計 %d 回)",
+                    prop.name,
+                    skipped,
+                    prop.missed_deadlines,
+                )
+            current = prop.next_deadline + skipped * prop.interval
+            latest = max(latest, current)
+            prop.next_deadline = current + prop.interval
+
+        return DueProperties(
+            names=frozenset(names),
+            scheduled_at=self.to_wall_time(latest),
+            lateness=max(0.0, now - latest),
+            missed_deadlines=missed,
+        )
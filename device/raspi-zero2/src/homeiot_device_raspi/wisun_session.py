@@ -0,0 +1,192 @@
+"""Wi-SUN セッションの確立と再接続を受け持つ。
+
+アクティブスキャンは数十秒〜数分かかるため、最後に参加できた PAN の
+チャンネル・PAN ID・メーターの MAC アドレスをファイルに残しておき、
+次回はスキャンせずにその値で直接 PANA 認証を試す。直接参加に失敗したら
+キャッシュを捨ててスキャンからやり直し、それも失敗したら指数バックオフで
+待ってから繰り返す。
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import Any, Callable
+
+logger = logging.getLogger("homeiot_device_raspi.wisun_session")
+
+
+@dataclass(frozen=True)
+class PanInfo:
+    """スキャン結果のうち、直接参加に必要な値。"""
+
+    channel: int
+    pan_id: bytes
+    mac_addr: bytes
+
+    def to_json(self) -> dict[str, object]:
+        return {
+            "channel": self.channel,
+            "pan_id": self.pan_id.hex(),
+            "mac_addr": self.mac_addr.hex(),
+        }
+
+    @classmethod
+    def from_json(cls, data: dict[str, Any]) -> PanInfo:
+        return cls(
+            channel=int(data["channel"]),
+            pan_id=bytes.fromhex(data["pan_id"]),
+            mac_addr=bytes.fromhex(data["mac_addr"]),
+        )
+
+
+def load_pan_cache(path: str) -> PanInfo | None:
+    """キャッシュを読む。無いか壊れていれば None（スキャンする）。"""
+
+    try:
+        with open(path, encoding="utf-8") as handle:
+            return PanInfo.from_json(json.load(handle))
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, KeyError, TypeError) as exc:
+        logger.warning("PAN のキャッシュを読めませんでした: %s (%s)", path, exc)
+        return None
+
+
+def save_pan_cache(path: str, info: PanInfo) -> None:
+    """一時ファイルに書いてから置き換える（電源断で壊れたファイルを残さない）。"""
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as handle:
+        json.dump(info.to_json(), handle)
+        handle.flush()
+        os.fsync(handle.fileno())
+    os.replace(tmp_path, path)
+
+
+def clear_pan_cache(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class _ScanHook:
+    """SKSCAN の代わりにキャッシュを返す。実際にスキャンしたときは結果を控える。"""
+
+    def __init__(self, scan: Callable[..., Any], cached: PanInfo | None) -> None:
+        self._scan = scan
+        self.cached = cached
+        self.found: PanInfo | None = None
+
+    def __call__(self, *args: Any, **kwargs: Any) -> Any:
+        if self.cached is not None:
+            # momonga は channel / pan_id / mac_addr しか参照しない
+            return self.cached
+        result = self._scan(*args, **kwargs)
+        self.found = PanInfo(result.channel, result.pan_id, result.mac_addr)
+        return result
+
+
+class WisunConnector:
+    """Momonga のセッションを、キャッシュ → スキャンの順で張る。
+
+    `connect` は成功するまで戻らない。失敗が続くと `min_delay` 秒から倍々に
+    `max_delay` 秒まで待ち時間を延ばす。
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[], Any],
+        cache_path: str,
+        *,
+        min_delay: float = 5.0,
+        max_delay: float = 300.0,
+        sleep: Callable[[float], None] = time.sleep,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self._factory = factory
+        self._cache_path = cache_path
+        self._min_delay = min_delay
+        self._max_delay = max_delay
+        self._sleep = sleep
+        self._clock = clock
+        self.mode: str | None = None
+        self.started_at = 0.0
+        self.attempts = 0
+
+    def _open(self, cached: PanInfo | None) -> Any:
+        mo = self._factory()
+        skw = mo.session_manager.skw
+        hook = _ScanHook(skw.skscan, cached)
+        skw.skscan = hook
+        mo.open()
+        if hook.found is not None:
+            try:
+                save_pan_cache(self._cache_path, hook.found)
+            except OSError as exc:
+                logger.warning("PAN のキャッシュを保存できませんでした: %s", exc)
+        return mo
+
+    def _try_once(self) -> Any:
+        cached = load_pan_cache(self._cache_path)
+        if cached is not None:
+            logger.info(
+                "キャッシュした PAN に直接参加します: channel=%d pan_id=%s",
+                cached.channel,
+                cached.pan_id.hex(),
+            )
+            try:
+                mo = self._open(cached)
+                self.mode = "cached"
+                return mo
+            except Exception as exc:
+                # チャンネル変更やメーター交換で古くなった値は捨ててスキャンする
+                logger.warning(
+                    "キャッシュした PAN への参加に失敗しました。スキャンします: %s", exc
+                )
+                clear_pan_cache(self._cache_path)
+        mo = self._open(None)
+        self.mode = "scan"
+        return mo
+
+    def connect(self) -> Any:
+        """開いた Momonga を返す。`started_at` に接続を始めた時刻を残す。"""
+
+        self.started_at = self._clock()
+        self.attempts = 0
+        delay = self._min_delay
+        while True:
+            self.attempts += 1
+            try:
+                mo = self._try_once()
+            except Exception as exc:
+                logger.error(
+                    "Wi-SUN 接続に失敗しました (%d 回目、%.0f 秒後に再試行): %s",
+                    self.attempts,
+                    delay,
+                    exc,
+                )
+                self._sleep(delay)
+                delay = min(delay * 2, self._max_delay)
+                continue
+            logger.info(
+                "Wi-SUN 接続に成功しました (%s, %d 回目, %.1f 秒)",
+                self.mode,
+                self.attempts,
+                self._clock() - self.started_at,
+            )
+            return mo
+
+    @staticmethod
+    def close(mo: Any) -> None:
+        try:
+            mo.close()
+        except Exception as exc:
+            logger.warning("Wi-SUN セッションを閉じられませんでした: %s", exc)
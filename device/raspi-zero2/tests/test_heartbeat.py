@@ -0,0 +1,85 @@
+from urllib.parse import parse_qs, urlsplit
+
+from homeiot_device_raspi.heartbeat import HeartbeatSender
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class RecordingSender(HeartbeatSender):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.paths = []
+
+    def _request(self, path):
+        self.paths.append(path)
+
+
+def query_of(path):
+    return {key: values[0] for key, values in parse_qs(urlsplit(path).query).items()}
+
+
+def test_build_push_path_keeps_token_and_sets_status():
+    sender = HeartbeatSender(
+        "https://kuma.example.com/api/push/token?status=up&msg=OK&ping="
+    )
+
+    path = sender.build_push_path(successes=1, failures=3)
+
+    assert path.startswith("/api/push/token?")
+    assert query_of(path) == {"status": "down", "msg": "publish 1/4"}
+
+
+def test_invalid_url_is_rejected():
+    try:
+        HeartbeatSender("not-a-url")
+    except ValueError:
+        return
+    raise AssertionError("Expected ValueError for an invalid push URL")
+
+
+def test_pushes_are_coalesced_within_interval():
+    clock = FakeClock()
+    sender = RecordingSender(
+        "http://kuma.local/api/push/token",
+        min_interval=60.0,
+        clock=clock,
+        sleep=clock.sleep,
+    )
+
+    sender.record_publish(True)
+    assert sender.push_pending()
+
+    for _ in range(5):
+        sender.record_publish(True)
+    sender.record_publish(False)
+    clock.now += 10.0
+    assert sender.push_pending()
+
+    # 2 回目はレート制限の残り 50 秒を待ってから、6 件をまとめて送る
+    assert clock.sleeps == [50.0]
+    assert [query_of(path) for path in sender.paths] == [
+        {"status": "up", "msg": "publish 1/1"},
+        {"status": "up", "msg": "publish 5/6"},
+    ]
+
+
+def test_stop_wakes_the_thread_while_rate_limited():
+    sender = RecordingSender("http://kuma.local/api/push/token", min_interval=3600.0)
+    sender.start()
+    sender.record_publish(True)
+    sender.record_publish(True)
+
+    sender.stop(timeout=5.0)
+
+    assert not sender._thread.is_alive()
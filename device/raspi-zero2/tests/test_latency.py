@@ -0,0 +1,25 @@
+from homeiot_device_raspi.latency import LatencyHistogram, LatencyReporter
+
+
+def test_histogram_quantiles_use_bucket_bounds():
+    histogram = LatencyHistogram(buckets=(0.1, 1.0, 10.0))
+    for value in (0.05, 0.05, 0.5, 3.0):
+        histogram.observe(value)
+
+    assert histogram.count == 4
+    assert histogram.quantile(0.5) == 0.1
+    assert histogram.quantile(0.99) == 3.0
+
+
+def test_reporter_resets_after_interval():
+    now = [0.0]
+    reporter = LatencyReporter(60.0, clock=lambda: now[0])
+    reporter.observe("wisun_power", 0.8)
+    reporter.missed_deadlines += 2
+
+    assert reporter.maybe_report() is False
+    now[0] = 61.0
+    assert "missed_deadlines=2" in reporter.summary()
+    assert reporter.maybe_report() is True
+    assert reporter.histograms == {}
+    assert reporter.missed_deadlines == 0
@@ -0,0 +1,81 @@
+import logging
+
+from homeiot_device_raspi.log_pipeline import (
+    BatchingRotatingFileHandler,
+    RepeatFilter,
+    RingBufferHandler,
+)
+
+
+def make_record(msg, level=logging.INFO, *args):
+    return logging.LogRecord("test", level, __file__, 1, msg, args, None)
+
+
+def test_batching_handler_defers_writes_until_threshold(tmp_path):
+    path = tmp_path / "device.log"
+    handler = BatchingRotatingFileHandler(
+        str(path),
+        max_bytes=1024 * 1024,
+        backup_count=1,
+        flush_bytes=1024,
+        flush_interval=3600.0,
+    )
+    try:
+        handler.handle(make_record("sample 1"))
+        handler.handle(make_record("sample 2"))
+        assert not path.exists() or path.read_text() == ""
+
+        handler.handle(make_record("boom", logging.ERROR))
+        assert path.read_text().splitlines() == ["sample 1", "sample 2", "boom"]
+    finally:
+        handler.close()
+
+
+def test_batching_handler_rotates_on_flush(tmp_path):
+    path = tmp_path / "device.log"
+    handler = BatchingRotatingFileHandler(
+        str(path), max_bytes=32, backup_count=1, flush_bytes=1, flush_interval=0
+    )
+    try:
+        handler.handle(make_record("x" * 20))
+        handler.handle(make_record("y" * 20))
+    finally:
+        handler.close()
+
+    assert path.read_text() == "y" * 20 + "\n"
+    assert (tmp_path / "device.log.1").read_text() == "x" * 20 + "\n"
+
+
+def test_repeat_filter_suppresses_identical_warnings():
+    now = [0.0]
+    repeat = RepeatFilter(60.0, clock=lambda: now[0])
+
+    assert repeat.filter(make_record("fetch failed: %s", logging.WARNING, "timeout"))
+    for _ in range(3):
+        assert not repeat.filter(
+            make_record("fetch failed: %s", logging.WARNING, "timeout")
+        )
+    assert repeat.filter(make_record("fetch failed: %s", logging.WARNING, "other"))
+    assert repeat.filter(make_record("info line"))
+
+    now[0] = 61.0
+    record = make_record("fetch failed: %s", logging.WARNING, "timeout")
+    assert repeat.filter(record)
+    assert record.getMessage().endswith("(同じ内容を 3 件抑制しました)")
+
+
+def test_ring_buffer_dumps_recent_records_on_error():
+    received = []
+
+    class Collect(logging.Handler):
+        def emit(self, record):
+            received.append(record.getMessage())
+
+    ring = RingBufferHandler(2, target=Collect())
+    for i in range(5):
+        ring.handle(make_record(f"sample {i}"))
+    assert received == []
+
+    ring.handle(make_record("boom", logging.ERROR))
+
+    assert received == ["sample 4", "boom"]
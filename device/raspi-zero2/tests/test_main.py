@@ -1,4 +1,8 @@
+from types import SimpleNamespace
+
 import homeiot_device_raspi.main as main
+from homeiot_device_raspi.latency import LatencyReporter
+from homeiot_device_raspi.scheduler import DueProperties
 
 
 class DummyClient:
@@ -89,3 +93,73 @@ def test_build_mqtt_client_tls(monkeypatch):
     assert isinstance(client, DummyClient)
     assert client.connect_args == ("localhost", 8883)
     assert client.tls_kwargs == {"ca_certs": "/tmp/ca.crt"}
+
+
+def test_build_payload_includes_trace_fields(monkeypatch):
+    monkeypatch.setattr(main.time, "time", lambda: 1_700_000_010.25)
+
+    payload = main.build_payload(
+        power=512, energy_import=None, measured_at=1_700_000_010.0, seq=7
+    )
+
+    assert payload == {
+        "meter": "home",
+        "power_w": 512.0,
+        "energy_import_kwh": None,
+        "measured_at": "2023-11-14T22:13:30.000Z",
+        "published_at": "2023-11-14T22:13:30.250Z",
+        "seq": 7,
+    }
+
+
+def test_run_session_keeps_energy_until_publish_succeeds():
+    both = frozenset({main.ENERGY_PROPERTY, main.POWER_PROPERTY})
+    power_only = frozenset({main.POWER_PROPERTY})
+    dues = iter(
+        DueProperties(names=names, scheduled_at=1_700_000_000.0 + i, lateness=0.0)
+        for i, names in enumerate([both, power_only, power_only, power_only])
+    )
+    scheduler = SimpleNamespace(wait_for_due=lambda: next(dues))
+
+    class Meter:
+        def __init__(self):
+            self.powers = iter([500, 510, 520])
+
+        def get_measured_cumulative_energy(self, reverse):
+            return 123.4
+
+        def get_instantaneous_power(self):
+            try:
+                return next(self.powers)
+            except StopIteration:
+                raise main.momonga.MomongaNeedToReopen("reopen") from None
+
+    class Client:
+        def __init__(self):
+            self.results = iter(
+                [main.mqtt.MQTT_ERR_NO_CONN, main.mqtt.MQTT_ERR_SUCCESS]
+            )
+            self.payloads = []
+
+        def publish(self, topic, payload, qos):
+            self.payloads.append(main.json.loads(payload))
+            return SimpleNamespace(rc=next(self.results, main.mqtt.MQTT_ERR_SUCCESS))
+
+    client = Client()
+    state = main.PublishState()
+    connector = SimpleNamespace(started_at=0.0, mode="scan", attempts=1)
+
+    main.run_session(
+        Meter(),
+        scheduler=scheduler,
+        latency=LatencyReporter(3600),
+        state=state,
+        mqtt_client=client,
+        heartbeat=None,
+        connector=connector,
+    )
+
+    # 1 回目の送信に失敗した積算電力量は 2 回目に載せ、成功したら消す
+    assert [p["energy_import_kwh"] for p in client.payloads] == [123.4, 123.4, None]
+    assert [p["seq"] for p in client.payloads] == [1, 2, 3]
+    assert state.energy_import is None
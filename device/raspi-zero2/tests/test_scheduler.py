@@ -0,0 +1,86 @@
+from homeiot_device_raspi.scheduler import SamplingScheduler
+
+
+class FakeClock:
+    def __init__(self, start=1000.0, wall_start=1_700_000_003.0):
+        self.now = start
+        self.wall_offset = wall_start - start
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def wall(self):
+        return self.now + self.wall_offset
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def build_scheduler(clock):
+    return SamplingScheduler(
+        clock=clock.monotonic, wall_clock=clock.wall, sleep=clock.sleep
+    )
+
+
+def test_aligns_to_wall_clock_boundary():
+    clock = FakeClock()
+    scheduler = build_scheduler(clock)
+    scheduler.add_property("power", 10.0)
+
+    due = scheduler.wait_for_due()
+
+    assert due.names == frozenset({"power"})
+    assert due.scheduled_at == 1_700_000_010.0
+    assert clock.sleeps == [7.0]
+
+
+def test_work_time_does_not_accumulate_drift():
+    clock = FakeClock()
+    scheduler = build_scheduler(clock)
+    scheduler.add_property("power", 10.0)
+
+    timestamps = []
+    for _ in range(3):
+        due = scheduler.wait_for_due()
+        timestamps.append(due.scheduled_at)
+        clock.now += 2.5  # 取得と送信にかかる時間
+
+    assert timestamps == [1_700_000_010.0, 1_700_000_020.0, 1_700_000_030.0]
+    assert clock.sleeps == [7.0, 7.5, 7.5]
+
+
+def test_energy_offset_coincides_with_power():
+    clock = FakeClock(wall_start=1_700_001_000.0)
+    scheduler = build_scheduler(clock)
+    scheduler.add_property("power", 10.0)
+    scheduler.add_property("energy", 1800.0, offset=60.0)
+
+    energy_ticks = []
+    for _ in range(150):
+        due = scheduler.wait_for_due()
+        assert "power" in due.names
+        if "energy" in due.names:
+            energy_ticks.append(due.scheduled_at)
+
+    assert energy_ticks == [1_700_001_060.0]
+    assert energy_ticks[0] % 1800 == 60
+
+
+def test_reports_missed_deadlines():
+    clock = FakeClock()
+    scheduler = build_scheduler(clock)
+    scheduler.add_property("power", 10.0)
+    scheduler.wait_for_due()
+
+    clock.now += 35.0  # 長時間ブロックされた
+    due = scheduler.wait_for_due()
+
+    assert due.missed_deadlines == {"power": 2}
+    assert scheduler.properties["power"].missed_deadlines == 2
+    assert due.scheduled_at == 1_700_000_040.0
+    assert due.lateness == 5.0
+
+    due = scheduler.wait_for_due()
+    assert due.scheduled_at == 1_700_000_050.0
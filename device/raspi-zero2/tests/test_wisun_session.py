@@ -0,0 +1,109 @@
+from types import SimpleNamespace
+
+from homeiot_device_raspi.wisun_session import (
+    PanInfo,
+    WisunConnector,
+    load_pan_cache,
+    save_pan_cache,
+)
+
+METER = PanInfo(channel=0x21, pan_id=bytes.fromhex("8a5e"), mac_addr=bytes(range(8)))
+
+
+class FakeSkw:
+    def __init__(self, meter, scans):
+        self.meter = meter
+        self.scans = scans
+
+    def skscan(self, retry=3):
+        self.scans.append(retry)
+        if self.meter is None:
+            raise RuntimeError("PAN が見つからない")
+        return SimpleNamespace(
+            channel=self.meter.channel,
+            pan_id=self.meter.pan_id,
+            mac_addr=self.meter.mac_addr,
+            lqi=0x50,
+        )
+
+
+class FakeMomonga:
+    """skscan の結果で SKJOIN する momonga の open() を真似る。"""
+
+    def __init__(self, meter, scans):
+        self.meter = meter
+        self.session_manager = SimpleNamespace(skw=FakeSkw(meter, scans))
+        self.closed = False
+
+    def open(self):
+        found = self.session_manager.skw.skscan(retry=3)
+        joined = PanInfo(found.channel, found.pan_id, found.mac_addr)
+        if joined != self.meter:
+            raise RuntimeError("SKJOIN に失敗")
+        return self
+
+    def close(self):
+        self.closed = True
+
+
+def make_connector(tmp_path, meters, scans, sleeps):
+    return WisunConnector(
+        lambda: FakeMomonga(meters.pop(0), scans),
+        str(tmp_path / "state" / "wisun_pan.json"),
+        min_delay=1.0,
+        max_delay=3.0,
+        sleep=sleeps.append,
+    )
+
+
+def test_pan_cache_roundtrip(tmp_path):
+    path = str(tmp_path / "wisun_pan.json")
+
+    assert load_pan_cache(path) is None
+    save_pan_cache(path, METER)
+
+    assert load_pan_cache(path) == METER
+
+
+def test_load_pan_cache_ignores_broken_file(tmp_path):
+    path = tmp_path / "wisun_pan.json"
+    path.write_text("{", encoding="utf-8")
+
+    assert load_pan_cache(str(path)) is None
+
+
+def test_connect_scans_then_reuses_cache(tmp_path):
+    scans, sleeps = [], []
+    connector = make_connector(tmp_path, [METER, METER], scans, sleeps)
+
+    connector.connect()
+    assert connector.mode == "scan"
+    assert len(scans) == 1
+
+    connector.connect()
+    assert connector.mode == "cached"
+    assert len(scans) == 1
+    assert sleeps == []
+
+
+def test_connect_falls_back_to_scan_when_cache_is_stale(tmp_path):
+    moved = PanInfo(channel=0x3B, pan_id=METER.pan_id, mac_addr=METER.mac_addr)
+    scans, sleeps = [], []
+    connector = make_connector(tmp_path, [moved, moved], scans, sleeps)
+    save_pan_cache(connector._cache_path, METER)
+
+    connector.connect()
+
+    assert connector.mode == "scan"
+    assert len(scans) == 1
+    assert load_pan_cache(connector._cache_path) == moved
+
+
+def test_connect_backs_off_until_success(tmp_path):
+    scans, sleeps = [], []
+    connector = make_connector(tmp_path, [None, None, None, METER], scans, sleeps)
+
+    connector.connect()
+
+    assert connector.attempts == 4
+    assert sleeps == [1.0, 2.0, 3.0]
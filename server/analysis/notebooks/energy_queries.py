@@ -0,0 +1,180 @@
+"""分析ノートブック向けの、結果キャッシュ付きクエリ集。
+
+marimo はノートブックのディレクトリを sys.path に入れるので
+`from energy_queries import EnergyQueries` で読み込める。
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+from collections import OrderedDict
+from datetime import date
+from pathlib import Path
+from typing import Any
+
+import duckdb
+import pyarrow as pa
+
+DAILY_TOTALS_SQL = """
+SELECT
+  CAST(ts_jst AS DATE) AS day,
+  source,
+  COUNT(*) AS samples,
+  AVG(instant_power_w) AS avg_power_w,
+  MAX(instant_power_w) AS max_power_w,
+  AVG(instant_power_w) * 24 / 1000 AS estimated_kwh,
+  MAX(energy_import_kwh) - MIN(energy_import_kwh) AS energy_import_kwh
+FROM raw_meter_readings
+WHERE {date_filter}
+GROUP BY ALL
+ORDER BY day, source
+"""
+
+LOAD_PROFILE_SQL = """
+SELECT
+  (EXTRACT(hour FROM ts_jst) * 60 + EXTRACT(minute FROM ts_jst)) // ? * ?
+    AS minute_of_day,
+  source,
+  COUNT(*) AS samples,
+  AVG(instant_power_w) AS avg_power_w,
+  quantile_cont(instant_power_w, 0.5) AS p50_power_w,
+  quantile_cont(instant_power_w, 0.95) AS p95_power_w
+FROM raw_meter_readings
+WHERE {date_filter}
+GROUP BY ALL
+ORDER BY minute_of_day, source
+"""
+
+PEAK_HOURS_SQL = """
+SELECT
+  date_trunc('hour', ts_jst) AS hour,
+  source,
+  AVG(instant_power_w) AS avg_power_w,
+  MAX(instant_power_w) AS max_power_w
+FROM raw_meter_readings
+WHERE {date_filter}
+GROUP BY ALL
+ORDER BY avg_power_w DESC
+LIMIT ?
+"""
+
+# ネイティブテーブルは ts_jst で絞り、Parquet ビューは dt でパーティションを刈り込む
+NATIVE_DATE_FILTER = "ts_jst >= ? AND ts_jst < ? + INTERVAL 1 DAY"
+PARQUET_DATE_FILTER = "dt BETWEEN ? AND ?"
+
+
+class EnergyQueries:
+    """よく使う集計を Arrow で返し、結果をパラメータ単位でキャッシュする。
+
+    キャッシュキーにはアーカイブファイルの inode・サイズ・更新時刻を含める。
+    run_archive は DuckDB ファイルを os.replace で入れ替えるので、夜間バッチの
+    後は自動的に読み直しになる。接続もそのときに張り直す。
+
+    `parquet_dir` を渡すと、`duckdb_path` はビュー専用ファイル
+    (home_energy_views.duckdb) とみなし、日付条件を dt に対して掛ける。
+    キャッシュキーには Parquet データセットのディレクトリ状態も含める。
+    """
+
+    def __init__(
+        self,
+        duckdb_path: str,
+        *,
+        parquet_dir: str | None = None,
+        cache_size: int = 64,
+    ) -> None:
+        self.duckdb_path = duckdb_path
+        self.parquet_dir = parquet_dir
+        self.date_filter = PARQUET_DATE_FILTER if parquet_dir else NATIVE_DATE_FILTER
+        self.cache_size = cache_size
+        self._cache: OrderedDict[tuple[Any, ...], pa.Table] = OrderedDict()
+        self._lock = threading.Lock()
+        self._connection: duckdb.DuckDBPyConnection | None = None
+        self._connection_state: tuple[int, ...] | None = None
+        self.hits = 0
+        self.misses = 0
+
+    def archive_state(self) -> tuple[int, ...]:
+        state: list[int] = []
+        paths = [self.duckdb_path, f"{self.duckdb_path}.wal"]
+        if self.parquet_dir:
+            # パーティションの追加・入れ替えや月次統合でディレクトリの更新時刻が変わる
+            paths.append(os.path.join(self.parquet_dir, "raw_meter_readings"))
+            paths.extend(
+                str(path)
+                for path in sorted(
+                    Path(self.parquet_dir).glob("raw_meter_readings_monthly/month=*")
+                )
+            )
+        for path in paths:
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                state.extend((0, 0, 0))
+                continue
+            state.extend((stat.st_ino, stat.st_size, stat.st_mtime_ns))
+        return tuple(state)
+
+    def _connect(self, state: tuple[int, ...]) -> duckdb.DuckDBPyConnection:
+        if self._connection is not None and self._connection_state == state:
+            return self._connection
+        if self._connection is not None:
+            self._connection.close()
+        self._connection = duckdb.connect(self.duckdb_path, read_only=True)
+        self._connection_state = state
+        return self._connection
+
+    def query(self, name: str, sql: str, params: list[Any]) -> pa.Table:
+        """任意の SQL をキャッシュ付きで実行する。"""
+
+        with self._lock:
+            state = self.archive_state()
+            key = (name, tuple(params), state)
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return cached
+            self.misses += 1
+            if self._connection_state != state:
+                # 古いアーカイブに対する結果はもう使われない
+                self._cache.clear()
+            table = self._connect(state).execute(sql, params).arrow()
+            self._cache[key] = table
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+            return table
+
+    def daily_totals(self, start: date, end: date) -> pa.Table:
+        """日ごとの平均・最大電力と買電量（end を含む）。"""
+
+        sql = DAILY_TOTALS_SQL.format(date_filter=self.date_filter)
+        return self.query("daily_totals", sql, [start, end])
+
+    def load_profile(
+        self, start: date, end: date, *, bucket_minutes: int = 30
+    ) -> pa.Table:
+        """期間中の時刻帯ごとの電力分布。"""
+
+        sql = LOAD_PROFILE_SQL.format(date_filter=self.date_filter)
+        return self.query(
+            "load_profile", sql, [bucket_minutes, bucket_minutes, start, end]
+        )
+
+    def peak_hours(self, start: date, end: date, *, limit: int = 10) -> pa.Table:
+        """平均電力が大きい 1 時間枠の上位。"""
+
+        sql = PEAK_HOURS_SQL.format(date_filter=self.date_filter)
+        return self.query("peak_hours", sql, [start, end, limit])
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+
+    def close(self) -> None:
+        with self._lock:
+            self._cache.clear()
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+                self._connection_state = None
@@ -27,5 +27,55 @@ def _():
     return con, duckdb, duckdb_path, mo, os, pd
 
 
+@app.cell
+def _(duckdb_path, os):
+    # 集計はキャッシュ付きのクエリ層経由で実行する（夜間バッチ後に自動で読み直す）
+    from datetime import date, timedelta
+
+    from energy_queries import EnergyQueries
+
+    # PARQUET_VIEWS_PATH があれば DuckDB ファイルではなく Parquet を直接読む
+    views_path = os.getenv("PARQUET_VIEWS_PATH")
+    if views_path and os.path.exists(views_path):
+        queries = EnergyQueries(
+            views_path,
+            parquet_dir=os.getenv("PARQUET_BASE_DIR", "/data/parquet"),
+        )
+    else:
+        queries = EnergyQueries(duckdb_path)
+    review_end = date.today() - timedelta(days=1)
+    review_start = review_end - timedelta(days=29)
+    return (
+        EnergyQueries,
+        date,
+        queries,
+        review_end,
+        review_start,
+        timedelta,
+        views_path,
+    )
+
+
+@app.cell
+def _(queries, review_end, review_start):
+    daily_totals = queries.daily_totals(review_start, review_end)
+    daily_totals
+    return (daily_totals,)
+
+
+@app.cell
+def _(queries, review_end, review_start):
+    load_profile = queries.load_profile(review_start, review_end, bucket_minutes=30)
+    load_profile
+    return (load_profile,)
+
+
+@app.cell
+def _(queries, review_end, review_start):
+    peak_hours = queries.peak_hours(review_start, review_end, limit=10)
+    peak_hours
+    return (peak_hours,)
+
+
 if __name__ == "__main__":
     app.run()
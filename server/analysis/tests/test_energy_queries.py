@@ -0,0 +1,110 @@
+import os
+from datetime import date
+
+import duckdb
+import pytest
+from energy_queries import EnergyQueries
+from homeiot_batch.parquet_views import register_parquet_views
+from homeiot_batch.parquet_writer import ensure_anchor_files
+
+DAY = date(2026, 9, 29)
+
+READINGS_SQL = """
+SELECT
+  CAST($day AS TIMESTAMP) + i * INTERVAL 1 HOUR - INTERVAL 9 HOUR AS ts_utc,
+  CAST($day AS TIMESTAMP) + i * INTERVAL 1 HOUR AS ts_jst,
+  'meter1' AS source,
+  CAST($power AS DOUBLE) AS instant_power_w,
+  CAST(i AS DOUBLE) AS energy_import_kwh,
+  CAST(NULL AS DOUBLE) AS energy_export_kwh,
+  CAST($day AS TIMESTAMP) AS ingested_at
+FROM range(24) t(i)
+"""
+
+
+def write_native(path, power):
+    tmp_path = path.with_name(path.name + ".tmp")
+    with duckdb.connect(tmp_path.as_posix()) as connection:
+        connection.execute(
+            f"CREATE TABLE raw_meter_readings AS {READINGS_SQL}",
+            {"day": DAY, "power": power},
+        )
+    os.replace(tmp_path, path)
+
+
+def write_partition(parquet_dir, day, power):
+    partition_dir = parquet_dir / "raw_meter_readings" / f"dt={day}"
+    tmp_dir = partition_dir.with_name(partition_dir.name + "__tmp__")
+    (tmp_dir / "source=meter1").mkdir(parents=True)
+    with duckdb.connect() as connection:
+        connection.execute("SET TimeZone = 'UTC'")
+        connection.execute(
+            f"""
+            COPY (
+              SELECT timezone('UTC', ts_utc) AS ts_utc,
+                     timezone('Asia/Tokyo', ts_jst) AS ts_jst,
+                     * EXCLUDE (ts_utc, ts_jst, ingested_at),
+                     timezone('UTC', ingested_at) AS ingested_at
+              FROM ({READINGS_SQL})
+            ) TO '{tmp_dir / "source=meter1" / "part-0000.parquet"}' (FORMAT PARQUET)
+            """,
+            {"day": day, "power": power},
+        )
+    tmp_dir.rename(partition_dir)
+    ensure_anchor_files(parquet_dir.as_posix(), "Asia/Tokyo")
+
+
+def avg_power(table):
+    return table.column("avg_power_w").to_pylist()
+
+
+@pytest.fixture
+def native_path(tmp_path):
+    path = tmp_path / "home_energy.duckdb"
+    write_native(path, 100.0)
+    return path
+
+
+def test_results_are_cached_per_parameters(native_path):
+    queries = EnergyQueries(native_path.as_posix(), cache_size=2)
+
+    first = queries.daily_totals(DAY, DAY)
+    assert queries.daily_totals(DAY, DAY) is first
+    queries.peak_hours(DAY, DAY, limit=1)
+    queries.load_profile(DAY, DAY)
+
+    assert (queries.hits, queries.misses) == (1, 3)
+    assert avg_power(first) == [100.0]
+    # 上限を超えた古い結果から捨てる
+    queries.daily_totals(DAY, DAY)
+    assert (queries.hits, queries.misses) == (1, 4)
+    queries.close()
+
+
+def test_replacing_the_archive_drops_the_cache_and_reconnects(native_path):
+    queries = EnergyQueries(native_path.as_posix())
+    assert avg_power(queries.daily_totals(DAY, DAY)) == [100.0]
+
+    write_native(native_path, 250.0)
+
+    assert avg_power(queries.daily_totals(DAY, DAY)) == [250.0]
+    assert (queries.hits, queries.misses) == (0, 2)
+    assert len(queries._cache) == 1
+    queries.close()
+
+
+def test_parquet_views_are_reread_after_a_partition_is_added(tmp_path):
+    parquet_dir = tmp_path / "parquet"
+    write_partition(parquet_dir, DAY, 100.0)
+    views_path = tmp_path / "views.duckdb"
+    with duckdb.connect(views_path.as_posix()) as connection:
+        register_parquet_views(connection, parquet_dir.as_posix(), "Asia/Tokyo")
+    queries = EnergyQueries(views_path.as_posix(), parquet_dir=parquet_dir.as_posix())
+    next_day = date(2026, 9, 30)
+
+    assert avg_power(queries.daily_totals(DAY, next_day)) == [100.0]
+    write_partition(parquet_dir, next_day, 300.0)
+
+    assert avg_power(queries.daily_totals(DAY, next_day)) == [100.0, 300.0]
+    assert queries.misses == 2
+    queries.close()
@@ -0,0 +1,94 @@
+"""既存の DuckDB アーカイブを、今の書き方に合わせて一度だけ書き直す。
+
+適用したものは `archive_migrations` に名前と時刻を残し、次からは飛ばす。
+`duckdb_writer` が投入の前に毎回呼ぶ（新しい DB では空の表に対して走るだけ）。
+
+- `utc_timestamps`: 以前のバッチは Parquet の TIMESTAMPTZ を暗黙のキャストで
+  入れていたため、`ts_utc`・`ingested_at` がセッションのタイムゾーンの壁時計で
+  入っている。バッチのコンテナは `TZ`（既定 Asia/Tokyo）で動くので、そうした行は
+  `ts_utc = ts_jst` になっている。その行だけ `ts_jst` から UTC を求め直し、
+  日次集計の first/last_ts_utc も取り直す。`TZ` と違うタイムゾーンで
+  動かしていたアーカイブには使えない（`ts_jst` 自体がずれている）
+"""
+
+from __future__ import annotations
+
+import logging
+from datetime import datetime, timezone
+from typing import Callable
+
+import duckdb
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_DDL = """
+CREATE TABLE IF NOT EXISTS archive_migrations (
+  name VARCHAR,
+  applied_at TIMESTAMP
+);
+"""
+
+UTC_MIGRATION = "utc_timestamps"
+UTC_MIGRATION_SQL = """
+UPDATE raw_meter_readings
+SET ts_utc = timezone('UTC', timezone($tz, ts_jst)),
+    ingested_at = timezone('UTC', timezone($tz, ingested_at))
+WHERE ts_utc = ts_jst
+"""
+# 日次集計の first/last_ts_utc は直した行から取り直す
+UTC_ROLLUP_MIGRATION_SQL = """
+UPDATE daily_source_rollups AS r
+SET first_ts_utc = a.first_ts_utc, last_ts_utc = a.last_ts_utc
+FROM (
+  SELECT CAST(ts_jst AS DATE) AS dt, source,
+         MIN(ts_utc) AS first_ts_utc, MAX(ts_utc) AS last_ts_utc
+  FROM raw_meter_readings
+  GROUP BY ALL
+) AS a
+WHERE r.dt = a.dt AND r.source = a.source
+"""
+
+
+def _migrate_utc_timestamps(connection: duckdb.DuckDBPyConnection, tz: str) -> int:
+    rows = connection.execute(
+        "SELECT COUNT(*) FROM raw_meter_readings WHERE ts_utc = ts_jst"
+    ).fetchone()[0]
+    if rows:
+        connection.execute(UTC_MIGRATION_SQL, {"tz": tz})
+        connection.execute(UTC_ROLLUP_MIGRATION_SQL)
+    return rows
+
+
+MIGRATIONS: tuple[tuple[str, Callable[[duckdb.DuckDBPyConnection, str], int]], ...] = (
+    (UTC_MIGRATION, _migrate_utc_timestamps),
+)
+
+
+def apply_migrations(connection: duckdb.DuckDBPyConnection, tz: str) -> list[str]:
+    """未適用の書き直しを順に 1 トランザクションずつ行い、適用した名前を返す。
+
+    raw_meter_readings と daily_source_rollups は作成済みであること。
+    """
+    connection.execute(MIGRATIONS_DDL)
+    applied = {
+        row[0]
+        for row in connection.execute("SELECT name FROM archive_migrations").fetchall()
+    }
+    names = []
+    for name, migrate in MIGRATIONS:
+        if name in applied:
+            continue
+        connection.execute("BEGIN TRANSACTION")
+        try:
+            rows = migrate(connection, tz)
+            connection.execute(
+                "INSERT INTO archive_migrations VALUES (?, ?)",
+                [name, datetime.now(timezone.utc).replace(tzinfo=None)],
+            )
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        logger.info("アーカイブを書き直しました: %s (%d 行)", name, rows)
+        names.append(name)
+    return names
@@ -0,0 +1,235 @@
+"""DuckDB へ書き込んだ結果の検証（対象日だけの軽い検証と、DB 全体の検証）。
+
+毎晩の実行では対象日の行だけを Parquet パーティションと突き合わせる
+（件数・ts_utc の最小/最大・全列のハッシュ合計）。Parquet を書いたときの
+Arrow 表が手元にあればそれと比べ、ファイルはフッターの行数だけ確かめる。
+コストは DB の大きさではなく 1 日分の行数に比例する。DB 全体の検証は
+`FULL_VERIFY_INTERVAL_DAYS` ごとに行い、前回の実施時刻と所要時間は
+`archive_verifications` に残す。
+"""
+
+from __future__ import annotations
+
+import glob
+import logging
+import time
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone
+
+import duckdb
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from .parquet_writer import native_columns
+
+logger = logging.getLogger(__name__)
+
+VERIFICATIONS_DDL = """
+CREATE TABLE IF NOT EXISTS archive_verifications (
+  verified_at TIMESTAMP,
+  tier VARCHAR,
+  target_date DATE,
+  seconds DOUBLE,
+  rows BIGINT
+);
+"""
+
+_FINGERPRINT_COLUMNS = """
+  COUNT(*),
+  MIN(ts_utc),
+  MAX(ts_utc),
+  SUM(hash(
+    ts_utc, ts_jst, source,
+    instant_power_w, energy_import_kwh, energy_export_kwh, ingested_at
+  ))
+"""
+# Parquet・Arrow 側は TIMESTAMPTZ なので、INSERT 時と同じ変換をかけてから比べる
+_NATIVE_FINGERPRINT = """
+SELECT {fingerprint} FROM (SELECT {columns} FROM {source})
+"""
+
+FINGERPRINT_LABELS = ("rows", "min_ts_utc", "max_ts_utc", "checksum")
+
+
+@dataclass
+class VerificationResult:
+    tier: str
+    seconds: float
+    rows: int
+
+
+def _record(
+    connection: duckdb.DuckDBPyConnection,
+    result: VerificationResult,
+    target_date: date | None,
+) -> None:
+    connection.execute(
+        "INSERT INTO archive_verifications VALUES (?, ?, ?, ?, ?)",
+        [
+            datetime.now(timezone.utc).replace(tzinfo=None),
+            result.tier,
+            target_date,
+            result.seconds,
+            result.rows,
+        ],
+    )
+
+
+def _parquet_rows(parquet_globs: list[str]) -> int:
+    # フッターの行数だけを読む（データページは展開しない）
+    return sum(
+        pq.read_metadata(path).num_rows
+        for pattern in parquet_globs
+        for path in sorted(glob.glob(pattern))
+    )
+
+
+def _native_fingerprint_sql(source: str, tz: str) -> str:
+    return _NATIVE_FINGERPRINT.format(
+        fingerprint=_FINGERPRINT_COLUMNS, columns=native_columns(tz), source=source
+    )
+
+
+def _arrow_fingerprint(
+    connection: duckdb.DuckDBPyConnection, tables: list[pa.Table], tz: str
+) -> tuple:
+    cursor = connection.cursor()
+    try:
+        cursor.register("expected_rows", pa.concat_tables(tables))
+        return cursor.execute(_native_fingerprint_sql("expected_rows", tz)).fetchone()
+    finally:
+        cursor.close()
+
+
+def verify_target_date(
+    connection: duckdb.DuckDBPyConnection,
+    target_date: date,
+    parquet_globs: list[str],
+    tables: list[pa.Table] | None = None,
+    *,
+    tz: str,
+) -> VerificationResult:
+    """対象日の行を Parquet パーティションと突き合わせる。
+
+    `tables`（Parquet に書いたのと同じ Arrow 表）があれば、ファイルはフッターの
+    行数だけ確かめ、指紋は Arrow 表から取る。
+    """
+    started = time.perf_counter()
+    archived = connection.execute(
+        f"SELECT {_FINGERPRINT_COLUMNS} FROM raw_meter_readings "
+        "WHERE CAST(ts_jst AS DATE) = ?",
+        [target_date],
+    ).fetchone()
+    if tables:
+        expected = _arrow_fingerprint(connection, tables, tz)
+        file_rows = _parquet_rows(parquet_globs)
+        if file_rows != expected[0]:
+            raise RuntimeError(
+                f"対象日 {target_date} の Parquet の行数が一致しません: "
+                f"files={file_rows} arrow={expected[0]}"
+            )
+    elif parquet_globs:
+        expected = connection.execute(
+            _native_fingerprint_sql("read_parquet(?, hive_partitioning = false)", tz),
+            [parquet_globs],
+        ).fetchone()
+    else:
+        expected = (0, None, None, None)
+    if archived != expected:
+        details = ", ".join(
+            f"{label}: duckdb={got} parquet={want}"
+            for label, got, want in zip(FINGERPRINT_LABELS, archived, expected)
+            if got != want
+        )
+        raise RuntimeError(f"対象日 {target_date} の検証に失敗しました: {details}")
+    return VerificationResult(
+        tier="day", seconds=time.perf_counter() - started, rows=archived[0]
+    )
+
+
+def _integrity_check(connection: duckdb.DuckDBPyConnection) -> None:
+    try:
+        rows = connection.execute("PRAGMA integrity_check").fetchall()
+    except duckdb.CatalogException:
+        connection.execute("PRAGMA force_checkpoint")
+        logger.warning(
+            "DuckDB integrity_check is not supported; force_checkpoint only."
+        )
+        return
+    if not rows:
+        raise RuntimeError("DuckDB integrity_check returned no rows")
+    if len(rows) == 1 and rows[0][0] == "ok":
+        return
+    details = ", ".join(str(row[0]) for row in rows)
+    raise RuntimeError(f"DuckDB integrity_check failed: {details}")
+
+
+def verify_full(connection: duckdb.DuckDBPyConnection) -> VerificationResult:
+    """DB 全体の検証。全ブロックを読み、日次集計の件数とも突き合わせる。"""
+    started = time.perf_counter()
+    _integrity_check(connection)
+    # 全列を読むので、壊れたブロックがあればチェックサム検証で例外になる
+    total_rows = connection.execute(
+        f"SELECT {_FINGERPRINT_COLUMNS} FROM raw_meter_readings"
+    ).fetchone()[0]
+    mismatches = connection.execute(
+        """
+        SELECT r.dt, r.source, r.samples, coalesce(a.samples, 0)
+        FROM daily_source_rollups AS r
+        LEFT JOIN (
+          SELECT CAST(ts_jst AS DATE) AS dt, source, COUNT(*) AS samples
+          FROM raw_meter_readings
+          GROUP BY ALL
+        ) AS a USING (dt, source)
+        WHERE r.samples <> coalesce(a.samples, 0)
+        ORDER BY r.dt, r.source
+        """
+    ).fetchall()
+    if mismatches:
+        details = ", ".join(
+            f"{dt}/{source}: rollup={expected} rows={actual}"
+            for dt, source, expected, actual in mismatches[:10]
+        )
+        raise RuntimeError(f"日次集計と行数が一致しません: {details}")
+    return VerificationResult(
+        tier="full", seconds=time.perf_counter() - started, rows=total_rows
+    )
+
+
+def full_check_due(connection: duckdb.DuckDBPyConnection, interval_days: int) -> bool:
+    """前回の全体検証から `interval_days` 日以上経っていれば True（0 なら毎回）。"""
+    if interval_days <= 0:
+        return True
+    last = connection.execute(
+        "SELECT MAX(verified_at) FROM archive_verifications WHERE tier = 'full'"
+    ).fetchone()[0]
+    if last is None:
+        return True
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    # 毎日同じ時刻に動くので、数分の揺れで 1 日ずれないよう少し余裕を持たせる
+    return now - last >= timedelta(days=interval_days) - timedelta(hours=1)
+
+
+def verify_archive(
+    connection: duckdb.DuckDBPyConnection,
+    parquet_globs: dict[date, list[str]],
+    *,
+    tz: str,
+    full_interval_days: int,
+    tables: dict[date, list[pa.Table]] | None = None,
+) -> list[VerificationResult]:
+    """書き込んだ日ごとに検証し、予定日なら DB 全体の検証も行って記録する。"""
+    connection.execute(VERIFICATIONS_DDL)
+    tables = tables or {}
+    checked = [
+        (day, verify_target_date(connection, day, globs, tables.get(day), tz=tz))
+        for day, globs in sorted(parquet_globs.items())
+    ]
+    if full_check_due(connection, full_interval_days):
+        checked.append((max(parquet_globs, default=None), verify_full(connection)))
+    for day, result in checked:
+        _record(connection, result, day)
+        logger.info(
+            "DuckDB検証 (%s): %d 行 / %.3f 秒", result.tier, result.rows, result.seconds
+        )
+    return [result for _, result in checked]
@@ -0,0 +1,210 @@
+"""メーター数を増やしたときのアーカイブ各段の時間を測るベンチマーク。
+
+InfluxDB の代わりに合成ポイント（10秒間隔・1日分）を source ごとに作り、
+1) transform_points
+2) write_parquet_partition（source 別パーティション）
+3) write_archive_days（source ごとの DuckDB 投入・日次集計・対象日の検証）
+を ARCHIVE_WORKERS と DuckDB への渡し方（Parquet を読み直す / 書いたのと同じ
+Arrow 表を渡す）を変えながら実行して、かかった時間とピーク RSS を表示する。
+"""
+
+from __future__ import annotations
+
+import argparse
+import dataclasses
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any
+
+from .config import Config
+from .duckdb_writer import write_archive_days
+from .influx_reader import calculate_target_window
+from .parquet_writer import write_parquet_partition
+from .run_metrics import peak_rss_bytes
+from .transform import transform_points
+
+SAMPLE_INTERVAL_SECONDS = 10
+
+
+def _generate_points(
+    start_utc: datetime, meters: int, samples: int
+) -> dict[str, list[dict[str, Any]]]:
+    grouped = {}
+    for meter in range(meters):
+        source = f"meter{meter:03d}"
+        grouped[source] = [
+            {
+                "time": (
+                    start_utc + timedelta(seconds=i * SAMPLE_INTERVAL_SECONDS)
+                ).strftime("%Y-%m-%dT%H:%M:%SZ"),
+                "power_w": 200.0 + (i * 37 + meter * 11) % 900,
+                "energy_import_kwh": i / 1000 if i % 180 == 0 else None,
+                "source": source,
+            }
+            for i in range(samples)
+        ]
+    return grouped
+
+
+def _timed(func, *args, **kwargs) -> tuple[Any, float]:
+    started = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - started
+
+
+def _transform_all(
+    config: Config, points_by_source: dict[str, list[dict[str, Any]]]
+) -> list[dict[str, Any]]:
+    ingested_at = datetime.now(timezone.utc)
+    return [
+        row
+        for points in points_by_source.values()
+        for row in transform_points(
+            points,
+            source_default=config.source_default,
+            tzinfo=config.tzinfo,
+            ingested_at=ingested_at,
+        )
+    ]
+
+
+def _run_once(
+    run_dir: Path, *, meters: int, samples: int, workers: int, handoff: str
+) -> dict[str, float]:
+    """1 条件分を実行する。ピーク RSS を分けて測るため子プロセスで呼ぶ。"""
+    base = Config.load()
+    target_date = date(2025, 1, 1)
+    _, start_utc, _ = calculate_target_window(base, target_date=target_date)
+    points_by_source = _generate_points(start_utc, meters, samples)
+    config = dataclasses.replace(
+        base,
+        parquet_base_dir=(run_dir / "parquet").as_posix(),
+        duckdb_path=(run_dir / "home_energy.duckdb").as_posix(),
+        archive_workers=workers,
+    )
+    rows, transform_seconds = _timed(_transform_all, config, points_by_source)
+    del points_by_source
+    partition, parquet_seconds = _timed(
+        write_parquet_partition, config, target_date, rows
+    )
+    del rows
+    tables = {target_date: partition.tables} if handoff == "arrow" else None
+    result, duckdb_seconds = _timed(
+        write_archive_days,
+        config,
+        {target_date: partition.path},
+        tables=tables,
+    )
+    return {
+        "rows": result.inserted_rows,
+        "transform": transform_seconds,
+        "parquet": parquet_seconds,
+        "duckdb": duckdb_seconds,
+        "verify": sum(
+            check.seconds for check in result.verifications if check.tier == "day"
+        ),
+        "peak_rss": peak_rss_bytes(),
+    }
+
+
+def run_benchmark(
+    workdir: Path,
+    *,
+    meters: int,
+    samples: int,
+    workers: list[int],
+    handoffs: list[str],
+) -> list[str]:
+    total = meters * samples
+    lines = [
+        f"meters={meters} rows={total}",
+        f"{'workers':>8}{'handoff':>9}{'transform [s]':>15}{'parquet [s]':>13}"
+        f"{'duckdb [s]':>12}{'(verify)':>10}{'peak RSS [MiB]':>16}{'rows/s':>10}",
+    ]
+    # 条件ごとに新しいプロセスで動かし、ピーク RSS が前の条件に引きずられないようにする
+    context = multiprocessing.get_context("spawn")
+    for worker_count in workers:
+        for handoff in handoffs:
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                stats = pool.submit(
+                    _run_once,
+                    workdir / f"workers-{worker_count}-{handoff}",
+                    meters=meters,
+                    samples=samples,
+                    workers=worker_count,
+                    handoff=handoff,
+                ).result()
+            if stats["rows"] != total:
+                # 日付の判定は DuckDB のセッションタイムゾーン（TZ）に従う
+                raise RuntimeError(f"件数が一致しません: {stats['rows']} != {total}")
+            elapsed = stats["transform"] + stats["parquet"] + stats["duckdb"]
+            lines.append(
+                f"{worker_count:>8}{handoff:>9}{stats['transform']:>15.2f}"
+                f"{stats['parquet']:>13.2f}{stats['duckdb']:>12.2f}"
+                f"{stats['verify']:>10.2f}"
+                f"{stats['peak_rss'] / 2**20:>16.0f}{total / elapsed:>10.0f}"
+            )
+    return lines
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="メーター数に対するアーカイブ各段の時間を測る"
+    )
+    parser.add_argument("--meters", type=int, default=120, help="合成メーター数")
+    parser.add_argument(
+        "--samples",
+        type=int,
+        default=86_400 // SAMPLE_INTERVAL_SECONDS,
+        help="1メーターあたりのポイント数（既定は10秒間隔の1日分）",
+    )
+    parser.add_argument(
+        "--workers",
+        default=f"1,{os.cpu_count() or 4}",
+        help="比較する ARCHIVE_WORKERS（カンマ区切り）",
+    )
+    parser.add_argument(
+        "--handoff",
+        default="parquet,arrow",
+        help="DuckDB への渡し方: parquet（ファイルを読み直す）/ arrow（同じ Arrow 表）",
+    )
+    parser.add_argument(
+        "--workdir",
+        default=None,
+        help="作業ディレクトリ（未指定なら一時ディレクトリを作って最後に削除）",
+    )
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    workers = [int(value) for value in args.workers.split(",") if value]
+    if args.workdir:
+        workdir = Path(args.workdir)
+        workdir.mkdir(parents=True, exist_ok=True)
+        cleanup = False
+    else:
+        workdir = Path(tempfile.mkdtemp(prefix="homeiot-bench-"))
+        cleanup = True
+    try:
+        for line in run_benchmark(
+            workdir,
+            meters=args.meters,
+            samples=args.samples,
+            workers=workers,
+            handoffs=[value for value in args.handoff.split(",") if value],
+        ):
+            print(line)
+    finally:
+        if cleanup:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
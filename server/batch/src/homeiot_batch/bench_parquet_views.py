@@ -0,0 +1,175 @@
+"""Parquetビューとネイティブテーブルの範囲クエリ速度を比べるベンチマーク。
+
+合成データ（10秒間隔・1 source）を一時ディレクトリに作り、同じ集計を
+1) DuckDB ファイル内の raw_meter_readings
+2) dt で刈り込む Parquet ビュー
+3) ts_jst だけで絞る Parquet ビュー（刈り込みなし）
+に対して実行して、中央値と初回の時間を表示する。
+"""
+
+from __future__ import annotations
+
+import argparse
+import shutil
+import statistics
+import tempfile
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+import duckdb
+
+from .duckdb_writer import DDL
+from .parquet_views import dataset_glob, register_parquet_views
+from .parquet_writer import ensure_anchor_files, native_columns
+
+SAMPLE_INTERVAL_SECONDS = 10
+
+AGGREGATE_SQL = """
+SELECT CAST(ts_jst AS DATE) AS day, source,
+       COUNT(*), AVG(instant_power_w), MAX(instant_power_w)
+FROM raw_meter_readings
+WHERE {predicate}
+GROUP BY ALL
+"""
+
+PREDICATES = {
+    "native": "CAST(ts_jst AS DATE) BETWEEN ? AND ?",
+    "parquet_pruned": "dt BETWEEN ? AND ?",
+    "parquet_unpruned": "ts_jst >= ? AND ts_jst < ? + INTERVAL 1 DAY",
+}
+
+
+def _generate_dataset(base_dir: Path, start: date, days: int, tz: str) -> None:
+    dataset_dir = base_dir / "raw_meter_readings"
+    connection = duckdb.connect()
+    connection.execute(f"SET TimeZone = '{tz}'")
+    samples = 86_400 // SAMPLE_INTERVAL_SECONDS
+    for offset in range(days):
+        day = start + timedelta(days=offset)
+        partition_dir = dataset_dir / f"dt={day.isoformat()}" / "source=meter1"
+        partition_dir.mkdir(parents=True, exist_ok=True)
+        day_start = connection.execute(
+            "SELECT epoch(CAST(? AS TIMESTAMPTZ))", [f"{day.isoformat()} 00:00:00"]
+        ).fetchone()[0]
+        connection.execute(
+            f"""
+            COPY (
+              SELECT
+                to_timestamp(? + i * {SAMPLE_INTERVAL_SECONDS}) AS ts_utc,
+                to_timestamp(? + i * {SAMPLE_INTERVAL_SECONDS}) AS ts_jst,
+                'meter1' AS source,
+                300 + (i * 37) % 900 AS instant_power_w,
+                CAST(NULL AS DOUBLE) AS energy_import_kwh,
+                CAST(NULL AS DOUBLE) AS energy_export_kwh,
+                now() AS ingested_at
+              FROM range({samples}) t(i)
+            ) TO '{(partition_dir / "part-0000.parquet").as_posix()}'
+            (FORMAT PARQUET, COMPRESSION ZSTD)
+            """,
+            [day_start, day_start],
+        )
+    connection.close()
+
+
+def _build_native(db_path: Path, parquet_base_dir: Path, tz: str) -> None:
+    with duckdb.connect(db_path.as_posix()) as connection:
+        connection.execute(f"SET TimeZone = '{tz}'")
+        connection.execute(DDL)
+        connection.execute(
+            f"""
+            INSERT INTO raw_meter_readings
+            SELECT {native_columns(tz)}
+            FROM read_parquet(?)
+            """,
+            [dataset_glob(parquet_base_dir.as_posix())],
+        )
+        connection.execute("CHECKPOINT")
+
+
+def _time_query(
+    connection: duckdb.DuckDBPyConnection, sql: str, params: list[date], repeat: int
+) -> tuple[float, float]:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        connection.execute(sql, params).fetchall()
+        timings.append(time.perf_counter() - started)
+    return timings[0], statistics.median(timings)
+
+
+def run_benchmark(workdir: Path, *, days: int, repeat: int, tz: str) -> list[str]:
+    start = date(2025, 1, 1)
+    parquet_base_dir = workdir / "parquet"
+    db_path = workdir / "native.duckdb"
+    _generate_dataset(parquet_base_dir, start, days, tz)
+    ensure_anchor_files(parquet_base_dir.as_posix(), tz)
+    _build_native(db_path, parquet_base_dir, tz)
+
+    native = duckdb.connect(db_path.as_posix(), read_only=True)
+    views = duckdb.connect()
+    for connection in (native, views):
+        connection.execute(f"SET TimeZone = '{tz}'")
+    register_parquet_views(views, parquet_base_dir.as_posix(), tz)
+
+    last = start + timedelta(days=days - 1)
+    ranges = {
+        "1 day": (last, last),
+        "7 days": (last - timedelta(days=6), last),
+        "30 days": (last - timedelta(days=29), last),
+        f"all ({days} days)": (start, last),
+    }
+    lines = [f"{'range':<16}{'mode':<20}{'first [ms]':>12}{'median [ms]':>13}"]
+    for label, (range_start, range_end) in ranges.items():
+        for mode, predicate in PREDICATES.items():
+            connection = native if mode == "native" else views
+            first, median = _time_query(
+                connection,
+                AGGREGATE_SQL.format(predicate=predicate),
+                [range_start, range_end],
+                repeat,
+            )
+            lines.append(
+                f"{label:<16}{mode:<20}{first * 1000:>12.1f}{median * 1000:>13.1f}"
+            )
+    native.close()
+    views.close()
+    return lines
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Parquetビューとネイティブテーブルの範囲クエリを比較する"
+    )
+    parser.add_argument("--days", type=int, default=365, help="合成データの日数")
+    parser.add_argument("--repeat", type=int, default=5, help="各クエリの実行回数")
+    parser.add_argument("--tz", default="Asia/Tokyo", help="セッションのタイムゾーン")
+    parser.add_argument(
+        "--workdir",
+        default=None,
+        help="作業ディレクトリ（未指定なら一時ディレクトリを作って最後に削除）",
+    )
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    if args.workdir:
+        workdir = Path(args.workdir)
+        workdir.mkdir(parents=True, exist_ok=True)
+        cleanup = False
+    else:
+        workdir = Path(tempfile.mkdtemp(prefix="homeiot-bench-"))
+        cleanup = True
+    try:
+        for line in run_benchmark(
+            workdir, days=args.days, repeat=args.repeat, tz=args.tz
+        ):
+            print(line)
+    finally:
+        if cleanup:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
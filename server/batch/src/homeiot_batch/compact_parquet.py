@@ -0,0 +1,242 @@
+"""締めた月の日次Parquetパーティションを月単位の1ファイルにまとめる。
+
+`raw_meter_readings/dt=YYYY-MM-DD/` を
+`raw_meter_readings_monthly/month=YYYY-MM/part-0000.parquet` へ統合する。
+月次ファイルは dt・source・ts_utc 順に並べ、dt を列として持つので、
+row group の統計で dt の条件から読み飛ばせる。
+
+読み手の一貫性は次の順序で保つ。
+1. 日次パーティションと既存の月次ファイルから一時ファイルを書き、件数を確かめる
+2. 一時ファイルを os.replace で月次ファイルと入れ替える
+3. 統合した日次パーティションを glob に一致しない隠し名へ rename してから消し、
+   ビュー用DuckDBを作り直す。1 の時点から中身が変わった日（統合中に
+   再アーカイブされた日）は消さずに戻す
+ビューは日次・月次の両方を固定の glob で参照し、日次パーティションのファイルが
+ある日を月次より優先する。2 と 3 の間に両方が見えても重複せず、統合前に
+書き出したビューも 3 の後で全部の日を読める。締めた月の1日を再アーカイブすると
+（0 行でも目印のファイルが残る）、その日の日次パーティションが月次ファイルの
+内容を上書きし、次回の統合で取り込まれる。
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+import shutil
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+import duckdb
+
+from .config import Config
+from .parquet_views import _sql_literal, monthly_dir, write_views_database
+from .parquet_writer import ANCHOR_DAY, PART_FILE_NAME, ensure_anchor_files
+
+logger = logging.getLogger(__name__)
+
+MONTHLY_FILE_NAME = PART_FILE_NAME
+
+# source 別と旧形式の日次パーティションが混ざっても読めるよう、dt はパスから取る
+DAILY_SELECT = """
+SELECT ts_utc, ts_jst, source, instant_power_w,
+       energy_import_kwh, energy_export_kwh, ingested_at,
+       CAST(regexp_extract(filename, 'dt=([0-9-]{{10}})', 1) AS DATE) AS dt
+FROM read_parquet({files}, hive_partitioning = false, filename = true)
+"""
+MONTHLY_SELECT = """
+SELECT ts_utc, ts_jst, source, instant_power_w,
+       energy_import_kwh, energy_export_kwh, ingested_at, dt
+FROM read_parquet({file}, hive_partitioning = false)
+WHERE dt NOT IN ({days})
+"""
+
+
+@dataclass
+class CompactionResult:
+    month: str
+    merged_days: int
+    rows: int
+    output_path: Path
+    removed_days: int
+
+
+def _month_label(day: date) -> str:
+    return day.strftime("%Y-%m")
+
+
+def open_month_label(config: Config, now: datetime | None = None) -> str:
+    """これより前の月は締めたとみなす月（前日を含む月）を返す。"""
+    today = (now or datetime.now(config.tzinfo)).astimezone(config.tzinfo).date()
+    return _month_label(today - timedelta(days=1))
+
+
+def daily_partitions(parquet_base_dir: str) -> dict[str, list[Path]]:
+    """月ごとの日次パーティションディレクトリ（日付順）。"""
+    dataset_dir = Path(parquet_base_dir) / "raw_meter_readings"
+    months: dict[str, list[Path]] = {}
+    for partition_dir in sorted(dataset_dir.glob("dt=????-??-??")):
+        if partition_dir.name == f"dt={ANCHOR_DAY}":
+            continue
+        if not any(partition_dir.rglob("*.parquet")):
+            continue
+        day = date.fromisoformat(partition_dir.name.removeprefix("dt="))
+        months.setdefault(_month_label(day), []).append(partition_dir)
+    return months
+
+
+def _file_state(partition_dir: Path) -> tuple[tuple[str, int, int], ...]:
+    # 統合中に再アーカイブされたパーティションは消さないよう、読んだ時点の状態を覚える。
+    # rename しても変わらないよう、パスはパーティションからの相対で持つ
+    return tuple(
+        (path.relative_to(partition_dir).as_posix(), stat.st_ino, stat.st_mtime_ns)
+        for path in sorted(partition_dir.rglob("*.parquet"))
+        for stat in (path.stat(),)
+    )
+
+
+def _retire_partition(
+    partition_dir: Path, state: tuple[tuple[str, int, int], ...]
+) -> bool:
+    """月次へ統合した日を読み手から一度に外してから消す。消したら True。
+
+    先に glob に一致しない隠し名へ rename するので、読み手には消しかけの日が
+    見えない。rename 後の中身が統合前と違えば統合後に書かれた日なので、
+    元の名前に戻して残す。
+    """
+    retired = partition_dir.with_name(f".{partition_dir.name}.compacted")
+    if retired.exists():
+        shutil.rmtree(retired)
+    try:
+        partition_dir.rename(retired)
+    except FileNotFoundError:
+        # 再アーカイブの入れ替え中。新しい日次パーティションを残す
+        logger.warning("統合中に更新されたため残します: %s", partition_dir)
+        return False
+    if _file_state(retired) == state:
+        shutil.rmtree(retired)
+        return True
+    logger.warning("統合中に更新されたため残します: %s", partition_dir)
+    try:
+        retired.rename(partition_dir)
+    except OSError:
+        # その後さらに再アーカイブされ、新しい方がもう置かれている
+        shutil.rmtree(retired)
+    return False
+
+
+def compact_month(
+    config: Config, month: str, partition_dirs: list[Path]
+) -> CompactionResult:
+    # 古いビューが日次の消えた後も読めるよう、先に各層の目印を置いておく
+    ensure_anchor_files(config.parquet_base_dir, config.tz)
+    output_dir = monthly_dir(config.parquet_base_dir) / f"month={month}"
+    output_dir.mkdir(parents=True, exist_ok=True)
+    output_path = output_dir / MONTHLY_FILE_NAME
+    tmp_path = output_dir / f".{MONTHLY_FILE_NAME}.tmp"
+    if tmp_path.exists():
+        tmp_path.unlink()
+
+    snapshot = {d: _file_state(d) for d in partition_dirs}
+    files = [f.as_posix() for d in partition_dirs for f in sorted(d.rglob("*.parquet"))]
+    days = [d.name.removeprefix("dt=") for d in partition_dirs]
+    file_list = "[" + ", ".join(map(_sql_literal, files)) + "]"
+    source_sql = DAILY_SELECT.format(files=file_list)
+    if output_path.exists():
+        source_sql += "UNION ALL" + MONTHLY_SELECT.format(
+            file=_sql_literal(output_path.as_posix()),
+            days=", ".join(f"DATE {_sql_literal(day)}" for day in days),
+        )
+
+    options = f"FORMAT PARQUET, COMPRESSION {config.parquet_compression}"
+    if config.parquet_row_group_size:
+        options += f", ROW_GROUP_SIZE {config.parquet_row_group_size}"
+    try:
+        with duckdb.connect() as connection:
+            expected = connection.execute(
+                f"SELECT COUNT(*) FROM ({source_sql})"
+            ).fetchone()[0]
+            connection.execute(
+                f"COPY ({source_sql} ORDER BY dt, source, ts_utc) "
+                f"TO {_sql_literal(tmp_path.as_posix())} ({options})"
+            )
+            written = connection.execute(
+                "SELECT COUNT(*) FROM read_parquet(?)", [tmp_path.as_posix()]
+            ).fetchone()[0]
+        if written != expected:
+            raise RuntimeError(
+                f"月次ファイルの件数が一致しません: {month} "
+                f"expected={expected} written={written}"
+            )
+        os.replace(tmp_path, output_path)
+    except Exception:
+        if tmp_path.exists():
+            tmp_path.unlink()
+        raise
+
+    removed = sum(
+        _retire_partition(partition_dir, state)
+        for partition_dir, state in snapshot.items()
+    )
+    return CompactionResult(
+        month=month,
+        merged_days=len(partition_dirs),
+        rows=written,
+        output_path=output_path,
+        removed_days=removed,
+    )
+
+
+def compact_closed_months(
+    config: Config, *, month: str | None = None, now: datetime | None = None
+) -> list[CompactionResult]:
+    """締めた月の日次パーティションをすべて月次ファイルへ統合する。"""
+    open_month = open_month_label(config, now)
+    results = []
+    for label, partition_dirs in daily_partitions(config.parquet_base_dir).items():
+        if month is not None and label != month:
+            continue
+        if label >= open_month:
+            logger.info("未確定の月なので統合しません: %s", label)
+            continue
+        results.append(compact_month(config, label, partition_dirs))
+    if results:
+        write_views_database(config)
+    return results
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="締めた月の日次Parquetを月次ファイルへ統合する"
+    )
+    parser.add_argument(
+        "--month",
+        default=None,
+        help="対象月 YYYY-MM（未指定なら締めた月すべて）",
+    )
+    return parser.parse_args()
+
+
+def main() -> None:
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s"
+    )
+    args = parse_args()
+    config = Config.load()
+    results = compact_closed_months(config, month=args.month)
+    if not results:
+        logger.info("統合対象の月はありません")
+    for result in results:
+        logger.info(
+            "月次統合: %s 日数=%d 件数=%d 削除=%d 出力=%s",
+            result.month,
+            result.merged_days,
+            result.rows,
+            result.removed_days,
+            result.output_path,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -21,9 +21,16 @@ class Config:
     parquet_base_dir: str
     parquet_compression: str
     parquet_row_group_size: int | None
+    parquet_views_path: str
     tz: str
     measurement: str
     source_default: str
+    source_tag: str
+    archive_workers: int
+    metrics_dir: str
+    full_verify_interval_days: int
+    late_data_lookback_days: int
+    coverage_gap_seconds: float
 
     @property
     def tzinfo(self) -> ZoneInfo:
@@ -55,8 +62,23 @@ class Config:
             parquet_row_group_size=int(os.environ["PARQUET_ROW_GROUP_SIZE"])
             if "PARQUET_ROW_GROUP_SIZE" in os.environ
             else None,
+            parquet_views_path=os.environ.get(
+                "PARQUET_VIEWS_PATH", "/data/duckdb/home_energy_views.duckdb"
+            ),
             tz=os.environ.get("TZ", "Asia/Tokyo"),
             measurement=os.environ.get("INFLUX_MEASUREMENT")
             or os.environ.get("MEASUREMENT", "smartmeter_power"),
             source_default=os.environ.get("SOURCE_DEFAULT", "meter1"),
+            source_tag=os.environ.get("SOURCE_TAG", "meter"),
+            archive_workers=int(os.environ.get("ARCHIVE_WORKERS", "4")),
+            metrics_dir=os.environ.get("BATCH_METRICS_DIR", "/data/metrics"),
+            full_verify_interval_days=int(
+                os.environ.get("FULL_VERIFY_INTERVAL_DAYS", "7")
+            ),
+            late_data_lookback_days=int(
+                os.environ.get("LATE_DATA_LOOKBACK_DAYS", "7")
+            ),
+            coverage_gap_seconds=float(
+                os.environ.get("COVERAGE_GAP_SECONDS", "60")
+            ),
         )
@@ -0,0 +1,148 @@
+"""source・日ごとのデータ有無の索引（連続区間・欠損・時間別件数）。
+
+`daily_source_coverage` に 1 (日, source) あたり数十行で次を持つ。
+- kind='range': 間隔が `COVERAGE_GAP_SECONDS` 以下で続いている区間と件数
+- kind='gap': それより長く空いた区間（日の始まり/終わりとの間も含む）
+- kind='hour': 1 時間ごとの件数（0 件の時間も行を持つ）
+時刻は `dt` と同じく `ts_jst` 基準。稼働率やデータ欠損のダッシュボードは
+`raw_meter_readings` を走査せずにこれを読む。
+"""
+
+from __future__ import annotations
+
+from datetime import date, datetime, time, timedelta
+
+import duckdb
+
+COVERAGE_DDL = """
+CREATE TABLE IF NOT EXISTS daily_source_coverage (
+  dt DATE,
+  source VARCHAR,
+  kind VARCHAR,
+  start_jst TIMESTAMP,
+  end_jst TIMESTAMP,
+  seconds DOUBLE,
+  samples BIGINT
+);
+"""
+
+# {rows} は raw_meter_readings AS r から対象の行を選ぶ FROM 句
+_COVERAGE_SQL = """
+INSERT INTO daily_source_coverage
+WITH points AS (
+  SELECT
+    CAST(r.ts_jst AS DATE) AS dt, r.source, r.ts_jst,
+    lag(r.ts_jst) OVER (
+      PARTITION BY CAST(r.ts_jst AS DATE), r.source ORDER BY r.ts_jst
+    ) AS prev_ts
+  FROM {rows}
+),
+runs AS (
+  SELECT
+    *,
+    SUM(CASE
+      WHEN prev_ts IS NULL
+        OR date_diff('millisecond', prev_ts, ts_jst) > $gap_ms THEN 1
+      ELSE 0
+    END) OVER (PARTITION BY dt, source ORDER BY ts_jst) AS run_id
+  FROM points
+),
+edges AS (
+  SELECT dt, source, CAST(dt AS TIMESTAMP) AS day_start,
+         CAST(dt + 1 AS TIMESTAMP) AS day_end,
+         MIN(ts_jst) AS first_ts, MAX(ts_jst) AS last_ts
+  FROM points
+  GROUP BY dt, source
+),
+ranges AS (
+  SELECT dt, source, 'range' AS kind, MIN(ts_jst) AS start_jst,
+         MAX(ts_jst) AS end_jst, COUNT(*) AS samples
+  FROM runs
+  GROUP BY dt, source, run_id
+),
+gaps AS (
+  SELECT dt, source, 'gap' AS kind, prev_ts AS start_jst, ts_jst AS end_jst,
+         0 AS samples
+  FROM points
+  WHERE date_diff('millisecond', prev_ts, ts_jst) > $gap_ms
+  UNION ALL
+  SELECT dt, source, 'gap', day_start, first_ts, 0
+  FROM edges
+  WHERE date_diff('millisecond', day_start, first_ts) > $gap_ms
+  UNION ALL
+  SELECT dt, source, 'gap', last_ts, day_end, 0
+  FROM edges
+  WHERE date_diff('millisecond', last_ts, day_end) > $gap_ms
+),
+hour_counts AS (
+  SELECT dt, source, hour(ts_jst) AS hour, COUNT(*) AS samples
+  FROM points
+  GROUP BY ALL
+),
+hours AS (
+  SELECT
+    e.dt, e.source, 'hour' AS kind,
+    e.day_start + to_hours(h.hour) AS start_jst,
+    e.day_start + to_hours(h.hour + 1) AS end_jst,
+    coalesce(c.samples, 0) AS samples
+  FROM edges AS e
+  CROSS JOIN (SELECT range AS hour FROM range(24)) AS h
+  LEFT JOIN hour_counts AS c
+    ON c.dt = e.dt AND c.source = e.source AND c.hour = h.hour
+)
+SELECT dt, source, kind, start_jst, end_jst,
+       date_diff('millisecond', start_jst, end_jst) / 1000.0, samples
+FROM (
+  SELECT * FROM ranges
+  UNION ALL SELECT * FROM gaps
+  UNION ALL SELECT * FROM hours
+)
+ORDER BY dt, source, kind, start_jst
+"""
+
+
+def day_bounds(target_date: date) -> tuple[datetime, datetime]:
+    """`ts_jst` で 1 日を表す半開区間。
+
+    `CAST(ts_jst AS DATE) = ?` と違い、列の min/max（zone map）で読み飛ばせる。
+    """
+    start = datetime.combine(target_date, time())
+    return start, start + timedelta(days=1)
+
+
+def refresh_coverage(
+    connection: duckdb.DuckDBPyConnection,
+    target_date: date,
+    *,
+    gap_seconds: float,
+) -> None:
+    """1 日分の全 source の索引を作り直す。呼び出し側のトランザクション内で使う。"""
+    start, end = day_bounds(target_date)
+    connection.execute("DELETE FROM daily_source_coverage WHERE dt = ?", [target_date])
+    connection.execute(
+        _COVERAGE_SQL.format(
+            rows="raw_meter_readings AS r WHERE r.ts_jst >= $start AND r.ts_jst < $end"
+        ),
+        {"start": start, "end": end, "gap_ms": int(gap_seconds * 1000)},
+    )
+
+
+def backfill_coverage(
+    connection: duckdb.DuckDBPyConnection, *, gap_seconds: float
+) -> int:
+    """日次集計はあるのに索引が無い (日, source) をまとめて作り、件数を返す。"""
+    missing = """
+        SELECT dt, source FROM daily_source_rollups
+        EXCEPT
+        SELECT DISTINCT dt, source FROM daily_source_coverage
+    """
+    count = connection.execute(f"SELECT COUNT(*) FROM ({missing})").fetchone()[0]
+    if count:
+        connection.execute(
+            _COVERAGE_SQL.format(
+                rows=f"raw_meter_readings AS r JOIN ({missing}) AS t "
+                "ON CAST(r.ts_jst AS DATE) = t.dt AND r.source = t.source"
+            ),
+            {"gap_ms": int(gap_seconds * 1000)},
+        )
+    return count
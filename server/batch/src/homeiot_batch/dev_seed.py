@@ -21,6 +21,7 @@ def _build_points(
     interval_minutes: int,
     count: int,
     measurement: str,
+    source_tag: str,
     source: str,
 ) -> List[dict[str, Any]]:
     points: List[dict[str, Any]] = []
@@ -33,7 +34,7 @@ def _build_points(
             {
                 "measurement": measurement,
                 "time": ts.isoformat().replace("+00:00", "Z"),
-                "tags": {"source": source},
+                "tags": {source_tag: source},
                 "fields": {
                     "instant_power_w": instant_power,
                     "energy_import_kwh": round(energy_import, 5),
@@ -107,6 +108,7 @@ def main() -> None:
         interval_minutes=args.interval_minutes,
         count=args.count,
         measurement=config.measurement,
+        source_tag=config.source_tag,
         source=source,
     )
     logger.info("投入件数: %d (期間: %s 〜 %s)", len(points), points[0]["time"], points[-1]["time"])
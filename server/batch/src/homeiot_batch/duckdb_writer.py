@@ -2,14 +2,21 @@
 
 from __future__ import annotations
 
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date
 from pathlib import Path
 from dataclasses import dataclass
+from urllib.parse import unquote
 import logging
 
 import duckdb
+import pyarrow as pa
 
+from .archive_migrations import apply_migrations
+from .archive_verify import VerificationResult, verify_archive
 from .config import Config
+from .coverage import COVERAGE_DDL, backfill_coverage, day_bounds, refresh_coverage
+from .parquet_writer import EMPTY_SOURCE, native_columns
 
 logger = logging.getLogger(__name__)
 
@@ -25,65 +32,169 @@ CREATE TABLE IF NOT EXISTS raw_meter_readings (
 );
 """
 
-
-def _ensure_table(connection: duckdb.DuckDBPyConnection) -> None:
-    connection.execute(DDL)
+ROLLUP_DDL = """
+CREATE TABLE IF NOT EXISTS daily_source_rollups (
+  dt DATE,
+  source VARCHAR,
+  samples BIGINT,
+  avg_power_w DOUBLE,
+  min_power_w DOUBLE,
+  max_power_w DOUBLE,
+  energy_import_kwh DOUBLE,
+  first_ts_utc TIMESTAMP,
+  last_ts_utc TIMESTAMP
+);
+"""
 
 
-def _delete_target_date(connection: duckdb.DuckDBPyConnection, target_date: date) -> int | None:
-    # DuckDB 1.x では DATE() 関数が無いのでキャストで日付比較する
-    cursor = connection.execute(
-        "DELETE FROM raw_meter_readings WHERE CAST(ts_jst AS DATE) = ?",
-        [target_date],
-    )
-    return cursor.rowcount if cursor.rowcount != -1 else None
+def _ensure_table(connection: duckdb.DuckDBPyConnection, tz: str) -> None:
+    connection.execute(DDL)
+    connection.execute(ROLLUP_DDL)
+    connection.execute(COVERAGE_DDL)
+    apply_migrations(connection, tz)
 
 
 def _insert_from_parquet(
     connection: duckdb.DuckDBPyConnection,
-    partition_dir: Path,
+    parquet_glob: str,
+    tz: str,
 ) -> None:
-    parquet_glob = partition_dir.joinpath("*.parquet").as_posix()
     connection.execute(
-        """
+        f"""
         INSERT INTO raw_meter_readings (
             ts_utc, ts_jst, source, instant_power_w,
             energy_import_kwh, energy_export_kwh, ingested_at
         )
-        SELECT ts_utc, ts_jst, source, instant_power_w,
-               energy_import_kwh, energy_export_kwh, ingested_at
-        FROM read_parquet(?)
+        SELECT {native_columns(tz)}
+        FROM read_parquet(?, hive_partitioning = false)
         """,
         [parquet_glob],
     )
 
 
-def _count_for_date(connection: duckdb.DuckDBPyConnection, target_date: date) -> int:
-    return connection.execute(
-        "SELECT COUNT(*) FROM raw_meter_readings WHERE CAST(ts_jst AS DATE) = ?",
-        [target_date],
-    ).fetchone()[0]
+def _insert_from_arrow(
+    connection: duckdb.DuckDBPyConnection,
+    table: pa.Table,
+    tz: str,
+) -> None:
+    # Parquet に書いたのと同じバッファを読み込ませる（ファイルは読み直さない）
+    connection.register("archive_rows", table)
+    try:
+        connection.execute(
+            f"""
+            INSERT INTO raw_meter_readings (
+                ts_utc, ts_jst, source, instant_power_w,
+                energy_import_kwh, energy_export_kwh, ingested_at
+            )
+            SELECT {native_columns(tz)}
+            FROM archive_rows
+            """
+        )
+    finally:
+        connection.unregister("archive_rows")
+
 
+def _delete_stale_sources(
+    connection: duckdb.DuckDBPyConnection, target_date: date, sources: list[str]
+) -> int | None:
+    # 再アーカイブで消えた source（タグ不足で既定値に寄っていた行など）を先に消す。
+    # 0 行になった日は全 source を消す（NOT IN (NULL) は何にも一致しない）。
+    # 日次集計と欠損索引は _refresh_day がその日の分をまとめて作り直す
+    stale = f"AND source NOT IN ({', '.join('?' for _ in sources)})" if sources else ""
+    deleted = connection.execute(
+        f"DELETE FROM raw_meter_readings WHERE ts_jst >= ? AND ts_jst < ? {stale}",
+        [*day_bounds(target_date), *sources],
+    ).rowcount
+    return deleted if deleted != -1 else None
+
+
+def _load_source(
+    connection: duckdb.DuckDBPyConnection,
+    config: Config,
+    target_date: date,
+    source: str,
+    data: str | pa.Table,
+) -> int | None:
+    """1 source 分の行の削除と挿入を 1 トランザクションで行う。
 
-def _integrity_check(connection: duckdb.DuckDBPyConnection) -> None:
+    `data` は Parquet の glob か、Parquet に書いたのと同じ Arrow 表。
+    """
+    cursor = connection.cursor()
     try:
-        rows = connection.execute("PRAGMA integrity_check").fetchall()
-    except duckdb.CatalogException:
-        connection.execute("PRAGMA force_checkpoint")
-        logger.warning("DuckDB integrity_check is not supported; force_checkpoint only.")
-        return
-    if not rows:
-        raise RuntimeError("DuckDB integrity_check returned no rows")
-    if len(rows) == 1 and rows[0][0] == "ok":
-        return
-    details = ", ".join(str(row[0]) for row in rows)
-    raise RuntimeError(f"DuckDB integrity_check failed: {details}")
+        cursor.execute("BEGIN TRANSACTION")
+        deleted = cursor.execute(
+            "DELETE FROM raw_meter_readings "
+            "WHERE ts_jst >= ? AND ts_jst < ? AND source = ?",
+            [*day_bounds(target_date), source],
+        ).rowcount
+        if isinstance(data, pa.Table):
+            _insert_from_arrow(cursor, data, config.tz)
+        else:
+            _insert_from_parquet(cursor, data, config.tz)
+        cursor.execute("COMMIT")
+    except Exception:
+        cursor.execute("ROLLBACK")
+        raise
+    finally:
+        cursor.close()
+    return deleted if deleted != -1 else None
+
+
+def _refresh_day(
+    connection: duckdb.DuckDBPyConnection, config: Config, target_date: date
+) -> None:
+    """1 日分の日次集計と欠損索引を、全 source まとめて 1 回の走査で作り直す。"""
+    cursor = connection.cursor()
+    try:
+        cursor.execute("BEGIN TRANSACTION")
+        cursor.execute("DELETE FROM daily_source_rollups WHERE dt = ?", [target_date])
+        cursor.execute(
+            """
+            INSERT INTO daily_source_rollups
+            SELECT
+              CAST(ts_jst AS DATE), source, COUNT(*),
+              AVG(instant_power_w), MIN(instant_power_w), MAX(instant_power_w),
+              MAX(energy_import_kwh) - MIN(energy_import_kwh),
+              MIN(ts_utc), MAX(ts_utc)
+            FROM raw_meter_readings
+            WHERE ts_jst >= ? AND ts_jst < ?
+            GROUP BY ALL
+            """,
+            day_bounds(target_date),
+        )
+        refresh_coverage(cursor, target_date, gap_seconds=config.coverage_gap_seconds)
+        cursor.execute("COMMIT")
+    except Exception:
+        cursor.execute("ROLLBACK")
+        raise
+    finally:
+        cursor.close()
+
+
+def source_globs(partition_dir: Path) -> dict[str, str]:
+    """パーティション内の source ごとの Parquet glob（0 行の日の目印は除く）。"""
+    globs = {}
+    for source_dir in sorted(partition_dir.glob("source=*")):
+        source = unquote(source_dir.name.removeprefix("source="))
+        if source == EMPTY_SOURCE:
+            continue
+        globs[source] = source_dir.joinpath("*.parquet").as_posix()
+    return globs
+
+
+def _count_for_date(connection: duckdb.DuckDBPyConnection, target_date: date) -> int:
+    return connection.execute(
+        "SELECT COUNT(*) FROM raw_meter_readings WHERE ts_jst >= ? AND ts_jst < ?",
+        day_bounds(target_date),
+    ).fetchone()[0]
 
 
 @dataclass
 class DuckDBWriteResult:
     deleted_rows: int | None
     inserted_rows: int
+    sources: int
+    verifications: list[VerificationResult]
 
 
 def write_archive(
@@ -92,16 +203,84 @@ def write_archive(
     partition_dir: Path,
     duckdb_path: Path | None = None,
 ) -> DuckDBWriteResult:
+    return write_archive_days(config, {target_date: partition_dir}, duckdb_path)
+
+
+def write_archive_days(
+    config: Config,
+    partitions: dict[date, Path],
+    duckdb_path: Path | None = None,
+    *,
+    tables: dict[date, dict[str, pa.Table]] | None = None,
+) -> DuckDBWriteResult:
+    """複数日のパーティションを 1 つの接続・1 回の CHECKPOINT で投入する。
+
+    `tables` に Parquet を書いたときの Arrow 表を渡すと、ファイルを読み直さずに
+    それを投入・検証に使う。Parquet は呼び出し前に書き終えている前提。
+    """
+    tables = tables or {}
     duckdb_path = duckdb_path or Path(config.duckdb_path)
-    if not partition_dir.exists():
-        raise FileNotFoundError(f"Parquetパーティションが見つかりません: {partition_dir}")
+    for partition_dir in partitions.values():
+        if not partition_dir.exists():
+            raise FileNotFoundError(
+                f"Parquetパーティションが見つかりません: {partition_dir}"
+            )
     duckdb_path.parent.mkdir(parents=True, exist_ok=True)
+    day_globs = {day: source_globs(path) for day, path in sorted(partitions.items())}
     with duckdb.connect(duckdb_path.as_posix()) as connection:
-        _ensure_table(connection)
-        deleted = _delete_target_date(connection, target_date)
-        _insert_from_parquet(connection, partition_dir)
-        inserted = _count_for_date(connection, target_date)
+        _ensure_table(connection, config.tz)
+        deleted: int | None = 0
+        for day, globs in day_globs.items():
+            stale = _delete_stale_sources(connection, day, sorted(globs))
+            deleted = None if deleted is None or stale is None else deleted + stale
         connection.commit()
+        # (日, source) ごとに別カーソル（別トランザクション）で並列に投入する。
+        # 失敗したら例外で抜け、呼び出し側は .next ファイルを入れ替えない。
+        with ThreadPoolExecutor(max_workers=max(config.archive_workers, 1)) as pool:
+            futures = [
+                pool.submit(
+                    _load_source,
+                    connection,
+                    config,
+                    day,
+                    source,
+                    tables.get(day, {}).get(source, glob),
+                )
+                for day, globs in day_globs.items()
+                for source, glob in globs.items()
+            ]
+            for future in futures:
+                source_deleted = future.result()
+                if deleted is not None and source_deleted is not None:
+                    deleted += source_deleted
+                else:
+                    deleted = None
+            # 日次集計と欠損索引は source ごとではなく日ごとに 1 回だけ作る
+            for future in [
+                pool.submit(_refresh_day, connection, config, day) for day in day_globs
+            ]:
+                future.result()
+        inserted = sum(_count_for_date(connection, day) for day in day_globs)
+        # 索引が入る前にアーカイブした日は、ここでまとめて作る（初回だけ全体を読む）
+        backfilled = backfill_coverage(
+            connection, gap_seconds=config.coverage_gap_seconds
+        )
+        if backfilled:
+            logger.info(
+                "欠損索引を %d 件の (日, source) について作成しました。", backfilled
+            )
+        # 検証に失敗したら例外で抜け、.next ファイルは入れ替えられない
+        verifications = verify_archive(
+            connection,
+            {day: list(globs.values()) for day, globs in day_globs.items()},
+            tz=config.tz,
+            full_interval_days=config.full_verify_interval_days,
+            tables={day: list(parts.values()) for day, parts in tables.items()},
+        )
         connection.execute("CHECKPOINT")
-        _integrity_check(connection)
-    return DuckDBWriteResult(deleted_rows=deleted, inserted_rows=inserted)
+    return DuckDBWriteResult(
+        deleted_rows=deleted,
+        inserted_rows=inserted,
+        sources=len({source for globs in day_globs.values() for source in globs}),
+        verifications=verifications,
+    )
@@ -25,16 +25,7 @@ def calculate_target_window(
     return target_date, start_utc, end_utc
 
 
-def fetch_points(config: Config, start_utc: datetime, end_utc: datetime) -> list[dict[str, Any]]:
-    """InfluxDBから指定期間のポイントを取得する。"""
-    start_iso = start_utc.strftime("%Y-%m-%dT%H:%M:%SZ")
-    end_iso = end_utc.strftime("%Y-%m-%dT%H:%M:%SZ")
-    query = (
-        "SELECT power_w, instant_power_w, energy_import_kwh, energy_export_kwh "
-        f"FROM {config.measurement} "
-        f"WHERE time >= '{start_iso}' AND time < '{end_iso}'"
-    )
-
+def _query(config: Config, query: str) -> Any:
     session = None
     if config.influx_token:
         session = Session()
@@ -50,9 +41,68 @@ def fetch_points(config: Config, start_utc: datetime, end_utc: datetime) -> list
         session=session,
     )
     try:
-        result = client.query(query)
-        return list(result.get_points())
+        return client.query(query)
     finally:
         client.close()
         if session:
             session.close()
+
+
+def fetch_points_by_source(
+    config: Config, start_utc: datetime, end_utc: datetime
+) -> dict[str, list[dict[str, Any]]]:
+    """InfluxDBから指定期間のポイントを source タグごとに取得する。
+
+    各ポイントには `source` を埋めて返す。タグが無い系列は SOURCE_DEFAULT に寄せる。
+    """
+    start_iso = start_utc.strftime("%Y-%m-%dT%H:%M:%SZ")
+    end_iso = end_utc.strftime("%Y-%m-%dT%H:%M:%SZ")
+    query = (
+        "SELECT power_w, instant_power_w, energy_import_kwh, energy_export_kwh "
+        f"FROM {config.measurement} "
+        f"WHERE time >= '{start_iso}' AND time < '{end_iso}' "
+        f'GROUP BY "{config.source_tag}"'
+    )
+
+    result = _query(config, query)
+    grouped: dict[str, list[dict[str, Any]]] = {}
+    for (_, tags), series in result.items():
+        source = (tags or {}).get(config.source_tag) or config.source_default
+        points = grouped.setdefault(source, [])
+        for point in series:
+            point["source"] = source
+            points.append(point)
+    return grouped
+
+
+def fetch_daily_counts(
+    config: Config, start_utc: datetime, end_utc: datetime
+) -> dict[tuple[date, str], int]:
+    """指定期間の (JST日, source) ごとのポイント数を返す。
+
+    フィールドごとの COUNT のうち最大のもの（毎回送られる電力値の件数）を
+    その日の行数とみなす。
+    """
+    start_iso = start_utc.strftime("%Y-%m-%dT%H:%M:%SZ")
+    end_iso = end_utc.strftime("%Y-%m-%dT%H:%M:%SZ")
+    query = (
+        f"SELECT COUNT(*) FROM {config.measurement} "
+        f"WHERE time >= '{start_iso}' AND time < '{end_iso}' "
+        f'GROUP BY time(1d), "{config.source_tag}" tz(\'{config.tz}\')'
+    )
+    result = _query(config, query)
+    counts: dict[tuple[date, str], int] = {}
+    for (_, tags), series in result.items():
+        source = (tags or {}).get(config.source_tag) or config.source_default
+        for point in series:
+            count = max(
+                (value or 0 for key, value in point.items() if key.startswith("count")),
+                default=0,
+            )
+            if not count:
+                continue
+            day = datetime.fromisoformat(point["time"].replace("Z", "+00:00"))
+            key = (day.astimezone(config.tzinfo).date(), source)
+            counts[key] = counts.get(key, 0) + count
+    return counts
+
@@ -0,0 +1,83 @@
+"""アーカイブ済みの日に後から届いたデータ（遅延到着）を見つける。
+
+InfluxDB はポイントの到着時刻を持たないので、(JST日, source) ごとの件数を
+指紋として使う。遡る期間の InfluxDB の件数を DuckDB の件数と比べ、
+InfluxDB の方が多い日（バックフィルや HTTP の再送で増えた日）を返す。
+保持期間切れなどで InfluxDB の方が少ない日は再アーカイブしない。
+"""
+
+from __future__ import annotations
+
+import logging
+from datetime import date, timedelta
+from pathlib import Path
+
+import duckdb
+
+from .config import Config
+from .influx_reader import calculate_target_window, fetch_daily_counts
+
+logger = logging.getLogger(__name__)
+
+
+def archived_daily_counts(
+    duckdb_path: Path, start_date: date, end_date: date
+) -> dict[tuple[date, str], int]:
+    """DuckDB にある [start_date, end_date] の (日, source) ごとの件数。"""
+    if not duckdb_path.exists():
+        return {}
+    with duckdb.connect(duckdb_path.as_posix(), read_only=True) as connection:
+        tables = {
+            row[0]
+            for row in connection.execute(
+                "SELECT table_name FROM duckdb_tables()"
+            ).fetchall()
+        }
+        if "raw_meter_readings" not in tables:
+            return {}
+        rows = connection.execute(
+            """
+            SELECT CAST(ts_jst AS DATE), source, COUNT(*)
+            FROM raw_meter_readings
+            WHERE CAST(ts_jst AS DATE) BETWEEN ? AND ?
+            GROUP BY ALL
+            """,
+            [start_date, end_date],
+        ).fetchall()
+    return {(day, source): count for day, source, count in rows}
+
+
+def find_late_days(
+    influx_counts: dict[tuple[date, str], int],
+    archived_counts: dict[tuple[date, str], int],
+) -> dict[date, list[str]]:
+    """InfluxDB の件数がアーカイブより多い日と、その source を返す。"""
+    late: dict[date, list[str]] = {}
+    for (day, source), count in sorted(influx_counts.items()):
+        if count > archived_counts.get((day, source), 0):
+            late.setdefault(day, []).append(source)
+    return late
+
+
+def detect_late_days(config: Config, target_date: date) -> dict[date, list[str]]:
+    """対象日より前 `LATE_DATA_LOOKBACK_DAYS` 日のうち、再アーカイブが要る日。"""
+    if config.late_data_lookback_days <= 0:
+        return {}
+    first_day = target_date - timedelta(days=config.late_data_lookback_days)
+    last_day = target_date - timedelta(days=1)
+    _, start_utc, _ = calculate_target_window(config, target_date=first_day)
+    _, _, end_utc = calculate_target_window(config, target_date=last_day)
+    influx_counts = fetch_daily_counts(config, start_utc, end_utc)
+    archived_counts = archived_daily_counts(
+        Path(config.duckdb_path), first_day, last_day
+    )
+    late = find_late_days(influx_counts, archived_counts)
+    for day, sources in late.items():
+        logger.info(
+            "遅延到着を検出: %s (source: %s / InfluxDB %d 件, アーカイブ %d 件)",
+            day,
+            ", ".join(sources),
+            sum(influx_counts[(day, source)] for source in sources),
+            sum(archived_counts.get((day, source), 0) for source in sources),
+        )
+    return late
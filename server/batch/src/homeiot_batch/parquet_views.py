@@ -0,0 +1,204 @@
+"""ParquetデータセットをDuckDBのビューとして読むための読み取り側モジュール。
+
+`raw_meter_readings/dt=YYYY-MM-DD/source=<source>/*.parquet` を hive
+パーティションとして `read_parquet` で参照するビューを定義する。`dt` や
+`source` に対する条件はパーティションの刈り込みに使われ、対象外のファイルは開かれない。
+締めた月は `raw_meter_readings_monthly/month=YYYY-MM/` にまとめられ、
+dt 順に並んだ row group の統計で同じ条件から読み飛ばされる。
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+from pathlib import Path
+
+import duckdb
+
+from .config import Config
+from .parquet_writer import (
+    DATASET,
+    MONTHLY_DATASET,
+    anchor_files,
+    native_columns,
+)
+
+logger = logging.getLogger(__name__)
+
+# 書き込み中の `dt=...__tmp__` などを拾わないよう、日付の形だけに絞る
+PARTITION_GLOB = "dt=????-??-??/source=*/*.parquet"
+# source で分ける前の `dt=YYYY-MM-DD/part-0000.parquet`。hive のキーが違うので別に読む
+LEGACY_PARTITION_GLOB = "dt=????-??-??/*.parquet"
+# compact_parquet が締めた月をまとめたファイル（MONTHLY_DATASET 配下）
+MONTHLY_GLOB = "month=????-??/*.parquet"
+# 該当するファイルが無い glob は read_parquet がエラーにするので、各層には
+# 書き手が 0 行の目印を置いている（parquet_writer.anchor_files）
+
+DAILY_SOURCE = """
+read_parquet({glob}, hive_partitioning = true, hive_types = {{'dt': DATE}})
+"""
+MONTHLY_SOURCE = """
+read_parquet({glob}, hive_partitioning = false)
+"""
+COLUMNS = (
+    "ts_utc, ts_jst, source, instant_power_w, "
+    "energy_import_kwh, energy_export_kwh, ingested_at, dt"
+)
+# 日次パーティションのファイルがある日は月次ファイルより優先する。
+# どの日を隠すかは行ではなくファイルの一覧で決めるので、0 行の日も月次を隠す。
+# 圧縮中に両方が見えても重複せず、締めた月の1日だけを再アーカイブしても置き換わる。
+DAILY_DAYS = """
+SELECT CAST(regexp_extract(file, '/dt=([0-9]{{4}}-[0-9]{{2}}-[0-9]{{2}})/', 1) AS DATE)
+FROM glob({glob})
+"""
+MERGED_SOURCE = """
+SELECT {columns} FROM {daily}
+UNION ALL
+SELECT {columns} FROM {monthly}
+WHERE dt NOT IN ({daily_days})
+"""
+
+# 列の型と時刻の基準はネイティブの raw_meter_readings と同じ（native_columns）。
+# パーティション列 dt を足す。
+VIEW_SQL = """
+CREATE OR REPLACE VIEW raw_meter_readings AS
+SELECT
+  {columns},
+  dt
+FROM ({source})
+"""
+
+
+def dataset_dir(parquet_base_dir: str) -> Path:
+    return Path(parquet_base_dir) / DATASET
+
+
+def dataset_glob(parquet_base_dir: str) -> str:
+    return (dataset_dir(parquet_base_dir) / PARTITION_GLOB).as_posix()
+
+
+def legacy_dataset_glob(parquet_base_dir: str) -> str:
+    return (dataset_dir(parquet_base_dir) / LEGACY_PARTITION_GLOB).as_posix()
+
+
+def monthly_dir(parquet_base_dir: str) -> Path:
+    return Path(parquet_base_dir) / MONTHLY_DATASET
+
+
+def monthly_glob(parquet_base_dir: str) -> str:
+    return (monthly_dir(parquet_base_dir) / MONTHLY_GLOB).as_posix()
+
+
+def _sql_literal(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def build_source_sql(parquet_base_dir: str) -> str:
+    """ビューの FROM 句を組み立てる。
+
+    参照先はファイルの有無によらず、source 別の日次パーティション・旧形式の
+    日次パーティション・月次ファイルの 3 つで固定する。圧縮で日次が消えて
+    月次が増えても、書き出し済みのビューはそのまま全部の日を読める。
+    hive のキーが違うファイルは1つの glob で読めないので、日次は2つに分ける。
+    """
+    daily_globs = (
+        dataset_glob(parquet_base_dir),
+        legacy_dataset_glob(parquet_base_dir),
+    )
+    daily = (
+        "("
+        + " UNION ALL ".join(
+            f"SELECT {COLUMNS} FROM "
+            + DAILY_SOURCE.format(glob=_sql_literal(glob)).strip()
+            for glob in daily_globs
+        )
+        + ")"
+    )
+    daily_days = " UNION ".join(
+        DAILY_DAYS.format(glob=_sql_literal(glob)).strip() for glob in daily_globs
+    )
+    monthly = MONTHLY_SOURCE.format(
+        glob=_sql_literal(monthly_glob(parquet_base_dir))
+    ).strip()
+    return MERGED_SOURCE.format(
+        columns=COLUMNS, daily=daily, monthly=monthly, daily_days=daily_days
+    )
+
+
+def register_parquet_views(
+    connection: duckdb.DuckDBPyConnection, parquet_base_dir: str, tz: str
+) -> None:
+    """接続にParquetを参照する `raw_meter_readings` ビューを作る。
+
+    データセットには書き込まない（読み取り専用のマウントでも使える）。
+    目印のファイルは run_archive か compact_parquet が置く。
+    """
+    roots = (dataset_dir(parquet_base_dir), monthly_dir(parquet_base_dir))
+    if not any(root.exists() for root in roots):
+        raise FileNotFoundError(
+            f"Parquetデータセットが見つかりません: {parquet_base_dir}"
+        )
+    missing = [path for path in anchor_files(parquet_base_dir) if not path.exists()]
+    if missing:
+        raise FileNotFoundError(
+            "ビューが参照する目印のファイルがありません（run_archive か "
+            f"compact_parquet を一度実行してください）: {missing[0]}"
+        )
+    connection.execute(
+        VIEW_SQL.format(
+            columns=native_columns(tz), source=build_source_sql(parquet_base_dir)
+        )
+    )
+
+
+def connect_parquet(parquet_base_dir: str, tz: str) -> duckdb.DuckDBPyConnection:
+    """Parquetビューを登録したインメモリ接続を返す。"""
+    connection = duckdb.connect()
+    register_parquet_views(connection, parquet_base_dir, tz)
+    return connection
+
+
+def write_views_database(config: Config, path: Path | None = None) -> Path:
+    """ビュー定義だけを持つ DuckDB ファイルを原子的に書き出す。
+
+    Grafana などファイルパスしか指定できない読み取り専用の利用者向け。
+    データは持たないので、夜間バッチでのファイル複製や入れ替えの影響を受けない。
+    """
+    path = path or Path(config.parquet_views_path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    for stale in (tmp_path, Path(f"{tmp_path.as_posix()}.wal")):
+        if stale.exists():
+            stale.unlink()
+    with duckdb.connect(tmp_path.as_posix()) as connection:
+        register_parquet_views(connection, config.parquet_base_dir, config.tz)
+        connection.execute("CHECKPOINT")
+    os.replace(tmp_path, path)
+    return path
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Parquetを参照するビュー専用のDuckDBファイルを作成する"
+    )
+    parser.add_argument(
+        "--output",
+        default=None,
+        help="出力先（未指定ならPARQUET_VIEWS_PATH）",
+    )
+    return parser.parse_args()
+
+
+def main() -> None:
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s"
+    )
+    args = parse_args()
+    config = Config.load()
+    path = write_views_database(config, Path(args.output) if args.output else None)
+    logger.info("ビュー用DuckDBを作成しました: %s", path)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,10 +2,14 @@
 
 from __future__ import annotations
 
+import os
 import shutil
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from datetime import date
 from pathlib import Path
 from typing import Sequence
+from urllib.parse import quote
 
 import pyarrow as pa
 import pyarrow.parquet as pq
@@ -23,6 +27,33 @@ COLUMN_NAMES = (
     "ingested_at",
 )
 
+# Parquet の TIMESTAMPTZ 列を DuckDB の raw_meter_readings の型にそろえる SELECT 句。
+# ts_utc・ingested_at は UTC、ts_jst は TZ の壁時計をタイムゾーンなしで持つ。
+# 暗黙のキャストはセッションのタイムゾーンで壁時計に直すので使わない。
+NATIVE_COLUMNS = """
+  timezone('UTC', ts_utc) AS ts_utc,
+  timezone({tz}, ts_jst) AS ts_jst,
+  source,
+  instant_power_w,
+  energy_import_kwh,
+  energy_export_kwh,
+  timezone('UTC', ingested_at) AS ingested_at
+"""
+
+PART_FILE_NAME = "part-0000.parquet"
+# 0 行になった日に置く 0 行のファイルの source。ファイルがあるだけで
+# その日の日次パーティションが月次ファイルより優先される（parquet_views を参照）
+EMPTY_SOURCE = "__empty__"
+
+DATASET = "raw_meter_readings"
+# compact_parquet が締めた月をまとめたファイル。dt はファイル内の列として持つ
+MONTHLY_DATASET = "raw_meter_readings_monthly"
+# 該当するファイルが無い glob は read_parquet がエラーにするので、ビューが読む
+# 各層に 0 行のファイル（目印）を置いて、参照先をファイルの有無によらず固定する。
+# 目印は書き手（このモジュールと compact_parquet）だけが置き、読み手は確かめるだけ
+ANCHOR_DAY = "0001-01-01"
+ANCHOR_MONTH = "0001-01"
+
 
 def _build_schema(tz: str) -> pa.Schema:
     return pa.schema(
@@ -38,18 +69,57 @@ def _build_schema(tz: str) -> pa.Schema:
     )
 
 
+def native_columns(tz: str) -> str:
+    return NATIVE_COLUMNS.format(tz="'" + tz.replace("'", "''") + "'").strip()
+
+
+def anchor_files(base_dir: str) -> list[Path]:
+    """ビューが参照する各層（source 別・旧形式の日次、月次）の目印のパス。"""
+    anchor_dir = Path(base_dir) / DATASET / f"dt={ANCHOR_DAY}"
+    return [
+        anchor_dir / f"source={EMPTY_SOURCE}" / PART_FILE_NAME,
+        anchor_dir / PART_FILE_NAME,
+        Path(base_dir) / MONTHLY_DATASET / f"month={ANCHOR_MONTH}" / PART_FILE_NAME,
+    ]
+
+
 def _prepare_partition_dirs(base_dir: str, target_date: date) -> tuple[Path, Path]:
-    dataset_dir = Path(base_dir) / "raw_meter_readings"
+    dataset_dir = Path(base_dir) / DATASET
     partition_dir = dataset_dir / f"dt={target_date.isoformat()}"
     tmp_dir = partition_dir.with_name(partition_dir.name + "__tmp__")
     return partition_dir, tmp_dir
 
 
-def _write_table(path: Path, schema: pa.Schema, rows: Sequence[Row], config: Config) -> None:
-    table = pa.Table.from_pylist(
-        [dict(zip(COLUMN_NAMES, row)) for row in rows],
+def _build_table(schema: pa.Schema, rows: Sequence[Row]) -> pa.Table:
+    columns = list(zip(*rows)) if rows else [()] * len(COLUMN_NAMES)
+    return pa.Table.from_arrays(
+        [
+            pa.array(values, type=field.type)
+            for values, field in zip(columns, schema)
+        ],
         schema=schema,
     )
+
+
+def split_by_source(table: pa.Table) -> list[tuple[str, pa.Table]]:
+    """source・ts_utc 順に並べ、source ごとのスライス（コピーなし）に分ける。"""
+    ordered = table.sort_by([("source", "ascending"), ("ts_utc", "ascending")])
+    parts = []
+    offset = 0
+    for item in ordered["source"].value_counts():
+        count = item["counts"].as_py()
+        parts.append((item["values"].as_py(), ordered.slice(offset, count)))
+        offset += count
+    return parts
+
+
+def source_dir_name(source: str) -> str:
+    # DuckDB の hive パーティションは値を URL デコードして読む
+    return f"source={quote(source, safe='')}"
+
+
+def _write_table(path: Path, table: pa.Table, config: Config) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
     pq.write_table(
         table,
         path,
@@ -58,20 +128,96 @@ def _write_table(path: Path, schema: pa.Schema, rows: Sequence[Row], config: Con
     )
 
 
-def write_parquet_dataset(config: Config, target_date: date, rows: Sequence[Row]) -> Path:
-    partition_dir, tmp_dir = _prepare_partition_dirs(config.parquet_base_dir, target_date)
+def write_empty_file(path: Path, schema: pa.Schema) -> None:
+    """0 行の Parquet を原子的に置く。すでにあれば何もしない。"""
+    if path.exists():
+        return
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    pq.write_table(schema.empty_table(), tmp_path)
+    os.replace(tmp_path, path)
+
+
+def write_empty_partition(partition_dir: Path, tz: str) -> Path:
+    """日次パーティションに 0 行のファイルを置き、その日を空として示す。"""
+    path = partition_dir / source_dir_name(EMPTY_SOURCE) / PART_FILE_NAME
+    write_empty_file(path, _build_schema(tz))
+    return path
+
+
+def ensure_anchor_files(base_dir: str, tz: str) -> None:
+    """ビューが参照する各層の glob に、必ず 1 つは一致する 0 行のファイルを置く。"""
+    schema = _build_schema(tz)
+    daily, legacy, monthly = anchor_files(base_dir)
+    write_empty_file(daily, schema)
+    write_empty_file(legacy, schema)
+    write_empty_file(monthly, schema.append(pa.field("dt", pa.date32())))
+
+
+def _swap_partition(partition_dir: Path, tmp_dir: Path) -> None:
+    # 書き終えてから入れ替えるので、読み手から日が消えている時間は rename 2回分だけ
+    old_dir = partition_dir.with_name(partition_dir.name + "__old__")
+    if old_dir.exists():
+        shutil.rmtree(old_dir)
     if partition_dir.exists():
-        shutil.rmtree(partition_dir)
+        partition_dir.rename(old_dir)
+    tmp_dir.rename(partition_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+
+@dataclass
+class ParquetPartition:
+    """書き出した日のパーティションと、書き出しに使った source ごとの Arrow 表。"""
+
+    path: Path
+    tables: dict[str, pa.Table]
+
+
+def write_parquet_dataset(
+    config: Config, target_date: date, rows: Sequence[Row]
+) -> Path:
+    """対象日の行を `dt=YYYY-MM-DD/source=<source>/part-0000.parquet` に書く。"""
+    return write_parquet_partition(config, target_date, rows).path
+
+
+def write_parquet_partition(
+    config: Config, target_date: date, rows: Sequence[Row]
+) -> ParquetPartition:
+    """対象日の Parquet を書き、同じ Arrow 表を DuckDB への投入用に返す。
+
+    日単位で一時ディレクトリに書き終えてから入れ替えるので、読み手からは
+    その日の全 source が同時に切り替わる。
+    """
+    # 書き出す前に目印を置いておく（読み手は目印を作らない）
+    ensure_anchor_files(config.parquet_base_dir, config.tz)
+    partition_dir, tmp_dir = _prepare_partition_dirs(
+        config.parquet_base_dir, target_date
+    )
     if tmp_dir.exists():
         shutil.rmtree(tmp_dir)
     tmp_dir.mkdir(parents=True, exist_ok=True)
 
-    schema = _build_schema(config.tz)
-    output_file = tmp_dir / "part-0000.parquet"
+    table = _build_table(_build_schema(config.tz), rows)
+    parts = split_by_source(table)
     try:
-        _write_table(output_file, schema, rows, config)
-        tmp_dir.rename(partition_dir)
+        # 圧縮と書き込みは GIL を離すので、source ごとにスレッドで並べる
+        with ThreadPoolExecutor(max_workers=max(config.archive_workers, 1)) as pool:
+            futures = [
+                pool.submit(
+                    _write_table,
+                    tmp_dir / source_dir_name(source) / PART_FILE_NAME,
+                    part,
+                    config,
+                )
+                for source, part in parts
+            ]
+            for future in futures:
+                future.result()
+        if not parts:
+            # 空のディレクトリでは月次ファイルに残るその日の行を隠せない
+            write_empty_partition(tmp_dir, config.tz)
+        _swap_partition(partition_dir, tmp_dir)
     except Exception:
         shutil.rmtree(tmp_dir, ignore_errors=True)
         raise
-    return partition_dir
+    return ParquetPartition(path=partition_dir, tables=dict(parts))
@@ -10,9 +10,12 @@ from datetime import date, datetime, timezone
 from pathlib import Path
 
 from .config import Config
-from .duckdb_writer import write_archive
-from .influx_reader import calculate_target_window, fetch_points
-from .parquet_writer import write_parquet_dataset
+from .duckdb_writer import write_archive_days
+from .influx_reader import calculate_target_window, fetch_points_by_source
+from .late_data import detect_late_days
+from .parquet_views import write_views_database
+from .parquet_writer import ParquetPartition, write_parquet_partition
+from .run_metrics import RunMetrics, path_size
 from .transform import transform_points
 
 logger = logging.getLogger(__name__)
@@ -68,9 +71,65 @@ def _swap_duckdb_files(base_path: Path, next_path: Path) -> Path | None:
     return prev_path if prev_path.exists() else None
 
 
+def _write_run_metrics(config: Config, metrics: RunMetrics) -> None:
+    try:
+        prom_path = metrics.write(Path(config.metrics_dir))
+    except OSError as exc:
+        # 計測の書き出し失敗でアーカイブ自体は失敗扱いにしない
+        logger.warning("実行メトリクスを書き出せませんでした: %s", exc)
+        return
+    logger.info("実行メトリクス: %s", prom_path)
+
+
+def _detect_late_days(config: Config, target_date: date) -> list[date]:
+    try:
+        late = detect_late_days(config, target_date)
+    except Exception as exc:
+        # 検出できなくても対象日のアーカイブは続ける
+        logger.warning("遅延到着の検出に失敗しました: %s", exc)
+        return []
+    return sorted(late)
+
+
+def _export_day(
+    config: Config, day: date, metrics: RunMetrics, ingested_at: datetime
+) -> ParquetPartition:
+    """1 日分を InfluxDB から取り出して Parquet パーティションに書く。"""
+    _, start_utc, end_utc = calculate_target_window(config, target_date=day)
+    with metrics.stage("fetch"):
+        points_by_source = fetch_points_by_source(config, start_utc, end_utc)
+    fetched = sum(len(points) for points in points_by_source.values())
+    metrics.rows["fetched"] = metrics.rows.get("fetched", 0) + fetched
+    logger.info("抽出件数 %s: %d (source数: %d)", day, fetched, len(points_by_source))
+
+    with metrics.stage("transform"):
+        rows = [
+            row
+            for points in points_by_source.values()
+            for row in transform_points(
+                points,
+                source_default=config.source_default,
+                tzinfo=config.tzinfo,
+                ingested_at=ingested_at,
+            )
+        ]
+    metrics.rows["transformed"] = metrics.rows.get("transformed", 0) + len(rows)
+
+    with metrics.stage("parquet"):
+        partition = write_parquet_partition(config, day, rows)
+    metrics.bytes["parquet"] = metrics.bytes.get("parquet", 0) + path_size(
+        partition.path
+    )
+    logger.info("Parquet出力先: %s", partition.path)
+    return partition
+
+
 def main() -> None:
-    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s"
+    )
     config = Config.load()
+    metrics = RunMetrics("archive")
 
     try:
         target_date_env = os.environ.get("TARGET_DATE")
@@ -80,41 +139,78 @@ def main() -> None:
         target_date, start_utc, end_utc = calculate_target_window(
             config, target_date=target_date
         )
-        logger.info("ターゲット日 (JST): %s / 期間UTC: %s 〜 %s", target_date, start_utc, end_utc)
+        metrics.target_date = target_date
+        logger.info(
+            "ターゲット日 (JST): %s / 期間UTC: %s 〜 %s",
+            target_date,
+            start_utc,
+            end_utc,
+        )
 
-        points = fetch_points(config, start_utc, end_utc)
-        logger.info("抽出件数: %d", len(points))
+        with metrics.stage("detect_late"):
+            late_days = _detect_late_days(config, target_date)
+        metrics.rows["late_days"] = len(late_days)
 
+        # 遅延到着のあった日も対象日と一緒に書き出し、DuckDB は 1 回で更新する。
+        # Parquet を書き終えてから、同じ Arrow 表をそのまま DuckDB に渡す。
         ingested_at = datetime.now(timezone.utc)
-        rows = transform_points(
-            points,
-            source_default=config.source_default,
-            tzinfo=config.tzinfo,
-            ingested_at=ingested_at,
-        )
-
-        partition_dir = write_parquet_dataset(config, target_date, rows)
-        logger.info("Parquet出力先: %s", partition_dir)
+        partitions = {
+            day: _export_day(config, day, metrics, ingested_at)
+            for day in sorted({*late_days, target_date})
+        }
+        with metrics.stage("views"):
+            views_path = write_views_database(config)
+        logger.info("Parquetビュー: %s", views_path)
 
         duckdb_path = Path(config.duckdb_path)
         next_duckdb_path = _next_duckdb_path(duckdb_path)
-        _prepare_duckdb_copy(duckdb_path, next_duckdb_path)
-        result = write_archive(
-            config,
-            target_date,
-            partition_dir,
-            duckdb_path=next_duckdb_path,
+        with metrics.stage("duckdb_copy"):
+            _prepare_duckdb_copy(duckdb_path, next_duckdb_path)
+        metrics.bytes["duckdb_copy"] = path_size(next_duckdb_path) + path_size(
+            _wal_path(next_duckdb_path)
+        )
+        with metrics.stage("duckdb_load"):
+            result = write_archive_days(
+                config,
+                {day: partition.path for day, partition in partitions.items()},
+                duckdb_path=next_duckdb_path,
+                tables={day: partition.tables for day, partition in partitions.items()},
+            )
+        with metrics.stage("swap"):
+            prev_path = _swap_duckdb_files(duckdb_path, next_duckdb_path)
+        metrics.bytes["duckdb"] = path_size(duckdb_path)
+        metrics.rows["duckdb_inserted"] = result.inserted_rows
+        for verification in result.verifications:
+            stage = f"verify_{verification.tier}"
+            metrics.stages[stage] = (
+                metrics.stages.get(stage, 0.0) + verification.seconds
+            )
+        metrics.details.update(
+            partitions={
+                day.isoformat(): str(partition.path)
+                for day, partition in partitions.items()
+            },
+            late_days=[day.isoformat() for day in sorted(late_days)],
+            duckdb_path=str(duckdb_path),
+            sources=result.sources,
         )
-        prev_path = _swap_duckdb_files(duckdb_path, next_duckdb_path)
         if prev_path:
             logger.info("DuckDB退避先: %s", prev_path)
         if result.deleted_rows is not None:
+            metrics.rows["duckdb_deleted"] = result.deleted_rows
             logger.info("DuckDB削除件数: %d", result.deleted_rows)
-        logger.info("DuckDB挿入件数: %d", result.inserted_rows)
-    except Exception:
+        logger.info(
+            "DuckDB挿入件数: %d (source数: %d)", result.inserted_rows, result.sources
+        )
+    except Exception as exc:
         logger.exception("アーカイブ処理でエラーが発生しました")
+        metrics.finish(success=False, error=f"{type(exc).__name__}: {exc}")
+        _write_run_metrics(config, metrics)
         sys.exit(1)
 
+    metrics.finish(success=True)
+    _write_run_metrics(config, metrics)
+
 
 if __name__ == "__main__":
     main()
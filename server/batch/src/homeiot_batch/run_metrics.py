@@ -0,0 +1,220 @@
+"""バッチ実行のテレメトリを node_exporter の textfile collector 向けに書き出す。
+
+1 回の実行ごとに、段階別の所要時間・件数・書き込みバイト数・ピーク RSS・
+ターゲット日を `<job>.prom`（Prometheus テキスト形式）に、同じ内容の
+実行記録を `<job>.json` に書く。どちらも一時ファイルに書いてから
+`os.replace` するので、scrape 中に書きかけのファイルが読まれることはない。
+
+ジョブ名は `batch_job` ラベルに入れる。`job` は Prometheus が scrape 先
+（node_exporter）のジョブ名を付けるので、同じ名前にすると `exported_job` に
+付け替えられてしまう。
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import resource
+import sys
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, timezone
+from pathlib import Path
+from typing import Iterator
+
+METRIC_PREFIX = "homeiot_batch"
+JOB_LABEL = "batch_job"
+
+
+def peak_rss_bytes() -> int:
+    """このプロセスのピーク RSS。Linux の ru_maxrss は KiB、macOS はバイト。"""
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def path_size(path: Path) -> int:
+    """ファイルならそのサイズ、ディレクトリなら配下のファイルの合計。"""
+
+    if path.is_file():
+        return path.stat().st_size
+    if path.is_dir():
+        return sum(child.stat().st_size for child in path.rglob("*") if child.is_file())
+    return 0
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _write_atomic(path: Path, text: str) -> None:
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    with tmp_path.open("w", encoding="utf-8") as handle:
+        handle.write(text)
+        handle.flush()
+        os.fsync(handle.fileno())
+    os.replace(tmp_path, path)
+
+
+def _previous_success(manifest_path: Path) -> datetime | None:
+    try:
+        previous = json.loads(manifest_path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    value = previous.get("last_success_at")
+    return datetime.fromisoformat(value) if value else None
+
+
+class RunMetrics:
+    """1 回のバッチ実行の計測値を集める。"""
+
+    def __init__(self, job: str) -> None:
+        self.job = job
+        self.started_at = datetime.now(timezone.utc)
+        self.finished_at: datetime | None = None
+        self.target_date: date | None = None
+        self.success = False
+        self.error: str | None = None
+        self.stages: dict[str, float] = {}
+        self.rows: dict[str, int] = {}
+        self.bytes: dict[str, int] = {}
+        self.details: dict[str, object] = {}
+        self.duration = 0.0
+        self.peak_rss = 0
+        self.last_success_at: datetime | None = None
+        self._started = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """ブロックの所要時間を段階 `name` として記録する（例外時も記録する）。"""
+
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + (
+                time.perf_counter() - started
+            )
+
+    def finish(self, *, success: bool, error: str | None = None) -> None:
+        self.success = success
+        self.error = error
+        self.finished_at = datetime.now(timezone.utc)
+        self.duration = time.perf_counter() - self._started
+        self.peak_rss = peak_rss_bytes()
+
+    def _finished(self) -> datetime:
+        if self.finished_at is None:
+            raise RuntimeError("finish() を呼ぶ前の実行は書き出せません")
+        return self.finished_at
+
+    def render_prometheus(self) -> str:
+        finished_at = self._finished()
+        job = _escape(self.job)
+        lines: list[str] = []
+
+        def gauge(name: str, help_text: str, samples: list[tuple[str, float]]) -> None:
+            if not samples:
+                return
+            metric = f"{METRIC_PREFIX}_{name}"
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} gauge")
+            for labels, value in samples:
+                label_text = f'{JOB_LABEL}="{job}"' + (f",{labels}" if labels else "")
+                lines.append(f"{metric}{{{label_text}}} {value!r}")
+
+        gauge(
+            "last_run_timestamp_seconds",
+            "Unix time when the last run finished.",
+            [("", finished_at.timestamp())],
+        )
+        gauge(
+            "last_run_success",
+            "1 if the last run succeeded, 0 otherwise.",
+            [("", float(self.success))],
+        )
+        if self.last_success_at is not None:
+            gauge(
+                "last_success_timestamp_seconds",
+                "Unix time when the last successful run finished.",
+                [("", self.last_success_at.timestamp())],
+            )
+        gauge(
+            "run_duration_seconds",
+            "Wall time of the last run.",
+            [("", self.duration)],
+        )
+        gauge(
+            "stage_duration_seconds",
+            "Wall time of each stage in the last run.",
+            [
+                (f'stage="{_escape(name)}"', value)
+                for name, value in self.stages.items()
+            ],
+        )
+        gauge(
+            "rows",
+            "Row counts handled by the last run.",
+            [
+                (f'kind="{_escape(name)}"', float(value))
+                for name, value in self.rows.items()
+            ],
+        )
+        gauge(
+            "bytes",
+            "Bytes written or copied by the last run.",
+            [
+                (f'kind="{_escape(name)}"', float(value))
+                for name, value in self.bytes.items()
+            ],
+        )
+        gauge(
+            "peak_rss_bytes",
+            "Peak resident set size of the last run.",
+            [("", float(self.peak_rss))],
+        )
+        if self.target_date is not None:
+            gauge(
+                "target_date_info",
+                "Target date (JST) of the last run.",
+                [(f'target_date="{self.target_date.isoformat()}"', 1.0)],
+            )
+        return "\n".join(lines) + "\n"
+
+    def manifest(self) -> dict[str, object]:
+        finished_at = self._finished()
+        return {
+            "job": self.job,
+            "target_date": self.target_date.isoformat() if self.target_date else None,
+            "started_at": self.started_at.isoformat(),
+            "finished_at": finished_at.isoformat(),
+            "success": self.success,
+            "error": self.error,
+            "last_success_at": (
+                self.last_success_at.isoformat() if self.last_success_at else None
+            ),
+            "duration_seconds": self.duration,
+            "stages_seconds": self.stages,
+            "rows": self.rows,
+            "bytes": self.bytes,
+            "peak_rss_bytes": self.peak_rss,
+            **self.details,
+        }
+
+    def write(self, metrics_dir: Path) -> Path:
+        """`<job>.prom` と `<job>.json` を原子的に書き、.prom のパスを返す。"""
+
+        metrics_dir.mkdir(parents=True, exist_ok=True)
+        prom_path = metrics_dir / f"{METRIC_PREFIX}_{self.job}.prom"
+        manifest_path = metrics_dir / f"{METRIC_PREFIX}_{self.job}.json"
+        if self.success:
+            self.last_success_at = self.finished_at
+        else:
+            # 失敗した回でも、最後に成功した時刻は前回の記録から引き継ぐ
+            self.last_success_at = _previous_success(manifest_path)
+        _write_atomic(
+            manifest_path,
+            json.dumps(self.manifest(), ensure_ascii=False, indent=2) + "\n",
+        )
+        _write_atomic(prom_path, self.render_prometheus())
+        return prom_path
@@ -6,7 +6,7 @@ from datetime import datetime, timezone
 from typing import Any, Iterable, List, Tuple
 from zoneinfo import ZoneInfo
 
-Row = Tuple[datetime, datetime, str, float, float, float, datetime]
+Row = Tuple[datetime, datetime, str, float, float | None, float | None, datetime]
 
 
 def _parse_utc(time_value: str) -> datetime:
@@ -17,6 +17,13 @@ def _parse_utc(time_value: str) -> datetime:
     return ts.astimezone(timezone.utc)
 
 
+def _optional_float(value: Any) -> float | None:
+    # 積算電力量は30分ごとにしか送られないため、欠損は0ではなくNULLで残す
+    if value is None:
+        return None
+    return float(value)
+
+
 def transform_point(
     point: dict[str, Any],
     *,
@@ -32,8 +39,8 @@ def transform_point(
         power_value = point.get("instant_power_w")
     instant_power_w = float(power_value or 0.0)
 
-    energy_import_kwh = float(point.get("energy_import_kwh") or 0.0)
-    energy_export_kwh = float(point.get("energy_export_kwh") or 0.0)
+    energy_import_kwh = _optional_float(point.get("energy_import_kwh"))
+    energy_export_kwh = _optional_float(point.get("energy_export_kwh"))
     return (
         ts_utc,
         ts_jst,
@@ -0,0 +1,76 @@
+from datetime import datetime, timedelta, timezone
+
+import duckdb
+import pytest
+from homeiot_batch.config import Config
+from homeiot_batch.transform import transform_points
+
+INGESTED_AT = datetime(2026, 10, 1, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def config(tmp_path):
+    return Config(
+        influx_url="http://influxdb:8086",
+        influx_host="influxdb",
+        influx_port=8086,
+        influx_db="home_energy",
+        influx_token=None,
+        influx_user=None,
+        influx_password=None,
+        duckdb_path=(tmp_path / "duckdb" / "home_energy.duckdb").as_posix(),
+        parquet_base_dir=(tmp_path / "parquet").as_posix(),
+        parquet_compression="zstd",
+        parquet_row_group_size=None,
+        parquet_views_path=(tmp_path / "duckdb" / "views.duckdb").as_posix(),
+        tz="Asia/Tokyo",
+        measurement="smartmeter_power",
+        source_default="meter1",
+        source_tag="meter",
+        archive_workers=2,
+        metrics_dir=(tmp_path / "metrics").as_posix(),
+        full_verify_interval_days=7,
+        late_data_lookback_days=7,
+        coverage_gap_seconds=60.0,
+    )
+
+
+def make_points(start, count, *, source="meter1", step=timedelta(seconds=10)):
+    """`start`（tz 付き）から `step` 間隔の InfluxDB 風のポイント。"""
+    return [
+        {
+            "time": (start + step * i).astimezone(timezone.utc).isoformat(),
+            "source": source,
+            "power_w": 100.0 + i,
+            "energy_import_kwh": 1000.0 + i / 100,
+        }
+        for i in range(count)
+    ]
+
+
+@pytest.fixture
+def make_rows(config):
+    """`make_points` を変換した行（`config` の TZ で ts_jst を付ける）。"""
+
+    def build(start, count, **kwargs):
+        return transform_points(
+            make_points(start, count, **kwargs),
+            source_default=config.source_default,
+            tzinfo=config.tzinfo,
+            ingested_at=INGESTED_AT,
+        )
+
+    return build
+
+
+@pytest.fixture
+def jst_session(monkeypatch):
+    """バッチのコンテナと同じく、書き込み側のセッションを TZ=Asia/Tokyo にする。"""
+    connect = duckdb.connect
+
+    def connect_in_jst(*args, **kwargs):
+        connection = connect(*args, **kwargs)
+        connection.execute("SET GLOBAL TimeZone = 'Asia/Tokyo'")
+        return connection
+
+    monkeypatch.setattr(duckdb, "connect", connect_in_jst)
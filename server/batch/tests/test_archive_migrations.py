@@ -0,0 +1,115 @@
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from zoneinfo import ZoneInfo
+
+import duckdb
+from homeiot_batch.archive_migrations import UTC_MIGRATION, apply_migrations
+from homeiot_batch.duckdb_writer import DDL, ROLLUP_DDL, write_archive
+from homeiot_batch.parquet_views import connect_parquet
+from homeiot_batch.parquet_writer import write_parquet_partition
+
+JST = ZoneInfo("Asia/Tokyo")
+DAY = date(2026, 9, 30)
+COLUMNS = (
+    "ts_utc, ts_jst, source, instant_power_w, "
+    "energy_import_kwh, energy_export_kwh, ingested_at"
+)
+# 以前のバッチの投入（TIMESTAMPTZ を暗黙のキャストでセッションの壁時計にする）
+LEGACY_INSERT = f"""
+INSERT INTO raw_meter_readings ({COLUMNS})
+SELECT {COLUMNS} FROM read_parquet(?)
+"""
+
+
+def _start(day):
+    return datetime(day.year, day.month, day.day, 0, 0, 5, tzinfo=JST)
+
+
+def _rows(connection, where=""):
+    return connection.execute(
+        f"SELECT {COLUMNS} FROM raw_meter_readings {where} ORDER BY ALL"
+    ).fetchall()
+
+
+def test_archive_written_by_the_old_batch_is_migrated_once(
+    config, make_rows, jst_session
+):
+    old_days = [DAY - timedelta(days=2), DAY - timedelta(days=1)]
+    Path(config.duckdb_path).parent.mkdir(parents=True)
+    with duckdb.connect(config.duckdb_path) as connection:
+        connection.execute(DDL)
+        for day in old_days:
+            partition = write_parquet_partition(config, day, make_rows(_start(day), 3))
+            connection.execute(
+                LEGACY_INSERT, [(partition.path / "*" / "*.parquet").as_posix()]
+            )
+        # 以前の行は ts_utc が JST の壁時計なので ts_jst と等しい
+        assert connection.execute(
+            "SELECT bool_and(ts_utc = ts_jst) FROM raw_meter_readings"
+        ).fetchone() == (True,)
+
+    partition = write_parquet_partition(config, DAY, make_rows(_start(DAY), 3))
+    write_archive(config, DAY, partition.path)
+
+    views = connect_parquet(config.parquet_base_dir, config.tz)
+    with duckdb.connect(config.duckdb_path, read_only=True) as connection:
+        migrated = _rows(connection)
+        applied = connection.execute("SELECT name FROM archive_migrations").fetchall()
+    assert migrated == _rows(views)
+    assert migrated[0][:2] == (
+        datetime(2026, 9, 27, 15, 0, 5),
+        datetime(2026, 9, 28, 0, 0, 5),
+    )
+    assert applied == [(UTC_MIGRATION,)]
+
+    # 2 回目は何もしない（新しい行は ts_utc と ts_jst が違うので対象外でもある）
+    write_archive(config, DAY, partition.path)
+    with duckdb.connect(config.duckdb_path) as connection:
+        assert _rows(connection) == migrated
+        assert apply_migrations(connection, config.tz) == []
+
+
+def test_rows_stored_as_wall_clock_are_moved_to_utc_once(
+    config, make_rows, jst_session
+):
+    # 以前のバッチが入れた行: ts_utc・ingested_at が JST の壁時計
+    old_day = DAY - timedelta(days=1)
+    wall = datetime(2026, 9, 29, 0, 0, 5)
+    Path(config.duckdb_path).parent.mkdir(parents=True)
+    with duckdb.connect(config.duckdb_path) as connection:
+        connection.execute(DDL)
+        connection.execute(ROLLUP_DDL)
+        connection.execute(
+            "INSERT INTO raw_meter_readings VALUES (?, ?, 'meter1', 1, 2, NULL, ?)",
+            [wall, wall, datetime(2026, 9, 30, 3, 0)],
+        )
+        connection.execute(
+            "INSERT INTO daily_source_rollups "
+            "VALUES (?, 'meter1', 1, 1, 1, 1, 0, ?, ?)",
+            [old_day, wall, wall],
+        )
+    start = datetime(2026, 9, 30, 0, 0, 5, tzinfo=JST)
+    for _ in range(2):
+        partition = write_parquet_partition(config, DAY, make_rows(start, 2))
+        write_archive(config, DAY, partition.path)
+
+    with duckdb.connect(config.duckdb_path, read_only=True) as connection:
+        migrated = connection.execute(
+            "SELECT ts_utc, ts_jst, ingested_at FROM raw_meter_readings "
+            "WHERE CAST(ts_jst AS DATE) = ?",
+            [old_day],
+        ).fetchone()
+        rollup = connection.execute(
+            "SELECT first_ts_utc, last_ts_utc FROM daily_source_rollups WHERE dt = ?",
+            [old_day],
+        ).fetchone()
+        applied = connection.execute(
+            "SELECT COUNT(*) FROM archive_migrations"
+        ).fetchone()[0]
+    assert migrated == (
+        datetime(2026, 9, 28, 15, 0, 5),
+        wall,
+        datetime(2026, 9, 29, 18, 0),
+    )
+    assert rollup == (datetime(2026, 9, 28, 15, 0, 5),) * 2
+    assert applied == 1
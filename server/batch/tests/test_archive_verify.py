@@ -0,0 +1,110 @@
+from datetime import date, datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+import duckdb
+import pytest
+from homeiot_batch.archive_verify import (
+    VERIFICATIONS_DDL,
+    full_check_due,
+    verify_archive,
+    verify_full,
+    verify_target_date,
+)
+from homeiot_batch.duckdb_writer import source_globs, write_archive_days
+from homeiot_batch.parquet_writer import write_parquet_partition
+
+JST = ZoneInfo("Asia/Tokyo")
+DAY = date(2026, 9, 29)
+START = datetime(2026, 9, 29, 0, 0, 5, tzinfo=JST)
+
+
+@pytest.fixture
+def archived(config, make_rows):
+    rows = [*make_rows(START, 4, source="a"), *make_rows(START, 3, source="b")]
+    partition = write_parquet_partition(config, DAY, rows)
+    write_archive_days(config, {DAY: partition.path})
+    return partition
+
+
+def _globs(partition):
+    return list(source_globs(partition.path).values())
+
+
+def test_day_tier_matches_the_parquet_files_and_the_arrow_tables(config, archived):
+    with duckdb.connect(config.duckdb_path) as connection:
+        from_files = verify_target_date(connection, DAY, _globs(archived), tz=config.tz)
+        from_arrow = verify_target_date(
+            connection,
+            DAY,
+            _globs(archived),
+            list(archived.tables.values()),
+            tz=config.tz,
+        )
+
+    assert (from_files.tier, from_files.rows) == ("day", 7)
+    assert (from_arrow.tier, from_arrow.rows) == ("day", 7)
+
+
+def test_day_tier_detects_a_changed_value(config, archived):
+    with duckdb.connect(config.duckdb_path) as connection:
+        connection.execute(
+            "UPDATE raw_meter_readings SET instant_power_w = 0 "
+            "WHERE source = 'a' AND instant_power_w = 101"
+        )
+        with pytest.raises(RuntimeError, match="checksum"):
+            verify_target_date(connection, DAY, _globs(archived), tz=config.tz)
+
+
+def test_day_tier_checks_the_file_footers_against_the_arrow_tables(config, archived):
+    tables = list(archived.tables.values())
+    with duckdb.connect(config.duckdb_path) as connection:
+        with pytest.raises(RuntimeError, match="行数"):
+            verify_target_date(
+                connection, DAY, _globs(archived)[:1], tables, tz=config.tz
+            )
+
+
+def test_full_tier_detects_rollups_that_disagree_with_the_rows(config, archived):
+    with duckdb.connect(config.duckdb_path) as connection:
+        assert verify_full(connection).rows == 7
+        connection.execute("DELETE FROM raw_meter_readings WHERE source = 'b'")
+        with pytest.raises(RuntimeError, match="b: rollup=3 rows=0"):
+            verify_full(connection)
+
+
+def test_full_tier_runs_only_when_due(config, archived):
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    with duckdb.connect(config.duckdb_path) as connection:
+        connection.execute("DELETE FROM archive_verifications")
+        assert full_check_due(connection, 7)
+        assert full_check_due(connection, 0)
+
+        tiers = [
+            result.tier
+            for result in verify_archive(
+                connection,
+                {DAY: _globs(archived)},
+                tz=config.tz,
+                full_interval_days=7,
+            )
+        ]
+        assert tiers == ["day", "full"]
+        assert not full_check_due(connection, 7)
+        assert full_check_due(connection, 0)
+
+        connection.execute(
+            "UPDATE archive_verifications SET verified_at = ? WHERE tier = 'full'",
+            [now - timedelta(days=7) + timedelta(minutes=30)],
+        )
+        # 毎日同じ時刻に動くので、数分早くても予定日とみなす
+        assert full_check_due(connection, 7)
+        recorded = connection.execute(
+            "SELECT tier, target_date, rows FROM archive_verifications ORDER BY tier"
+        ).fetchall()
+    assert recorded == [("day", DAY, 7), ("full", DAY, 7)]
+
+
+def test_verifications_table_is_created_on_demand(tmp_path):
+    with duckdb.connect((tmp_path / "empty.duckdb").as_posix()) as connection:
+        connection.execute(VERIFICATIONS_DDL)
+        assert full_check_due(connection, 7)
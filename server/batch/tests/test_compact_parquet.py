@@ -0,0 +1,114 @@
+import os
+import shutil
+from datetime import date, datetime
+from pathlib import Path
+from zoneinfo import ZoneInfo
+
+import duckdb
+from homeiot_batch import compact_parquet
+from homeiot_batch.compact_parquet import compact_closed_months, daily_partitions
+from homeiot_batch.parquet_views import write_views_database
+from homeiot_batch.parquet_writer import ensure_anchor_files, write_parquet_partition
+
+JST = ZoneInfo("Asia/Tokyo")
+NOW = datetime(2026, 10, 5, 3, 0, tzinfo=JST)
+DAYS = (date(2026, 9, 29), date(2026, 9, 30), date(2026, 10, 1))
+
+
+def _archive(config, make_rows, day, count):
+    start = datetime(day.year, day.month, day.day, 0, 0, 5, tzinfo=JST)
+    return write_parquet_partition(config, day, make_rows(start, count))
+
+
+def _counts(connection):
+    return dict(
+        connection.execute(
+            "SELECT dt, COUNT(*) FROM raw_meter_readings GROUP BY dt ORDER BY dt"
+        ).fetchall()
+    )
+
+
+def test_views_written_before_compaction_read_every_day_across_the_swap(
+    config, make_rows, monkeypatch
+):
+    for day, count in zip(DAYS, (3, 4, 5)):
+        _archive(config, make_rows, day, count)
+    views_path = write_views_database(config)
+    expected = {DAYS[0]: 3, DAYS[1]: 4, DAYS[2]: 5}
+
+    with duckdb.connect(views_path.as_posix(), read_only=True) as old_views:
+        assert _counts(old_views) == expected
+        seen = []
+        rmtree = shutil.rmtree
+
+        def checked_rmtree(path, *args, **kwargs):
+            # 月次ファイルに入れ替えた後、日次を消す前後でも全部の日が見える
+            seen.append(_counts(old_views))
+            rmtree(path, *args, **kwargs)
+            seen.append(_counts(old_views))
+
+        monkeypatch.setattr(compact_parquet.shutil, "rmtree", checked_rmtree)
+        results = compact_closed_months(config, now=NOW)
+        monkeypatch.undo()
+
+        assert [(r.month, r.merged_days, r.rows, r.removed_days) for r in results] == [
+            ("2026-09", 2, 7, 2)
+        ]
+        assert seen == [expected] * 4
+        assert _counts(old_views) == expected
+    assert list(daily_partitions(config.parquet_base_dir)) == ["2026-10"]
+    with duckdb.connect(views_path.as_posix(), read_only=True) as new_views:
+        assert _counts(new_views) == expected
+
+
+def test_day_rearchived_as_empty_hides_its_monthly_rows(config, make_rows):
+    for day, count in zip(DAYS[:2], (3, 4)):
+        _archive(config, make_rows, day, count)
+    compact_closed_months(config, now=NOW)
+    views_path = write_views_database(config)
+
+    partition = _archive(config, make_rows, DAYS[0], 0)
+
+    assert partition.tables == {}
+    with duckdb.connect(views_path.as_posix(), read_only=True) as views:
+        assert _counts(views) == {DAYS[1]: 4}
+    results = compact_closed_months(config, now=NOW)
+    assert [(r.month, r.merged_days, r.rows) for r in results] == [("2026-09", 1, 4)]
+    assert not Path(partition.path).exists()
+    with duckdb.connect(views_path.as_posix(), read_only=True) as views:
+        assert _counts(views) == {DAYS[1]: 4}
+
+
+def test_views_over_an_empty_dataset_return_no_rows(config):
+    ensure_anchor_files(config.parquet_base_dir, config.tz)
+    views_path = write_views_database(config)
+
+    with duckdb.connect(views_path.as_posix(), read_only=True) as views:
+        assert _counts(views) == {}
+    assert daily_partitions(config.parquet_base_dir) == {}
+
+
+def test_day_rearchived_during_compaction_is_kept(config, make_rows, monkeypatch):
+    for day, count in zip(DAYS[:2], (3, 4)):
+        _archive(config, make_rows, day, count)
+    views_path = write_views_database(config)
+    replace = os.replace
+
+    def rearchive_after_swap(src, dst):
+        replace(src, dst)
+        if str(dst).endswith(compact_parquet.MONTHLY_FILE_NAME):
+            # 月次ファイルを入れ替えた直後、日次を外す前に 1 日が書き直された
+            _archive(config, make_rows, DAYS[0], 6)
+
+    monkeypatch.setattr(compact_parquet.os, "replace", rearchive_after_swap)
+    results = compact_closed_months(config, now=NOW)
+    monkeypatch.undo()
+
+    assert [(r.merged_days, r.rows, r.removed_days) for r in results] == [(2, 7, 1)]
+    assert [d.name for d in daily_partitions(config.parquet_base_dir)["2026-09"]] == [
+        "dt=2026-09-29"
+    ]
+    dataset = Path(config.parquet_base_dir, "raw_meter_readings")
+    assert not list(dataset.glob(".*"))
+    with duckdb.connect(views_path.as_posix(), read_only=True) as views:
+        assert _counts(views) == {DAYS[0]: 6, DAYS[1]: 4}
@@ -0,0 +1,90 @@
+from datetime import date, datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import duckdb
+from homeiot_batch.coverage import backfill_coverage
+from homeiot_batch.duckdb_writer import write_archive_days
+from homeiot_batch.parquet_writer import write_parquet_partition
+
+JST = ZoneInfo("Asia/Tokyo")
+DAY = date(2026, 9, 29)
+
+
+def _wall(hour, minute, second):
+    return datetime(2026, 9, 29, hour, minute, second)
+
+
+def _coverage(connection, kind):
+    return connection.execute(
+        "SELECT source, start_jst, end_jst, seconds, samples "
+        "FROM daily_source_coverage WHERE kind = ? ORDER BY ALL",
+        [kind],
+    ).fetchall()
+
+
+def _archive(config, make_rows):
+    # 0:00:05 から 3 件、1:30 から 5 件（間隔 10 秒）。gap は 60 秒
+    rows = [
+        *make_rows(datetime(2026, 9, 29, 0, 0, 5, tzinfo=JST), 3),
+        *make_rows(datetime(2026, 9, 29, 1, 30, tzinfo=JST), 5),
+        *make_rows(datetime(2026, 9, 29, 12, tzinfo=JST), 1, source="b"),
+    ]
+    partition = write_parquet_partition(config, DAY, rows)
+    write_archive_days(config, {DAY: partition.path})
+
+
+def test_ranges_and_gaps_follow_the_gap_threshold(config, make_rows):
+    _archive(config, make_rows)
+
+    with duckdb.connect(config.duckdb_path, read_only=True) as connection:
+        ranges = _coverage(connection, "range")
+        gaps = _coverage(connection, "gap")
+
+    assert ranges == [
+        ("b", _wall(12, 0, 0), _wall(12, 0, 0), 0.0, 1),
+        ("meter1", _wall(0, 0, 5), _wall(0, 0, 25), 20.0, 3),
+        ("meter1", _wall(1, 30, 0), _wall(1, 30, 40), 40.0, 5),
+    ]
+    # 日の始まりから 5 秒後の最初の点は gap にしない
+    next_day = datetime(2026, 9, 30)
+    assert gaps == [
+        ("b", datetime(2026, 9, 29), _wall(12, 0, 0), 43200.0, 0),
+        ("b", _wall(12, 0, 0), next_day, 43200.0, 0),
+        ("meter1", _wall(0, 0, 25), _wall(1, 30, 0), 5375.0, 0),
+        ("meter1", _wall(1, 30, 40), next_day, 80960.0, 0),
+    ]
+
+
+def test_every_hour_has_a_row(config, make_rows):
+    _archive(config, make_rows)
+
+    with duckdb.connect(config.duckdb_path, read_only=True) as connection:
+        hours = [
+            (start, samples)
+            for source, start, _, _, samples in _coverage(connection, "hour")
+            if source == "meter1"
+        ]
+
+    start = datetime(2026, 9, 29)
+    assert [hour for hour, _ in hours] == [
+        start + timedelta(hours=h) for h in range(24)
+    ]
+    assert [samples for _, samples in hours] == [3, 5] + [0] * 22
+
+
+def test_backfill_only_builds_missing_days(config, make_rows):
+    _archive(config, make_rows)
+
+    with duckdb.connect(config.duckdb_path) as connection:
+        before = connection.execute(
+            "SELECT * FROM daily_source_coverage ORDER BY ALL"
+        ).fetchall()
+        assert backfill_coverage(connection, gap_seconds=60) == 0
+
+        connection.execute("DELETE FROM daily_source_coverage WHERE source = 'b'")
+        assert backfill_coverage(connection, gap_seconds=60) == 1
+        after = connection.execute(
+            "SELECT * FROM daily_source_coverage ORDER BY ALL"
+        ).fetchall()
+
+    assert after == before
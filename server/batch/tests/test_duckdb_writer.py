@@ -0,0 +1,170 @@
+from datetime import date, datetime
+from pathlib import Path
+from zoneinfo import ZoneInfo
+
+import duckdb
+import pyarrow.parquet as pq
+import pytest
+from homeiot_batch import duckdb_writer
+from homeiot_batch.duckdb_writer import source_globs, write_archive_days
+from homeiot_batch.parquet_writer import (
+    _build_schema,
+    _build_table,
+    split_by_source,
+    write_parquet_partition,
+)
+
+JST = ZoneInfo("Asia/Tokyo")
+DAY = date(2026, 9, 29)
+START = datetime(2026, 9, 29, 0, 0, 5, tzinfo=JST)
+
+
+def _native_rows(path):
+    with duckdb.connect(path.as_posix(), read_only=True) as connection:
+        return connection.execute(
+            "SELECT * EXCLUDE (ingested_at) FROM raw_meter_readings ORDER BY ALL"
+        ).fetchall()
+
+
+def _rows_by_source(config):
+    with duckdb.connect(config.duckdb_path, read_only=True) as connection:
+        raw = connection.execute(
+            "SELECT source, COUNT(*) FROM raw_meter_readings GROUP BY ALL ORDER BY 1"
+        ).fetchall()
+        rollups = connection.execute(
+            "SELECT source, samples FROM daily_source_rollups ORDER BY 1"
+        ).fetchall()
+    return raw, rollups
+
+
+def test_rows_are_split_by_source_in_time_order(config, make_rows):
+    rows = [
+        *make_rows(START, 2, source="meter1"),
+        *make_rows(START, 3, source="meter/2"),
+    ]
+    table = _build_table(_build_schema(config.tz), list(reversed(rows)))
+
+    parts = split_by_source(table)
+
+    assert [(source, part.num_rows) for source, part in parts] == [
+        ("meter/2", 3),
+        ("meter1", 2),
+    ]
+    for _, part in parts:
+        times = part.column("ts_utc").to_pylist()
+        assert times == sorted(times)
+
+
+def test_partition_has_one_directory_per_source(config, make_rows):
+    rows = [
+        *make_rows(START, 3, source="meter/2"),
+        *make_rows(START, 2, source="meter1"),
+    ]
+
+    partition = write_parquet_partition(config, DAY, rows)
+
+    assert sorted(p.name for p in Path(partition.path).iterdir()) == [
+        "source=meter%2F2",
+        "source=meter1",
+    ]
+    assert sorted(source_globs(partition.path)) == ["meter/2", "meter1"]
+    assert {source: t.num_rows for source, t in partition.tables.items()} == {
+        "meter/2": 3,
+        "meter1": 2,
+    }
+
+
+def test_sources_load_in_parallel_and_stale_sources_are_removed(config, make_rows):
+    rows = [*make_rows(START, 3, source="a"), *make_rows(START, 4, source="b")]
+    partition = write_parquet_partition(config, DAY, rows)
+    first = write_archive_days(config, {DAY: partition.path})
+
+    assert (first.inserted_rows, first.sources) == (7, 2)
+    assert _rows_by_source(config) == ([("a", 3), ("b", 4)], [("a", 3), ("b", 4)])
+
+    # 再アーカイブで消えた source は、行も日次集計も消える
+    partition = write_parquet_partition(config, DAY, make_rows(START, 5, source="b"))
+    second = write_archive_days(
+        config, {DAY: partition.path}, tables={DAY: partition.tables}
+    )
+
+    assert (second.inserted_rows, second.sources) == (5, 1)
+    assert _rows_by_source(config) == ([("b", 5)], [("b", 5)])
+
+
+def test_day_rearchived_as_empty_clears_the_native_rows(config, make_rows):
+    partition = write_parquet_partition(config, DAY, make_rows(START, 3))
+    write_archive_days(config, {DAY: partition.path})
+
+    partition = write_parquet_partition(config, DAY, [])
+    result = write_archive_days(config, {DAY: partition.path})
+
+    assert source_globs(partition.path) == {}
+    assert (result.inserted_rows, result.sources) == (0, 0)
+    assert _rows_by_source(config) == ([], [])
+
+
+def test_arrow_handoff_is_what_was_written_to_parquet(
+    config, make_rows, monkeypatch, tmp_path
+):
+    rows = [*make_rows(START, 3, source="a"), *make_rows(START, 4, source="b")]
+    partition = write_parquet_partition(config, DAY, rows)
+    globs = source_globs(partition.path)
+
+    for source, table in partition.tables.items():
+        assert pq.read_table(Path(globs[source]).parent).equals(table)
+
+    from_files = tmp_path / "files.duckdb"
+    write_archive_days(config, {DAY: partition.path}, from_files)
+
+    # Arrow 表を渡したときは Parquet から投入しない
+    def unexpected(*args):
+        raise AssertionError("Parquet を読み直しました")
+
+    monkeypatch.setattr(duckdb_writer, "_insert_from_parquet", unexpected)
+    from_arrow = tmp_path / "arrow.duckdb"
+    write_archive_days(
+        config, {DAY: partition.path}, from_arrow, tables={DAY: partition.tables}
+    )
+
+    assert _native_rows(from_arrow) == _native_rows(from_files)
+
+
+def test_arrow_handoff_that_differs_from_the_files_fails_verification(
+    config, make_rows
+):
+    partition = write_parquet_partition(config, DAY, make_rows(START, 4, source="a"))
+    tables = {DAY: {"a": partition.tables["a"].slice(0, 3)}}
+
+    with pytest.raises(RuntimeError, match="Parquet の行数が一致しません"):
+        write_archive_days(config, {DAY: partition.path}, tables=tables)
+
+
+def test_rollups_and_coverage_are_built_once_per_day(config, make_rows, monkeypatch):
+    next_day = date(2026, 9, 30)
+    partitions = {}
+    for day, start in ((DAY, START), (next_day, datetime(2026, 9, 30, tzinfo=JST))):
+        rows = [*make_rows(start, 3, source="a"), *make_rows(start, 2, source="b")]
+        partitions[day] = write_parquet_partition(config, day, rows).path
+    refreshed = []
+    refresh_day = duckdb_writer._refresh_day
+
+    def counting_refresh(connection, config, day):
+        refreshed.append(day)
+        refresh_day(connection, config, day)
+
+    monkeypatch.setattr(duckdb_writer, "_refresh_day", counting_refresh)
+    write_archive_days(config, partitions)
+
+    assert sorted(refreshed) == [DAY, next_day]
+    with duckdb.connect(config.duckdb_path, read_only=True) as connection:
+        rollups = connection.execute(
+            "SELECT dt, source, samples FROM daily_source_rollups ORDER BY ALL"
+        ).fetchall()
+        coverage = connection.execute(
+            "SELECT dt, source, SUM(samples) FROM daily_source_coverage "
+            "WHERE kind = 'hour' GROUP BY ALL ORDER BY ALL"
+        ).fetchall()
+    expected = [(d, s, n) for d in (DAY, next_day) for s, n in (("a", 3), ("b", 2))]
+    assert rollups == expected
+    assert coverage == expected
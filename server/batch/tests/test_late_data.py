@@ -0,0 +1,176 @@
+import re
+from datetime import date, datetime, time, timedelta, timezone
+from pathlib import Path
+from zoneinfo import ZoneInfo
+
+import duckdb
+import pytest
+from homeiot_batch import influx_reader, run_archive
+from homeiot_batch.late_data import (
+    archived_daily_counts,
+    detect_late_days,
+    find_late_days,
+)
+from influxdb.resultset import ResultSet
+
+JST = ZoneInfo("Asia/Tokyo")
+DAY1 = date(2026, 9, 28)
+DAY2 = date(2026, 9, 29)
+FIELDS = ["power_w", "instant_power_w", "energy_import_kwh", "energy_export_kwh"]
+WINDOW = re.compile(r"time >= '([^']+)' AND time < '([^']+)'")
+
+
+class FakeInflux:
+    """`influx_reader._query` の代わりに、保持したポイントで問い合わせに答える。"""
+
+    def __init__(self):
+        self.points: dict[str, list[dict]] = {}
+        self.queries: list[str] = []
+
+    def add(self, source, day, count, *, offset=0):
+        start = datetime.combine(day, time(), tzinfo=JST)
+        for i in range(offset, offset + count):
+            self.points.setdefault(source, []).append(
+                {
+                    "time": start + timedelta(seconds=10 * i),
+                    "power_w": 100.0 + i,
+                    "energy_import_kwh": 1000.0 + i / 100,
+                }
+            )
+
+    def query(self, config, query):
+        self.queries.append(query)
+        start, end = (
+            datetime.fromisoformat(value.replace("Z", "+00:00"))
+            for value in WINDOW.search(query).groups()
+        )
+        series = []
+        for source, points in sorted(self.points.items()):
+            selected = sorted(
+                (p for p in points if start <= p["time"] < end),
+                key=lambda p: p["time"],
+            )
+            if "COUNT(*)" in query:
+                values = self._daily_counts(selected, config.tzinfo)
+                columns = ["time", *(f"count_{field}" for field in FIELDS)]
+            else:
+                values = [
+                    [
+                        p["time"]
+                        .astimezone(timezone.utc)
+                        .strftime("%Y-%m-%dT%H:%M:%SZ"),
+                        *(p.get(field) for field in FIELDS),
+                    ]
+                    for p in selected
+                ]
+                columns = ["time", *FIELDS]
+            series.append(
+                {
+                    "name": config.measurement,
+                    "tags": {config.source_tag: source},
+                    "columns": columns,
+                    "values": values,
+                }
+            )
+        return ResultSet({"series": series})
+
+    @staticmethod
+    def _daily_counts(points, tzinfo):
+        counts: dict[date, list[int]] = {}
+        for point in points:
+            day = point["time"].astimezone(tzinfo).date()
+            per_field = counts.setdefault(day, [0] * len(FIELDS))
+            for index, field in enumerate(FIELDS):
+                per_field[index] += point.get(field) is not None
+        return [
+            [datetime.combine(day, time(), tzinfo=tzinfo).isoformat(), *per_field]
+            for day, per_field in sorted(counts.items())
+        ]
+
+
+@pytest.fixture
+def influx(monkeypatch):
+    fake = FakeInflux()
+    monkeypatch.setattr(influx_reader, "_query", fake.query)
+    return fake
+
+
+@pytest.fixture
+def archive(config, monkeypatch):
+    """`TARGET_DATE` の日を `run_archive.main` でアーカイブする。"""
+    monkeypatch.setattr(run_archive.Config, "load", staticmethod(lambda: config))
+
+    def run(target_date):
+        monkeypatch.setenv("TARGET_DATE", target_date.isoformat())
+        run_archive.main()
+
+    return run
+
+
+def _archived(config):
+    return archived_daily_counts(Path(config.duckdb_path), DAY1, DAY2)
+
+
+def test_find_late_days_only_reports_sources_that_grew():
+    influx_counts = {(DAY1, "a"): 5, (DAY1, "b"): 2, (DAY2, "a"): 1}
+    archived = {(DAY1, "a"): 5, (DAY1, "b"): 3}
+
+    assert find_late_days(influx_counts, archived) == {DAY2: ["a"]}
+    assert find_late_days({(DAY1, "a"): 6, (DAY1, "b"): 4}, archived) == {
+        DAY1: ["a", "b"]
+    }
+
+
+def test_archived_daily_counts_without_a_database(config):
+    assert _archived(config) == {}
+
+
+def test_daily_counts_group_by_local_day(config, influx):
+    # JST 0:00 直前と直後のポイントは別の日に数える
+    influx.add("a", DAY1, 3)
+    influx.add("a", DAY2, 2, offset=-1)
+    _, start_utc, _ = influx_reader.calculate_target_window(config, target_date=DAY1)
+    _, _, end_utc = influx_reader.calculate_target_window(config, target_date=DAY2)
+
+    counts = influx_reader.fetch_daily_counts(config, start_utc, end_utc)
+
+    assert counts == {(DAY1, "a"): 4, (DAY2, "a"): 1}
+    assert "tz('Asia/Tokyo')" in influx.queries[-1]
+
+
+def test_late_points_are_re_archived_with_the_next_run(config, influx, archive):
+    influx.add("a", DAY1, 4)
+    influx.add("b", DAY1, 2)
+    archive(DAY1)
+    assert _archived(config) == {(DAY1, "a"): 4, (DAY1, "b"): 2}
+    assert detect_late_days(config, DAY2) == {}
+
+    # 前日分に遅れて届いた "b" と、新しい "c" があった
+    influx.add("b", DAY1, 3, offset=2)
+    influx.add("c", DAY1, 1)
+    influx.add("a", DAY2, 2)
+    assert detect_late_days(config, DAY2) == {DAY1: ["b", "c"]}
+
+    archive(DAY2)
+
+    assert _archived(config) == {
+        (DAY1, "a"): 4,
+        (DAY1, "b"): 5,
+        (DAY1, "c"): 1,
+        (DAY2, "a"): 2,
+    }
+    assert detect_late_days(config, DAY2 + timedelta(days=1)) == {}
+    with duckdb.connect(config.parquet_views_path, read_only=True) as connection:
+        rows = connection.execute(
+            "SELECT dt, source, COUNT(*) FROM raw_meter_readings "
+            "GROUP BY ALL ORDER BY ALL"
+        ).fetchall()
+    assert rows == [(DAY1, "a", 4), (DAY1, "b", 5), (DAY1, "c", 1), (DAY2, "a", 2)]
+
+
+def test_lookback_zero_skips_detection(config, influx):
+    influx.add("a", DAY1, 1)
+    config.late_data_lookback_days = 0
+
+    assert detect_late_days(config, DAY2) == {}
+    assert influx.queries == []
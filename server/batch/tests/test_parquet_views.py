@@ -0,0 +1,86 @@
+from datetime import date, datetime
+from pathlib import Path
+from zoneinfo import ZoneInfo
+
+import duckdb
+import pytest
+from homeiot_batch import duckdb_writer
+from homeiot_batch.duckdb_writer import write_archive
+from homeiot_batch.parquet_views import connect_parquet
+from homeiot_batch.parquet_writer import anchor_files, write_parquet_partition
+
+JST = ZoneInfo("Asia/Tokyo")
+DAY = date(2026, 9, 30)
+COLUMNS = (
+    "ts_utc, ts_jst, source, instant_power_w, "
+    "energy_import_kwh, energy_export_kwh, ingested_at"
+)
+
+
+def _rows(connection, where=""):
+    return connection.execute(
+        f"SELECT {COLUMNS} FROM raw_meter_readings {where} ORDER BY source, ts_utc"
+    ).fetchall()
+
+
+@pytest.mark.parametrize("handoff", ["parquet", "arrow"])
+def test_native_table_and_views_agree_on_the_same_day(
+    config, make_rows, jst_session, handoff
+):
+    # JST 0:00 をまたぐ点を含め、ts_utc が前日（UTC）になる行も比べる
+    start = datetime(2026, 9, 30, 0, 0, 5, tzinfo=JST)
+    partition = write_parquet_partition(config, DAY, make_rows(start, 6))
+    if handoff == "arrow":
+        duckdb_writer.write_archive_days(
+            config, {DAY: partition.path}, tables={DAY: partition.tables}
+        )
+    else:
+        write_archive(config, DAY, partition.path)
+
+    with duckdb.connect(config.duckdb_path, read_only=True) as native:
+        native.execute("SET TimeZone = 'UTC'")
+        archived = _rows(native)
+        first = native.execute(
+            "SELECT first_ts_utc FROM daily_source_rollups WHERE dt = ?", [DAY]
+        ).fetchone()[0]
+    views = connect_parquet(config.parquet_base_dir, config.tz)
+    views.execute("SET TimeZone = 'America/New_York'")
+    viewed = _rows(views, f"WHERE dt = DATE '{DAY.isoformat()}'")
+
+    assert archived == viewed
+    assert archived[0][:2] == (
+        datetime(2026, 9, 29, 15, 0, 5),
+        datetime(2026, 9, 30, 0, 0, 5),
+    )
+    assert archived[0][6] == datetime(2026, 10, 1, 0, 0)
+    assert first == datetime(2026, 9, 29, 15, 0, 5)
+
+
+def _dataset_files(config):
+    return sorted(
+        (path, path.stat().st_mtime_ns)
+        for path in Path(config.parquet_base_dir).rglob("*")
+    )
+
+
+def test_views_do_not_write_into_the_dataset(config, make_rows):
+    start = datetime(2026, 9, 30, 0, 0, 5, tzinfo=JST)
+    write_parquet_partition(config, DAY, make_rows(start, 3))
+    before = _dataset_files(config)
+
+    views = connect_parquet(config.parquet_base_dir, config.tz)
+    assert views.execute("SELECT COUNT(*) FROM raw_meter_readings").fetchone() == (3,)
+    views.close()
+
+    assert _dataset_files(config) == before
+
+
+def test_views_require_the_anchor_files(config, make_rows):
+    start = datetime(2026, 9, 30, 0, 0, 5, tzinfo=JST)
+    write_parquet_partition(config, DAY, make_rows(start, 3))
+    monthly_anchor = anchor_files(config.parquet_base_dir)[-1]
+    monthly_anchor.unlink()
+
+    with pytest.raises(FileNotFoundError, match="目印"):
+        connect_parquet(config.parquet_base_dir, config.tz)
+    assert not monthly_anchor.exists()
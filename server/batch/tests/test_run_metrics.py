@@ -0,0 +1,126 @@
+import json
+from datetime import date
+
+import pytest
+from homeiot_batch import run_metrics
+from homeiot_batch.run_metrics import RunMetrics
+
+
+def _finished(success=True, **kwargs):
+    metrics = RunMetrics("archive")
+    metrics.target_date = date(2026, 9, 29)
+    with metrics.stage("fetch"):
+        pass
+    metrics.rows["fetched"] = 10
+    metrics.bytes["parquet"] = 2048
+    metrics.finish(success=success, **kwargs)
+    return metrics
+
+
+def _samples(text):
+    return [line for line in text.splitlines() if not line.startswith("#")]
+
+
+def test_prometheus_output_uses_a_batch_job_label():
+    metrics = _finished()
+    metrics.stages['we"ird\\stage\n'] = 1.5
+
+    text = metrics.render_prometheus()
+
+    assert text.endswith("\n")
+    samples = _samples(text)
+    assert all(line.startswith("homeiot_batch_") for line in samples)
+    assert all('{batch_job="archive"' in line for line in samples)
+    assert not any("{job=" in line for line in samples)
+    assert 'homeiot_batch_rows{batch_job="archive",kind="fetched"} 10.0' in samples
+    assert 'homeiot_batch_bytes{batch_job="archive",kind="parquet"} 2048.0' in samples
+    assert (
+        'homeiot_batch_stage_duration_seconds{batch_job="archive",'
+        'stage="we\\"ird\\\\stage\\n"} 1.5'
+    ) in samples
+    assert (
+        'homeiot_batch_target_date_info{batch_job="archive",'
+        'target_date="2026-09-29"} 1.0'
+    ) in samples
+    assert 'homeiot_batch_last_run_success{batch_job="archive"} 1.0' in samples
+    # 書き出すまで最終成功時刻は分からない
+    assert "homeiot_batch_last_success_timestamp_seconds" not in text
+    assert "# TYPE homeiot_batch_rows gauge" in text
+
+
+def test_unfinished_runs_cannot_be_rendered():
+    metrics = RunMetrics("archive")
+
+    with pytest.raises(RuntimeError):
+        metrics.render_prometheus()
+    with pytest.raises(RuntimeError):
+        metrics.manifest()
+
+
+def test_manifest_carries_details_and_the_error():
+    metrics = _finished(success=False, error="ValueError: boom")
+    metrics.details["late_days"] = ["2026-09-28"]
+
+    manifest = metrics.manifest()
+
+    assert manifest["job"] == "archive"
+    assert manifest["target_date"] == "2026-09-29"
+    assert (manifest["success"], manifest["error"]) == (False, "ValueError: boom")
+    assert manifest["rows"] == {"fetched": 10}
+    assert set(manifest["stages_seconds"]) == {"fetch"}
+    assert manifest["late_days"] == ["2026-09-28"]
+    json.dumps(manifest)
+
+
+def test_write_is_atomic_and_failed_runs_keep_the_last_success(tmp_path, monkeypatch):
+    first = _finished()
+    prom_path = first.write(tmp_path)
+    manifest_path = tmp_path / "homeiot_batch_archive.json"
+    success_at = first.finished_at.isoformat()
+
+    assert prom_path == tmp_path / "homeiot_batch_archive.prom"
+    assert json.loads(manifest_path.read_text())["last_success_at"] == success_at
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        "homeiot_batch_archive.json",
+        "homeiot_batch_archive.prom",
+    ]
+
+    # 一時ファイルに書き切ってから置き換えるので、読み手は前回の内容か新しい内容を見る
+    replaced = []
+    replace = run_metrics.os.replace
+
+    def checked_replace(src, dst):
+        replaced.append((src.name, dst.name, dst.read_text()))
+        replace(src, dst)
+
+    monkeypatch.setattr(run_metrics.os, "replace", checked_replace)
+    failed = _finished(success=False, error="boom")
+    failed.write(tmp_path)
+    monkeypatch.undo()
+
+    assert [(src, dst) for src, dst, _ in replaced] == [
+        (".homeiot_batch_archive.json.tmp", "homeiot_batch_archive.json"),
+        (".homeiot_batch_archive.prom.tmp", "homeiot_batch_archive.prom"),
+    ]
+    assert 'homeiot_batch_last_run_success{batch_job="archive"} 1.0' in replaced[1][2]
+    prom = prom_path.read_text()
+    assert 'homeiot_batch_last_run_success{batch_job="archive"} 0.0' in prom
+    assert (
+        "homeiot_batch_last_success_timestamp_seconds"
+        f'{{batch_job="archive"}} {first.finished_at.timestamp()!r}'
+    ) in prom
+    manifest = json.loads(manifest_path.read_text())
+    assert (manifest["success"], manifest["last_success_at"]) == (False, success_at)
+
+
+def test_missing_or_broken_manifest_has_no_last_success(tmp_path):
+    (tmp_path / "homeiot_batch_archive.json").write_text("{not json")
+
+    metrics = _finished(success=False)
+    metrics.write(tmp_path)
+
+    assert metrics.last_success_at is None
+    assert (
+        "last_success_timestamp"
+        not in (tmp_path / "homeiot_batch_archive.prom").read_text()
+    )
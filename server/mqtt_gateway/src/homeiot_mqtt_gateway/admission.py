@@ -0,0 +1,450 @@
+"""取り込みの受け付け制御（メーターごとのトークンバケット・滞留分の後回しと集約）。
+
+デバイスの再接続やブローカーの再配信、`/readings` への一括再送で古い点が
+まとめて届いても、最新の点（live）の書き込みを遅らせないようにする。
+
+- measured_at が `INGEST_BACKLOG_AGE_SECONDS` 秒より古い点と、メーターごとの
+  トークンバケット（`INGEST_METER_RATE` 件/秒・`INGEST_METER_BURST` 件）を
+  使い切った点は滞留キュー（backlog）に入れ、その場では書かない
+- 滞留キューは専用の書き込み役がメーターを順に回りながら
+  `INGEST_BACKLOG_BATCH` 件ずつ書く。live の滞留時間（受信から Influx 書き込み
+  完了まで）が `INGEST_LIVE_BUDGET_MS` を超えたら書き込み速度を半分にし、
+  収まっていれば `INGEST_BACKLOG_MAX_RATE` 件/秒まで少しずつ戻す（AIMD）
+- キューが `INGEST_COALESCE_THRESHOLD` 件に達したら、以降の点は
+  `INGEST_COALESCE_SECONDS` 秒ごとの集約（電力は平均、積算電力量は最大、
+  時刻は区間の先頭）にまとめる。0 なら集約しない。集約は `coalesced` タグを
+  付けた別の系列に書くので、同じ時刻の生の点を上書きしない。書き込み済みの
+  区間に後から点が届いたら、書いた分を引き継いだ集約で上書きする
+- measured_at の無い点は、受信時刻を measured_at にしてからキューに入れる
+  （後で書くと Influx が書き込み時刻で記録してしまうため）
+- `INGEST_BACKLOG_MAX` 件を超えて入らない点は受け付けない（HTTP は 429、
+  MQTT は ack して捨て、meter と seq を間引いて警告に出す）
+
+滞留キューはメモリ上にあり、QoS 1 の ack もキューに入れた時点で返す。
+受け付け制御が有効な間は、QoS 1 でも Influx への書き込みは保証されない
+（再起動で滞留分は失われ、上限を超えた点は捨てる）。
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Callable
+
+from influxdb_client import Point
+
+from .ingest import PowerReading, build_point
+from .metrics import BACKLOG_DRAIN_RATE, BACKLOG_PENDING, READINGS, SEQUENCES
+
+_TRUE = ("1", "true", "yes", "on")
+_FALSE = ("0", "false", "no", "off")
+
+
+def get_bool_env(name: str, default: bool) -> bool:
+    raw_value = os.getenv(name)
+    if raw_value is None:
+        return default
+    value = raw_value.strip().lower()
+    if value in _TRUE:
+        return True
+    if value in _FALSE:
+        return False
+    print(f"{name} の値が不正です: {raw_value} (default={default})")
+    return default
+
+
+INGEST_ADMISSION = get_bool_env("INGEST_ADMISSION", True)
+INGEST_BACKLOG_AGE_SECONDS = float(os.getenv("INGEST_BACKLOG_AGE_SECONDS", "120"))
+INGEST_METER_RATE = float(os.getenv("INGEST_METER_RATE", "20"))
+INGEST_METER_BURST = float(os.getenv("INGEST_METER_BURST", "100"))
+INGEST_LIVE_BUDGET_MS = float(os.getenv("INGEST_LIVE_BUDGET_MS", "500"))
+INGEST_BACKLOG_BATCH = int(os.getenv("INGEST_BACKLOG_BATCH", "500"))
+INGEST_BACKLOG_MIN_RATE = float(os.getenv("INGEST_BACKLOG_MIN_RATE", "50"))
+INGEST_BACKLOG_MAX_RATE = float(os.getenv("INGEST_BACKLOG_MAX_RATE", "5000"))
+INGEST_BACKLOG_MAX = int(os.getenv("INGEST_BACKLOG_MAX", "100000"))
+INGEST_COALESCE_THRESHOLD = int(os.getenv("INGEST_COALESCE_THRESHOLD", "10000"))
+INGEST_COALESCE_SECONDS = int(os.getenv("INGEST_COALESCE_SECONDS", "60"))
+# 受け付けなかった点の警告は、この秒数に 1 行まで
+INGEST_SHED_LOG_INTERVAL = float(os.getenv("INGEST_SHED_LOG_INTERVAL", "10"))
+
+# admit() の結果
+LIVE = "live"
+QUEUED = "queued"
+COALESCED = "coalesced"
+SHED = "shed"
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def _as_utc(value: datetime) -> datetime:
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+class TokenBucket:
+    """`rate` 件/秒で貯まり、`burst` 件まで持てるトークン。"""
+
+    def __init__(self, rate: float, burst: float, now: float) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def take(self, now: float) -> bool:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    def is_full(self, now: float) -> bool:
+        """満タンまで貯まっていれば True（新しく作ったものと区別できない）。"""
+        return self.tokens + (now - self.updated) * self.rate >= self.burst
+
+
+@dataclass
+class BacklogEntry:
+    """滞留キューの 1 件。集約中なら `samples` 件分の点をまとめて持つ。
+
+    `carried` は書き込み済み（または書き込み中）の同じ区間の集約から
+    引き継いだ点の数。`taken` の間は書き込み中なので点を足さない。
+    """
+
+    reading: PowerReading
+    samples: int = 1
+    power_sum: float = 0.0
+    bucket: datetime | None = None
+    window: int = 0
+    carried: int = 0
+    taken: bool = False
+
+    @property
+    def new_samples(self) -> int:
+        return self.samples - self.carried
+
+    def _add_energy(self, energy: float | None) -> None:
+        if energy is not None and (
+            self.reading.energy_import_kwh is None
+            or energy > self.reading.energy_import_kwh
+        ):
+            self.reading.energy_import_kwh = energy
+
+    def add(self, reading: PowerReading) -> None:
+        self.samples += 1
+        self.power_sum += reading.power_w
+        self._add_energy(reading.energy_import_kwh)
+
+    def carry(self, previous: BacklogEntry) -> None:
+        """同じ区間の前の集約を引き継ぎ、同じ時刻で上書きしても点が欠けないようにする。"""
+        self.samples += previous.samples
+        self.carried = previous.samples
+        self.power_sum += previous.power_sum
+        self._add_energy(previous.reading.energy_import_kwh)
+
+    def build(self) -> PowerReading:
+        if self.bucket is None:
+            return self.reading
+        return self.reading.model_copy(
+            update={"power_w": self.power_sum / self.samples}
+        )
+
+    def to_point(self) -> Point:
+        point = build_point(self.build())
+        if self.bucket is not None:
+            # 区間の先頭と同じ時刻の生の点を上書きしないよう、別の系列にする
+            point.tag("coalesced", f"{self.window}s")
+        return point
+
+
+class Backlog:
+    """メーターごとの FIFO。取り出しはメーターを順に回る。スレッドセーフではない。
+
+    集約の区間は書き込みが確定する（`commit`）まで `_open` に残し、確定した
+    ものは `_written` に `max_entries` 件まで覚えておく。
+    """
+
+    def __init__(
+        self, *, max_entries: int, coalesce_threshold: int, coalesce_seconds: int
+    ) -> None:
+        self.max_entries = max_entries
+        self.coalesce_threshold = coalesce_threshold
+        self.coalesce_seconds = coalesce_seconds
+        self._queues: dict[str, deque[BacklogEntry]] = {}
+        self._open: dict[tuple[str, datetime], BacklogEntry] = {}
+        self._written: OrderedDict[tuple[str, datetime], BacklogEntry] = (
+            OrderedDict()
+        )
+        self._order: deque[str] = deque()
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _bucket(self, measured_at: datetime) -> datetime:
+        seconds = (_as_utc(measured_at) - _EPOCH).total_seconds()
+        start = seconds - seconds % self.coalesce_seconds
+        return _EPOCH + timedelta(seconds=start)
+
+    def _append(self, meter: str, entry: BacklogEntry) -> None:
+        queue = self._queues.get(meter)
+        if queue is None:
+            queue = self._queues[meter] = deque()
+            self._order.append(meter)
+        queue.append(entry)
+        self._size += 1
+
+    def put(self, reading: PowerReading) -> str:
+        coalesce = (
+            self.coalesce_seconds > 0
+            and reading.measured_at is not None
+            and self._size >= self.coalesce_threshold
+        )
+        previous = None
+        if coalesce:
+            bucket = self._bucket(reading.measured_at)
+            key = (reading.meter, bucket)
+            previous = self._open.get(key)
+            if previous is not None and not previous.taken:
+                previous.add(reading)
+                return COALESCED
+            previous = previous or self._written.get(key)
+        if self._size >= self.max_entries:
+            return SHED
+        if not coalesce:
+            self._append(reading.meter, BacklogEntry(reading))
+            return QUEUED
+        entry = BacklogEntry(
+            reading.model_copy(update={"measured_at": bucket, "seq": None}),
+            power_sum=reading.power_w,
+            bucket=bucket,
+            window=self.coalesce_seconds,
+        )
+        if previous is not None:
+            entry.carry(previous)
+        self._open[key] = entry
+        self._append(reading.meter, entry)
+        return COALESCED
+
+    def take(self, limit: int) -> list[BacklogEntry]:
+        """メーターを 1 件ずつ順に回り、古いものから最大 `limit` 件取り出す。"""
+        batch: list[BacklogEntry] = []
+        while self._order and len(batch) < limit:
+            meter = self._order.popleft()
+            queue = self._queues[meter]
+            entry = queue.popleft()
+            # 書き込み中の区間には点を足さず、届いた点は引き継いだ集約にする
+            entry.taken = True
+            batch.append(entry)
+            if queue:
+                self._order.append(meter)
+            else:
+                del self._queues[meter]
+        self._size -= len(batch)
+        return batch
+
+    def commit(self, batch: list[BacklogEntry]) -> None:
+        """書き込めた集約を確定し、同じ区間に後から届いた点の引き継ぎ元にする。"""
+        for entry in batch:
+            if entry.bucket is None:
+                continue
+            key = (entry.reading.meter, entry.bucket)
+            if self._open.get(key) is not entry:
+                # 後から届いた点で、これを引き継いだ集約がもうある
+                continue
+            del self._open[key]
+            self._written[key] = entry
+            self._written.move_to_end(key)
+        while len(self._written) > self.max_entries:
+            self._written.popitem(last=False)
+
+    def requeue(self, batch: list[BacklogEntry]) -> None:
+        """書けなかった分を各メーターの先頭へ戻す。
+
+        戻した集約には再び点を足せる。後から届いた点で同じ区間の集約が
+        新しく作られていれば、それが引き継いで後に書かれるので上書きで揃う。
+        """
+        for entry in reversed(batch):
+            entry.taken = False
+            meter = entry.reading.meter
+            queue = self._queues.get(meter)
+            if queue is None:
+                queue = self._queues[meter] = deque()
+                self._order.appendleft(meter)
+            queue.appendleft(entry)
+        self._size += len(batch)
+
+
+class AdmissionController:
+    """live / backlog の振り分けと、滞留分の書き込み速度。スレッドから呼べる。"""
+
+    def __init__(
+        self,
+        backlog: Backlog,
+        *,
+        enabled: bool = True,
+        backlog_age: float = 120.0,
+        meter_rate: float = 20.0,
+        meter_burst: float = 100.0,
+        live_budget: float = 0.5,
+        batch_size: int = 500,
+        min_rate: float = 50.0,
+        max_rate: float = 5000.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.backlog = backlog
+        self.enabled = enabled
+        self.backlog_age = backlog_age
+        self.meter_rate = meter_rate
+        self.meter_burst = meter_burst
+        self.live_budget = live_budget
+        self.batch_size = batch_size
+        self.min_rate = min_rate
+        self.max_rate = max(max_rate, min_rate)
+        # 最初は控えめに書き始め、live が予算内なら上げていく
+        self.rate = self.min_rate
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._buckets: dict[str, TokenBucket] = {}
+        # meter は送信側が決める値なので、満タンのバケットは時々捨てる
+        self._prune_interval = meter_burst / meter_rate if meter_rate > 0 else 60.0
+        self._pruned_at = clock()
+        self._live_peak = 0.0
+        BACKLOG_DRAIN_RATE.set(self.rate)
+
+    @classmethod
+    def from_env(cls) -> AdmissionController:
+        return cls(
+            Backlog(
+                max_entries=INGEST_BACKLOG_MAX,
+                coalesce_threshold=INGEST_COALESCE_THRESHOLD,
+                coalesce_seconds=INGEST_COALESCE_SECONDS,
+            ),
+            enabled=INGEST_ADMISSION,
+            backlog_age=INGEST_BACKLOG_AGE_SECONDS,
+            meter_rate=INGEST_METER_RATE,
+            meter_burst=INGEST_METER_BURST,
+            live_budget=INGEST_LIVE_BUDGET_MS / 1000,
+            batch_size=INGEST_BACKLOG_BATCH,
+            min_rate=INGEST_BACKLOG_MIN_RATE,
+            max_rate=INGEST_BACKLOG_MAX_RATE,
+        )
+
+    @property
+    def pending(self) -> int:
+        return len(self.backlog)
+
+    def _prune_buckets(self, now: float) -> None:
+        if now - self._pruned_at < self._prune_interval:
+            return
+        self._pruned_at = now
+        for meter in [m for m, b in self._buckets.items() if b.is_full(now)]:
+            del self._buckets[meter]
+
+    def _is_backlog(self, reading: PowerReading, received_at: datetime) -> bool:
+        if reading.measured_at is not None:
+            age = (received_at - _as_utc(reading.measured_at)).total_seconds()
+            if age > self.backlog_age:
+                return True
+        now = self._clock()
+        self._prune_buckets(now)
+        bucket = self._buckets.get(reading.meter)
+        if bucket is None:
+            bucket = self._buckets[reading.meter] = TokenBucket(
+                self.meter_rate, self.meter_burst, now
+            )
+        return not bucket.take(now)
+
+    def admit(self, reading: PowerReading, received_at: datetime) -> str:
+        """LIVE ならその場で書く。それ以外はキューに入れたか、受け付けなかった。"""
+        if not self.enabled:
+            return LIVE
+        with self._lock:
+            if not self._is_backlog(reading, received_at):
+                return LIVE
+            if reading.measured_at is None:
+                # 後で書くときに Influx が書き込み時刻を付けないようにする
+                reading = reading.model_copy(update={"measured_at": received_at})
+            outcome = self.backlog.put(reading)
+            BACKLOG_PENDING.set(len(self.backlog))
+        return outcome
+
+    def observe_live(self, seconds: float) -> None:
+        """live の点の受信から書き込み完了までの秒数。"""
+        with self._lock:
+            self._live_peak = max(self._live_peak, seconds)
+
+    def next_batch(self) -> list[BacklogEntry]:
+        with self._lock:
+            batch = self.backlog.take(self.batch_size)
+            BACKLOG_PENDING.set(len(self.backlog))
+        return batch
+
+    def written(self, batch: list[BacklogEntry]) -> float:
+        """書き込めた後に呼ぶ。速度を調整し、次のバッチまで待つ秒数を返す。"""
+        with self._lock:
+            self.backlog.commit(batch)
+            if self._live_peak > self.live_budget:
+                self.rate = max(self.min_rate, self.rate / 2)
+            else:
+                self.rate = min(self.max_rate, self.rate + self.max_rate / 10)
+            self._live_peak = 0.0
+            BACKLOG_DRAIN_RATE.set(self.rate)
+            rate = self.rate
+        samples = sum(entry.new_samples for entry in batch)
+        READINGS.inc(samples, transport="backlog", outcome="written")
+        return len(batch) / rate
+
+    def failed(self, batch: list[BacklogEntry]) -> None:
+        """書き込めなかった分を戻し、速度を最低まで落とす。"""
+        with self._lock:
+            self.backlog.requeue(batch)
+            self.rate = self.min_rate
+            BACKLOG_PENDING.set(len(self.backlog))
+            BACKLOG_DRAIN_RATE.set(self.rate)
+        samples = sum(entry.new_samples for entry in batch)
+        READINGS.inc(samples, transport="backlog", outcome="retried")
+
+
+class ShedLog:
+    """受け付けなかった点を `interval` 秒に 1 行まで警告する。間引いた件数も添える。"""
+
+    def __init__(
+        self, interval: float, clock: Callable[[], float] = time.monotonic
+    ) -> None:
+        self.interval = interval
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._last: float | None = None
+        self._suppressed = 0
+
+    def record(self, reading: PowerReading, transport: str) -> bool:
+        """警告を出したら True。"""
+        with self._lock:
+            now = self._clock()
+            if self._last is not None and now - self._last < self.interval:
+                self._suppressed += 1
+                return False
+            self._last = now
+            suppressed, self._suppressed = self._suppressed, 0
+        print(
+            f"警告: 滞留キューが上限のため受け付けませんでした: transport={transport} "
+            f"meter={reading.meter} seq={reading.seq} "
+            f"measured_at={reading.measured_at} (間引いた件数: {suppressed})"
+        )
+        return True
+
+
+SHED_LOG = ShedLog(INGEST_SHED_LOG_INTERVAL)
+
+
+def record_deferred(reading: PowerReading, *, transport: str, outcome: str) -> None:
+    """live 以外で受けた点を数える。seq は受信順で見るので、ここで記録する。"""
+    READINGS.inc(transport=transport, outcome=outcome)
+    if outcome == SHED:
+        SHED_LOG.record(reading, transport)
+    elif reading.seq is not None:
+        SEQUENCES.observe(reading.meter, reading.seq)
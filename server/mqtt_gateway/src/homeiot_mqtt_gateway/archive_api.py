@@ -0,0 +1,419 @@
+"""バッチがアーカイブした DuckDB を読む API（`/energy/daily`, `/energy/hourly`）。
+
+- DuckDB は読み取り専用で開き、接続（カーソル）を `ARCHIVE_POOL_SIZE` 本まで
+  使い回す。同時に走るクエリもこの本数までで、空きを `ARCHIVE_ACQUIRE_TIMEOUT`
+  秒待っても取れなければ 503 を返す
+- 結果は JSON に直した本文ごと `ARCHIVE_CACHE_SIZE` 件の LRU に入れ、当たったかは
+  `X-Archive-Cache: hit|miss` ヘッダーで返す。バッチは新しいファイルを
+  `os.replace` で入れ替えるので、ファイルの inode・更新時刻・サイズが変わったら
+  キャッシュを捨て、以降の接続は新しいファイルに張る
+- 同じパスを `duckdb.connect` し直すとプロセス内で開いたままの古いインスタンスが
+  返るため、世代ごとにインメモリ DB へ `ATTACH` して開く。古い世代は貸し出し中の
+  接続が戻った時点で閉じる
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Hashable, Iterator
+from zoneinfo import ZoneInfo
+
+import duckdb
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+
+from .metrics import ARCHIVE_LATENCY, ARCHIVE_REQUESTS
+
+ARCHIVE_DUCKDB_PATH = os.getenv(
+    "ARCHIVE_DUCKDB_PATH", "/data/duckdb/home_energy.duckdb"
+)
+ARCHIVE_POOL_SIZE = int(os.getenv("ARCHIVE_POOL_SIZE", "4"))
+ARCHIVE_CACHE_SIZE = int(os.getenv("ARCHIVE_CACHE_SIZE", "256"))
+ARCHIVE_ACQUIRE_TIMEOUT = float(os.getenv("ARCHIVE_ACQUIRE_TIMEOUT", "2.0"))
+ARCHIVE_TZ = ZoneInfo(os.getenv("TZ", "Asia/Tokyo"))
+# 1 リクエストで読む日数の上限（hourly は生データを読むので短くする）
+DAILY_MAX_DAYS = int(os.getenv("ARCHIVE_DAILY_MAX_DAYS", "366"))
+HOURLY_MAX_DAYS = int(os.getenv("ARCHIVE_HOURLY_MAX_DAYS", "31"))
+
+DAILY_SQL = """
+SELECT dt, source, samples, avg_power_w, min_power_w, max_power_w,
+       energy_import_kwh
+FROM archive.daily_source_rollups
+WHERE dt BETWEEN $start AND $end AND ($meter IS NULL OR source = $meter)
+ORDER BY dt, source
+"""
+
+# 積算電力量は 30 分ごとにしか入らないので、直前の値との差をその時間に割り当てる。
+# 範囲の最初の差分を取るために 1 時間前から読む。
+HOURLY_SQL = """
+WITH readings AS (
+  SELECT source, ts_jst, instant_power_w, energy_import_kwh
+  FROM archive.raw_meter_readings
+  WHERE ts_jst >= $start - INTERVAL 1 HOUR AND ts_jst < $end
+    AND ($meter IS NULL OR source = $meter)
+),
+deltas AS (
+  SELECT
+    source, date_trunc('hour', ts_jst) AS hour,
+    energy_import_kwh
+      - lag(energy_import_kwh) OVER (PARTITION BY source ORDER BY ts_jst) AS delta
+  FROM readings
+  WHERE energy_import_kwh IS NOT NULL
+),
+energy AS (
+  SELECT source, hour, SUM(delta) FILTER (WHERE delta >= 0) AS energy_import_kwh
+  FROM deltas
+  GROUP BY ALL
+),
+power AS (
+  SELECT
+    source, date_trunc('hour', ts_jst) AS hour, COUNT(*) AS samples,
+    AVG(instant_power_w) AS avg_power_w, MAX(instant_power_w) AS max_power_w
+  FROM readings
+  WHERE ts_jst >= $start
+  GROUP BY ALL
+)
+SELECT p.hour, p.source, p.samples, p.avg_power_w, p.max_power_w,
+       e.energy_import_kwh
+FROM power AS p
+LEFT JOIN energy AS e USING (source, hour)
+ORDER BY p.hour, p.source
+"""
+
+# /energy/hourly の既定の日（アーカイブ済みの最後の日）
+LATEST_DAY_SQL = """
+SELECT MAX(dt) AS dt FROM archive.daily_source_rollups
+"""
+
+
+class ArchiveUnavailable(Exception):
+    """アーカイブのファイルがまだ無いか、読み手を閉じた後。"""
+
+
+class ArchiveBusy(Exception):
+    """接続の空きを待ちきれなかった。"""
+
+
+class ResultCache:
+    """件数上限つきの LRU。"""
+
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[Hashable, Any] = OrderedDict()
+
+    def get(self, key: Hashable) -> Any | None:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+@dataclass
+class _Generation:
+    """入れ替え 1 回分のファイルと、それに張った接続。"""
+
+    signature: tuple[int, int, int]
+    root: duckdb.DuckDBPyConnection
+    idle: list[duckdb.DuckDBPyConnection] = field(default_factory=list)
+    borrowed: int = 0
+    retired: bool = False
+
+    def close(self) -> None:
+        for connection in self.idle:
+            connection.close()
+        self.idle.clear()
+        self.root.close()
+
+
+class ArchiveReader:
+    """読み取り専用接続のプールと結果キャッシュ。スレッドから呼ぶ。"""
+
+    def __init__(
+        self,
+        path: str,
+        *,
+        pool_size: int = 4,
+        cache_size: int = 256,
+        acquire_timeout: float = 2.0,
+    ) -> None:
+        self.path = path
+        self.pool_size = max(pool_size, 1)
+        self.acquire_timeout = acquire_timeout
+        self.cache = ResultCache(cache_size)
+        self._slots = threading.BoundedSemaphore(self.pool_size)
+        self._lock = threading.Lock()
+        self._current: _Generation | None = None
+
+    @classmethod
+    def from_env(cls) -> ArchiveReader:
+        return cls(
+            ARCHIVE_DUCKDB_PATH,
+            pool_size=ARCHIVE_POOL_SIZE,
+            cache_size=ARCHIVE_CACHE_SIZE,
+            acquire_timeout=ARCHIVE_ACQUIRE_TIMEOUT,
+        )
+
+    def _signature(self) -> tuple[int, int, int]:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError as exc:
+            raise ArchiveUnavailable(f"アーカイブがありません: {self.path}") from exc
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def _open(self, signature: tuple[int, int, int]) -> _Generation:
+        root = duckdb.connect(":memory:")
+        quoted = self.path.replace("'", "''")
+        root.execute(f"ATTACH '{quoted}' AS archive (READ_ONLY)")
+        return _Generation(signature=signature, root=root)
+
+    def generation(self) -> tuple[int, int, int]:
+        """今のファイルの識別子。変わっていたら古い世代とキャッシュを捨てる。"""
+        signature = self._signature()
+        with self._lock:
+            current = self._current
+            if current is not None and current.signature == signature:
+                return signature
+            self._current = self._open(signature)
+            self.cache.clear()
+            if current is not None:
+                current.retired = True
+                if current.borrowed == 0:
+                    current.close()
+        return signature
+
+    def _checkout(self) -> tuple[_Generation, duckdb.DuckDBPyConnection]:
+        with self._lock:
+            current = self._current
+            if current is None:
+                raise ArchiveUnavailable(f"アーカイブを開いていません: {self.path}")
+            connection = current.idle.pop() if current.idle else current.root.cursor()
+            current.borrowed += 1
+            return current, connection
+
+    def _checkin(
+        self,
+        owner: _Generation,
+        connection: duckdb.DuckDBPyConnection,
+        *,
+        healthy: bool,
+    ) -> None:
+        with self._lock:
+            owner.borrowed -= 1
+            if healthy and not owner.retired:
+                owner.idle.append(connection)
+                return
+            connection.close()
+            if owner.retired and owner.borrowed == 0:
+                owner.close()
+
+    def _execute(self, sql: str, params: dict[str, Any]) -> list[dict[str, Any]]:
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            raise ArchiveBusy("アーカイブの接続が空きませんでした")
+        try:
+            owner, connection = self._checkout()
+            healthy = False
+            try:
+                cursor = connection.execute(sql, params)
+                columns = [column[0] for column in cursor.description]
+                rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+                healthy = True
+            finally:
+                self._checkin(owner, connection, healthy=healthy)
+        finally:
+            self._slots.release()
+        return rows
+
+    def query(
+        self,
+        key: Hashable,
+        sql: str,
+        params: dict[str, Any],
+        render: Callable[[list[dict[str, Any]]], bytes],
+    ) -> tuple[bytes, bool]:
+        """`render` した本文と、キャッシュから返したかどうか。"""
+        cache_key = (self.generation(), key)
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            return cached, True
+        body = render(self._execute(sql, params))
+        self.cache.put(cache_key, body)
+        return body, False
+
+    def latest_day(self) -> date | None:
+        """アーカイブ済みの最後の日。まだ 1 日も無ければ None。世代ごとに 1 回読む。"""
+        cache_key = (self.generation(), "latest_day")
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            return cached[0]
+        rows = self._execute(LATEST_DAY_SQL, {})
+        latest = rows[0]["dt"] if rows else None
+        self.cache.put(cache_key, (latest,))
+        return latest
+
+    def close(self) -> None:
+        with self._lock:
+            current, self._current = self._current, None
+            if current is not None:
+                current.retired = True
+                if current.borrowed == 0:
+                    current.close()
+
+
+def _resolve_range(
+    start: date | None,
+    end: date | None,
+    *,
+    default_days: int,
+    max_days: int,
+    default_end: date | None = None,
+) -> tuple[date, date]:
+    end = end or default_end or datetime.now(ARCHIVE_TZ).date()
+    start = start or end - timedelta(days=default_days - 1)
+    if start > end:
+        raise HTTPException(status_code=400, detail="from は to 以前にしてください")
+    if (end - start).days + 1 > max_days:
+        raise HTTPException(
+            status_code=400, detail=f"期間は {max_days} 日以内にしてください"
+        )
+    return start, end
+
+
+def _json_default(value: object) -> object:
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f"JSON に変換できません: {value!r}")
+
+
+@contextmanager
+def _archive_errors(endpoint: str) -> Iterator[None]:
+    """アーカイブの読み出しの失敗を HTTP のエラーにして数える。"""
+    try:
+        yield
+    except ArchiveUnavailable as exc:
+        ARCHIVE_REQUESTS.inc(endpoint=endpoint, outcome="unavailable")
+        raise HTTPException(status_code=503, detail=str(exc)) from exc
+    except ArchiveBusy as exc:
+        ARCHIVE_REQUESTS.inc(endpoint=endpoint, outcome="busy")
+        raise HTTPException(
+            status_code=503, detail=str(exc), headers={"Retry-After": "1"}
+        ) from exc
+    except Exception:
+        ARCHIVE_REQUESTS.inc(endpoint=endpoint, outcome="failed")
+        raise
+
+
+def _run(
+    request: Request,
+    endpoint: str,
+    sql: str,
+    params: dict[str, Any],
+    *,
+    start: date,
+    end: date,
+) -> Response:
+    reader: ArchiveReader = request.app.state.archive
+    meter = params["meter"]
+
+    def render(rows: list[dict[str, Any]]) -> bytes:
+        body = {"from": start, "to": end, "meter": meter, "rows": rows}
+        return json.dumps(body, default=_json_default).encode()
+
+    started = time.perf_counter()
+    with _archive_errors(endpoint):
+        body, cached = reader.query(
+            (endpoint, tuple(sorted(params.items()))), sql, params, render
+        )
+    cache = "hit" if cached else "miss"
+    ARCHIVE_REQUESTS.inc(endpoint=endpoint, outcome="ok")
+    ARCHIVE_LATENCY.observe(
+        time.perf_counter() - started, endpoint=endpoint, cache=cache
+    )
+    return Response(
+        content=body,
+        media_type="application/json",
+        headers={"X-Archive-Cache": cache},
+    )
+
+
+router = APIRouter(prefix="/energy", tags=["archive"])
+
+
+# DuckDB の呼び出しはブロックするので、どちらのモードでもスレッドプールで動く def にする
+@router.get("/daily")
+def energy_daily(
+    request: Request,
+    start: date | None = Query(None, alias="from"),
+    end: date | None = Query(None, alias="to"),
+    meter: str | None = None,
+) -> Response:
+    """日ごと・メーターごとの集計（`daily_source_rollups`）。既定は直近 30 日。"""
+
+    start, end = _resolve_range(start, end, default_days=30, max_days=DAILY_MAX_DAYS)
+    return _run(
+        request,
+        "daily",
+        DAILY_SQL,
+        {"start": start, "end": end, "meter": meter},
+        start=start,
+        end=end,
+    )
+
+
+@router.get("/hourly")
+def energy_hourly(
+    request: Request,
+    start: date | None = Query(None, alias="from"),
+    end: date | None = Query(None, alias="to"),
+    meter: str | None = None,
+) -> Response:
+    """1 時間ごと・メーターごとの件数・電力・買電量。既定はアーカイブ済みの最後の日。"""
+
+    default_end = None
+    if start is None and end is None:
+        # アーカイブは前日分までなので、今日を既定にすると常に空になる
+        reader: ArchiveReader = request.app.state.archive
+        with _archive_errors("hourly"):
+            default_end = reader.latest_day()
+    start, end = _resolve_range(
+        start,
+        end,
+        default_days=1,
+        max_days=HOURLY_MAX_DAYS,
+        default_end=default_end,
+    )
+    return _run(
+        request,
+        "hourly",
+        HOURLY_SQL,
+        {
+            "start": datetime.combine(start, datetime.min.time()),
+            "end": datetime.combine(end + timedelta(days=1), datetime.min.time()),
+            "meter": meter,
+        },
+        start=start,
+        end=end,
+    )
@@ -0,0 +1,253 @@
+"""asyncio 版ゲートウェイ。MQTT 受信・HTTP 取り込み・Influx 書き込みを1ループで回す。
+
+起動: `uvicorn homeiot_mqtt_gateway.async_app:app`
+
+- MQTT は `AsyncMqttConsumer`（paho のソケットをループで駆動、処理後に ack）
+- Influx は `InfluxDBClientAsync`（aiohttp）で書き込み、同時書き込み数を
+  `INFLUX_MAX_INFLIGHT` のセマフォで抑える。MQTT・HTTP のどちらも
+  空きを await して待つので、Influx が遅いときは受け付け側が自然に詰まる
+- 古い点や、メーターごとの上限を超えた点は `admission` の滞留キューに入れ、
+  別タスクが live の書き込みを邪魔しない速度で書く
+- クライアントの生成と破棄は lifespan で行い、モジュール変数は持たない
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import json
+import os
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import AsyncIterator
+
+import paho.mqtt.client as mqtt
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import PlainTextResponse
+from influxdb_client.client.influxdb_client_async import InfluxDBClientAsync
+from influxdb_client.client.write_api_async import WriteApiAsync
+
+from .admission import (
+    LIVE,
+    SHED,
+    AdmissionController,
+    BacklogEntry,
+    record_deferred,
+)
+from .archive_api import ArchiveReader
+from .archive_api import router as archive_router
+from .async_mqtt import AsyncMqttConsumer
+from .ingest import (
+    INFLUX_BUCKET,
+    INFLUX_ORG,
+    INFLUX_TOKEN,
+    INFLUX_URL,
+    MQTT_BROKER_URL,
+    MQTT_TLS_CA_CERT,
+    MQTT_TOPIC,
+    PowerReading,
+    build_point,
+    parse_broker_url,
+    record_trace,
+    utcnow,
+)
+from .metrics import READINGS, render_metrics
+
+ASYNC_WORKERS = int(os.getenv("GATEWAY_ASYNC_WORKERS", "8"))
+MQTT_RECEIVE_MAXIMUM = int(os.getenv("MQTT_RECEIVE_MAXIMUM", "64"))
+INFLUX_MAX_INFLIGHT = int(os.getenv("INFLUX_MAX_INFLIGHT", "16"))
+
+
+@dataclass
+class GatewayState:
+    write_api: WriteApiAsync
+    write_slots: asyncio.Semaphore
+    admission: AdmissionController
+    mqtt: AsyncMqttConsumer | None
+
+
+async def _write_to_influx(state: GatewayState, reading: PowerReading) -> None:
+    async with state.write_slots:
+        await state.write_api.write(
+            bucket=INFLUX_BUCKET, org=INFLUX_ORG, record=build_point(reading)
+        )
+
+
+async def _write_backlog(state: GatewayState, batch: list[BacklogEntry]) -> None:
+    # 滞留分は 1 タスクで書くので、使う枠は常に 1 つだけ
+    async with state.write_slots:
+        await state.write_api.write(
+            bucket=INFLUX_BUCKET,
+            org=INFLUX_ORG,
+            record=[entry.to_point() for entry in batch],
+        )
+
+
+async def _wait(event: asyncio.Event, timeout: float) -> None:
+    with contextlib.suppress(asyncio.TimeoutError):
+        await asyncio.wait_for(event.wait(), timeout)
+
+
+async def _drain_backlog(state: GatewayState, stop: asyncio.Event) -> None:
+    """滞留キューを AIMD で決まる速度で書く。"""
+
+    admission = state.admission
+    while not stop.is_set():
+        batch = admission.next_batch()
+        if not batch:
+            await _wait(stop, 0.2)
+            continue
+        try:
+            await _write_backlog(state, batch)
+        except Exception as exc:
+            admission.failed(batch)
+            print(f"滞留分の書き込みに失敗: {exc} / {len(batch)} 件を戻して再試行")
+            await _wait(stop, 1.0)
+            continue
+        await _wait(stop, admission.written(batch))
+    # 停止時は残りを速度制限なしで書き切る
+    while batch := admission.next_batch():
+        try:
+            await _write_backlog(state, batch)
+        except Exception as exc:
+            admission.failed(batch)
+            print(f"滞留分を書き切れませんでした: {exc} / 残り {admission.pending} 件")
+            return
+        admission.written(batch)
+
+
+def _build_consumer(state: GatewayState) -> AsyncMqttConsumer | None:
+    broker = parse_broker_url(MQTT_BROKER_URL)
+    if broker is None:
+        return None
+
+    async def handle(message: mqtt.MQTTMessage) -> None:
+        received_at = utcnow()
+        try:
+            payload = json.loads(message.payload.decode("utf-8"))
+            reading = PowerReading(**payload)
+            decoded_at = utcnow()
+            outcome = state.admission.admit(reading, received_at)
+            if outcome != LIVE:
+                record_deferred(reading, transport="mqtt", outcome=outcome)
+                return
+            await _write_to_influx(state, reading)
+            committed_at = utcnow()
+            state.admission.observe_live((committed_at - received_at).total_seconds())
+            record_trace(
+                reading,
+                transport="mqtt",
+                received_at=received_at,
+                decoded_at=decoded_at,
+                committed_at=committed_at,
+            )
+            READINGS.inc(transport="mqtt", outcome="written")
+        except Exception as exc:
+            READINGS.inc(transport="mqtt", outcome="failed")
+            print(f"MQTT メッセージ処理エラー: {exc} / payload={message.payload!r}")
+
+    return AsyncMqttConsumer(
+        broker,
+        MQTT_TOPIC,
+        handle,
+        workers=ASYNC_WORKERS,
+        receive_maximum=MQTT_RECEIVE_MAXIMUM,
+        tls_ca_cert=MQTT_TLS_CA_CERT,
+    )
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    # 既定の接続プール (CPU 数 x 5) だとセマフォより先にプールで詰まる
+    client = InfluxDBClientAsync(
+        url=INFLUX_URL,
+        token=INFLUX_TOKEN,
+        org=INFLUX_ORG,
+        connection_pool_maxsize=INFLUX_MAX_INFLIGHT,
+    )
+    state = GatewayState(
+        write_api=client.write_api(),
+        write_slots=asyncio.Semaphore(INFLUX_MAX_INFLIGHT),
+        admission=AdmissionController.from_env(),
+        mqtt=None,
+    )
+    stop_drain = asyncio.Event()
+    drainer = asyncio.create_task(_drain_backlog(state, stop_drain))
+    state.mqtt = _build_consumer(state)
+    if state.mqtt is not None:
+        await state.mqtt.start()
+    app.state.gateway = state
+    app.state.archive = ArchiveReader.from_env()
+    try:
+        yield
+    finally:
+        app.state.archive.close()
+        if state.mqtt is not None:
+            # 受け取り済みのメッセージを書き切ってから Influx を閉じる
+            await state.mqtt.stop()
+        stop_drain.set()
+        await drainer
+        await client.close()
+
+
+app = FastAPI(title="Home IoT Server", version="0.2.0", lifespan=lifespan)
+app.include_router(archive_router)
+
+
+@app.get("/health", tags=["meta"])
+async def health(request: Request) -> dict[str, str | bool | int]:
+    """ヘルスチェック用の軽量エンドポイント。"""
+
+    state: GatewayState = request.app.state.gateway
+    return {
+        "status": "ok",
+        "mode": "asyncio",
+        "influx_url": INFLUX_URL or "not-set",
+        "mqtt_connected": bool(state.mqtt and state.mqtt.connected),
+        "mqtt_pending": state.mqtt.pending if state.mqtt else 0,
+        "backlog_pending": state.admission.pending,
+    }
+
+
+@app.post("/readings", tags=["power"])
+async def ingest_reading(
+    reading: PowerReading, request: Request, response: Response
+) -> dict[str, str]:
+    """HTTP 経由の読み取りデータも InfluxDB に反映する。古い点は 202 で後から書く。"""
+
+    received_at = utcnow()
+    state: GatewayState = request.app.state.gateway
+    outcome = state.admission.admit(reading, received_at)
+    if outcome != LIVE:
+        record_deferred(reading, transport="http", outcome=outcome)
+        if outcome == SHED:
+            raise HTTPException(
+                status_code=429,
+                detail="滞留キューが一杯です",
+                headers={"Retry-After": "5"},
+            )
+        response.status_code = 202
+        return {"status": "queued"}
+    try:
+        await _write_to_influx(state, reading)
+    except Exception:
+        READINGS.inc(transport="http", outcome="failed")
+        raise
+    committed_at = utcnow()
+    state.admission.observe_live((committed_at - received_at).total_seconds())
+    record_trace(
+        reading,
+        transport="http",
+        received_at=received_at,
+        decoded_at=received_at,
+        committed_at=committed_at,
+    )
+    READINGS.inc(transport="http", outcome="written")
+    return {"status": "written"}
+
+
+@app.get("/metrics", tags=["meta"], response_class=PlainTextResponse)
+async def metrics() -> str:
+    """Prometheus が scrape する段階別レイテンシと欠損数。"""
+
+    return render_metrics()
@@ -0,0 +1,222 @@
+"""paho-mqtt のソケットを asyncio のイベントループで回す購読クライアント。
+
+paho の `loop_start()` スレッドを使わず、ソケットの読み書きを
+`loop.add_reader` / `add_writer` で駆動する。QoS 1 のメッセージは処理が
+終わってから ack するので、未 ack の数が CONNECT の Receive Maximum に
+達するとブローカーが配信を止める（それがそのままバックプレッシャーになる）。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import socket
+from typing import Awaitable, Callable
+
+import paho.mqtt.client as mqtt
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
+
+from .ingest import BrokerSettings
+
+MessageHandler = Callable[[mqtt.MQTTMessage], Awaitable[None]]
+
+
+class AsyncMqttConsumer:
+    def __init__(
+        self,
+        broker: BrokerSettings,
+        topic: str,
+        handler: MessageHandler,
+        *,
+        workers: int = 8,
+        receive_maximum: int = 64,
+        tls_ca_cert: str | None = None,
+        keepalive: int = 60,
+    ) -> None:
+        self.broker = broker
+        self.topic = topic
+        self.handler = handler
+        self.workers = workers
+        self.receive_maximum = receive_maximum
+        self.keepalive = keepalive
+        self.connected = False
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._queue: asyncio.Queue[mqtt.MQTTMessage] = asyncio.Queue()
+        self._tasks: list[asyncio.Task[None]] = []
+        self._misc_task: asyncio.Task[None] | None = None
+        self._disconnected: asyncio.Event | None = None
+        self._stopping = False
+
+        client = mqtt.Client(
+            mqtt.CallbackAPIVersion.VERSION2,
+            protocol=mqtt.MQTTv5,
+            manual_ack=True,
+        )
+        if broker.username or broker.password:
+            client.username_pw_set(broker.username, broker.password)
+        if broker.tls:
+            tls_kwargs: dict[str, str] = {}
+            if tls_ca_cert:
+                tls_kwargs["ca_certs"] = tls_ca_cert
+            client.tls_set(**tls_kwargs)
+        client.on_connect = self._on_connect
+        client.on_disconnect = self._on_disconnect
+        client.on_message = self._on_message
+        client.on_socket_open = self._on_socket_open
+        client.on_socket_close = self._on_socket_close
+        client.on_socket_register_write = self._on_socket_register_write
+        client.on_socket_unregister_write = self._on_socket_unregister_write
+        self.client = client
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    async def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._disconnected = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._supervise()))
+
+    async def stop(self) -> None:
+        """受信を止め、受け取り済みのメッセージを処理し切ってから切断する。"""
+
+        self._stopping = True
+        if self.connected:
+            self.client.unsubscribe(self.topic)
+        await self._queue.join()
+        if self.connected and self._disconnected is not None:
+            self.client.disconnect()
+            try:
+                # DISCONNECT パケットはループの add_writer 経由で送られる
+                await asyncio.wait_for(self._disconnected.wait(), timeout=1.0)
+            except asyncio.TimeoutError:
+                pass
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _supervise(self) -> None:
+        assert self._loop is not None and self._disconnected is not None
+        properties = Properties(PacketTypes.CONNECT)
+        properties.ReceiveMaximum = self.receive_maximum
+        delay = 1.0
+        while not self._stopping:
+            self._disconnected.clear()
+            try:
+                # 名前解決と TCP/TLS の接続はブロックするのでスレッドに逃がす
+                await self._loop.run_in_executor(
+                    None,
+                    lambda: self.client.connect(
+                        self.broker.host,
+                        self.broker.port,
+                        keepalive=self.keepalive,
+                        properties=properties,
+                    ),
+                )
+            except OSError as exc:
+                print(f"MQTT 接続開始に失敗しました: {exc} / {delay:.0f} 秒後に再試行")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30.0)
+                continue
+            delay = 1.0
+            await self._disconnected.wait()
+            if not self._stopping:
+                await asyncio.sleep(delay)
+
+    async def _worker(self) -> None:
+        while True:
+            message = await self._queue.get()
+            try:
+                await self.handler(message)
+            finally:
+                # 失敗しても ack する（スレッド版と同じく再配信はさせない）
+                if message.qos > 0:
+                    self.client.ack(message.mid, message.qos)
+                self._queue.task_done()
+
+    async def _misc_loop(self) -> None:
+        while self.client.loop_misc() == mqtt.MQTT_ERR_SUCCESS:
+            await asyncio.sleep(1)
+
+    def _call_in_loop(self, callback: Callable[[], None]) -> None:
+        # paho のコールバックは connect 中のスレッドからも呼ばれるので、
+        # 別スレッドからはループに渡す。ループ上ではソケットが閉じられる前に
+        # 登録を外す必要があるので、その場で実行する。
+        assert self._loop is not None
+        try:
+            in_loop = asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            in_loop = False
+        if in_loop:
+            callback()
+        else:
+            self._loop.call_soon_threadsafe(callback)
+
+    def _on_socket_open(self, client: mqtt.Client, userdata, sock: socket.socket):
+        def register() -> None:
+            assert self._loop is not None
+            self._loop.add_reader(sock, self._on_readable, sock)
+            self._misc_task = self._loop.create_task(self._misc_loop())
+
+        self._call_in_loop(register)
+
+    def _on_readable(self, sock: socket.socket) -> None:
+        self.client.loop_read()
+        # TLS では復号済みのデータがソケットの外に残り、readable にならない
+        pending = getattr(sock, "pending", None)
+        while pending is not None and self.client.socket() is sock and pending():
+            self.client.loop_read()
+
+    def _on_socket_close(self, client: mqtt.Client, userdata, sock: socket.socket):
+        def unregister() -> None:
+            assert self._loop is not None
+            with contextlib.suppress(OSError, ValueError):
+                self._loop.remove_reader(sock)
+                self._loop.remove_writer(sock)
+            if self._misc_task is not None:
+                self._misc_task.cancel()
+                self._misc_task = None
+
+        self._call_in_loop(unregister)
+
+    def _on_socket_register_write(
+        self, client: mqtt.Client, userdata, sock: socket.socket
+    ):
+        assert self._loop is not None
+        loop = self._loop
+        self._call_in_loop(lambda: loop.add_writer(sock, self.client.loop_write))
+
+    def _on_socket_unregister_write(
+        self, client: mqtt.Client, userdata, sock: socket.socket
+    ):
+        assert self._loop is not None
+        loop = self._loop
+        self._call_in_loop(lambda: loop.remove_writer(sock))
+
+    def _on_connect(
+        self, client: mqtt.Client, userdata, flags, reason_code, properties
+    ):
+        if reason_code.is_failure:
+            print(f"MQTT 接続に失敗: {reason_code}")
+            return
+        self.connected = True
+        client.subscribe(self.topic, qos=1)
+        print(
+            f"MQTT 接続完了 (asyncio): {self.broker.host}:{self.broker.port}"
+            f" / topic={self.topic}"
+        )
+
+    def _on_disconnect(
+        self, client: mqtt.Client, userdata, flags, reason_code, properties
+    ):
+        self.connected = False
+        if not self._stopping:
+            print(f"MQTT 切断: {reason_code}")
+        if self._disconnected is not None:
+            self._call_in_loop(self._disconnected.set)
+
+    def _on_message(self, client: mqtt.Client, userdata, message: mqtt.MQTTMessage):
+        # ack を遅らせているので、キューの長さは Receive Maximum で頭打ちになる
+        self._queue.put_nowait(message)
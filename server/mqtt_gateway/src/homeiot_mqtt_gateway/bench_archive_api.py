@@ -0,0 +1,296 @@
+"""アーカイブ読み取り API（`/energy/daily`, `/energy/hourly`）の負荷ベンチマーク。
+
+合成データ（10 秒間隔・`--meters` 台・`--days` 日分）で DuckDB を作り、
+各モードのゲートウェイを子プロセスで起動して、keep-alive 接続を
+`--concurrency` 本張って GET を送り続ける。問い合わせは `--distinct` 通りの
+(endpoint, 期間, meter) から選ぶので、キャッシュに当たる割合はこれで変わる。
+`--cache-sizes 0,256` でキャッシュ無しと比べ、`--swap-interval` 秒ごとに
+バッチと同じ `os.replace` でファイルを入れ替えて、無効化の影響も見られる。
+
+    python -m homeiot_mqtt_gateway.bench_archive_api --days 90 --concurrency 32
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import tempfile
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+import duckdb
+
+from .bench_modes import (
+    MODES,
+    free_port,
+    percentile,
+    start_process,
+    stop_process,
+    wait_until_ready,
+)
+
+FIRST_DAY = date(2025, 1, 1)
+
+
+def build_archive(path: Path, *, meters: int, days: int) -> int:
+    """バッチと同じ列の raw_meter_readings と daily_source_rollups を作る。"""
+
+    with duckdb.connect(path.as_posix()) as connection:
+        connection.execute(
+            """
+            CREATE TABLE raw_meter_readings AS
+            SELECT
+              ts - INTERVAL 9 HOUR AS ts_utc,
+              ts AS ts_jst,
+              'meter' || lpad(CAST(m AS VARCHAR), 3, '0') AS source,
+              CAST(200 + (i * 37 + m * 11) % 900 AS DOUBLE) AS instant_power_w,
+              CASE WHEN i % 180 = 0 THEN i / 1000.0 END AS energy_import_kwh,
+              NULL::DOUBLE AS energy_export_kwh,
+              ts AS ingested_at
+            FROM range(?) AS meters(m),
+                 range(?) AS samples(i),
+                 LATERAL (
+                   SELECT CAST(? AS TIMESTAMP) + to_seconds(i * 10) AS ts
+                 )
+            ORDER BY source, ts_utc
+            """,
+            [meters, days * 8640, FIRST_DAY],
+        )
+        connection.execute(
+            """
+            CREATE TABLE daily_source_rollups AS
+            SELECT
+              CAST(ts_jst AS DATE) AS dt, source, COUNT(*) AS samples,
+              AVG(instant_power_w) AS avg_power_w,
+              MIN(instant_power_w) AS min_power_w,
+              MAX(instant_power_w) AS max_power_w,
+              MAX(energy_import_kwh) - MIN(energy_import_kwh) AS energy_import_kwh,
+              MIN(ts_utc) AS first_ts_utc, MAX(ts_utc) AS last_ts_utc
+            FROM raw_meter_readings
+            GROUP BY ALL
+            """
+        )
+        return connection.execute("SELECT COUNT(*) FROM raw_meter_readings").fetchone()[
+            0
+        ]
+
+
+def build_queries(
+    *, meters: int, days: int, distinct: int, seed: int | None
+) -> list[str]:
+    rng = random.Random(seed)
+    queries = set()
+    while len(queries) < distinct:
+        endpoint, span = rng.choice((("daily", 30), ("hourly", 1), ("hourly", 7)))
+        span = min(span, days)
+        start = FIRST_DAY + timedelta(days=rng.randrange(days - span + 1))
+        end = start + timedelta(days=span - 1)
+        query = f"/energy/{endpoint}?from={start}&to={end}"
+        if rng.random() < 0.5:
+            query += f"&meter=meter{rng.randrange(meters):03d}"
+        queries.add(query)
+    return sorted(queries)
+
+
+async def _get(
+    reader: asyncio.StreamReader, writer: asyncio.StreamWriter, path: str
+) -> tuple[int, bool]:
+    """ステータスと、キャッシュから返ったかどうか。本文は読み捨てる。"""
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: bench\r\n\r\n".encode())
+    await writer.drain()
+    head = await reader.readuntil(b"\r\n\r\n")
+    lines = head.decode("latin-1").split("\r\n")
+    status = int(lines[0].split(" ", 2)[1])
+    headers = {}
+    for line in lines[1:]:
+        key, _, value = line.partition(":")
+        headers[key.strip().lower()] = value.strip()
+    await reader.readexactly(int(headers.get("content-length", 0)))
+    return status, headers.get("x-archive-cache") == "hit"
+
+
+async def _connection(
+    port: int,
+    queries: list[str],
+    count: int,
+    rng: random.Random,
+    results: dict[str, list],
+) -> None:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    try:
+        for _ in range(count):
+            started = time.perf_counter()
+            status, hit = await _get(reader, writer, rng.choice(queries))
+            results["latencies"].append(time.perf_counter() - started)
+            if status != 200:
+                results["failures"].append(status)
+            elif hit:
+                results["hits"].append(1)
+    finally:
+        writer.close()
+
+
+async def _swap_loop(path: Path, interval: float, swaps: list[int]) -> None:
+    """バッチと同じく、コピーを書いてから os.replace で入れ替える。"""
+
+    next_path = path.with_suffix(".next.duckdb")
+    while True:
+        await asyncio.sleep(interval)
+        await asyncio.to_thread(shutil.copyfile, path, next_path)
+        os.replace(next_path, path)
+        swaps.append(1)
+
+
+async def run_load(
+    port: int,
+    queries: list[str],
+    *,
+    requests: int,
+    concurrency: int,
+    seed: int | None,
+    archive_path: Path | None = None,
+    swap_interval: float = 0.0,
+) -> dict[str, float]:
+    results: dict[str, list] = {"latencies": [], "failures": [], "hits": []}
+    swaps: list[int] = []
+    rng = random.Random(seed)
+    per_connection = max(requests // concurrency, 1)
+    swapper = None
+    if archive_path is not None and swap_interval > 0:
+        swapper = asyncio.create_task(_swap_loop(archive_path, swap_interval, swaps))
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(
+            *(
+                _connection(
+                    port, queries, per_connection, random.Random(rng.random()), results
+                )
+                for _ in range(concurrency)
+            )
+        )
+    finally:
+        if swapper is not None:
+            swapper.cancel()
+    elapsed = time.perf_counter() - started
+    latencies = results["latencies"]
+    return {
+        "requests": len(latencies),
+        "failures": len(results["failures"]),
+        "hit_ratio": len(results["hits"]) / max(len(latencies), 1),
+        "swaps": len(swaps),
+        "rps": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+    }
+
+
+async def run_benchmark(args: argparse.Namespace, workdir: Path) -> list[str]:
+    archive_path = workdir / "home_energy.duckdb"
+    rows = build_archive(archive_path, meters=args.meters, days=args.days)
+    queries = build_queries(
+        meters=args.meters, days=args.days, distinct=args.distinct, seed=args.seed
+    )
+    lines = [
+        f"rows={rows} requests={args.requests} concurrency={args.concurrency} "
+        f"distinct={len(queries)} pool={args.pool_size} "
+        f"swap_interval={args.swap_interval}s",
+        f"{'mode':<10}{'cache':>7}{'req/s':>9}{'p50 [ms]':>10}{'p99 [ms]':>10}"
+        f"{'hit':>7}{'swaps':>7}{'failed':>8}",
+    ]
+    for mode in args.modes.split(","):
+        for cache_size in args.cache_sizes.split(","):
+            port = free_port()
+            env = dict(
+                os.environ,
+                ARCHIVE_DUCKDB_PATH=archive_path.as_posix(),
+                ARCHIVE_POOL_SIZE=str(args.pool_size),
+                ARCHIVE_CACHE_SIZE=cache_size,
+                INFLUX_URL="http://127.0.0.1:9",
+                MQTT_BROKER_URL="",
+            )
+            gateway = start_process(
+                ["-m", "uvicorn", MODES[mode], "--port", str(port), "--no-access-log"],
+                env,
+            )
+            try:
+                await wait_until_ready(port)
+                # 最初の接続を開くコストを除くため、少し流してから測る
+                await run_load(
+                    port,
+                    queries,
+                    requests=args.concurrency,
+                    concurrency=args.concurrency,
+                    seed=args.seed,
+                )
+                result = await run_load(
+                    port,
+                    queries,
+                    requests=args.requests,
+                    concurrency=args.concurrency,
+                    seed=args.seed,
+                    archive_path=archive_path,
+                    swap_interval=args.swap_interval,
+                )
+            finally:
+                stop_process(gateway)
+            lines.append(
+                f"{mode:<10}{cache_size:>7}{result['rps']:>9.0f}"
+                f"{result['p50_ms']:>10.1f}{result['p99_ms']:>10.1f}"
+                f"{result['hit_ratio']:>7.2f}{result['swaps']:>7.0f}"
+                f"{result['failures']:>8.0f}"
+            )
+    return lines
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="アーカイブ読み取り API を同時接続で叩き、p50 / p99 を測る"
+    )
+    parser.add_argument("--meters", type=int, default=3, help="合成データのメーター数")
+    parser.add_argument("--days", type=int, default=60, help="合成データの日数")
+    parser.add_argument("--requests", type=int, default=2000, help="送信件数")
+    parser.add_argument("--concurrency", type=int, default=32, help="同時接続数")
+    parser.add_argument(
+        "--distinct", type=int, default=50, help="問い合わせの種類（少ないほど当たる）"
+    )
+    parser.add_argument("--pool-size", type=int, default=4, help="ARCHIVE_POOL_SIZE")
+    parser.add_argument(
+        "--cache-sizes",
+        default="0,256",
+        help="比べる ARCHIVE_CACHE_SIZE（カンマ区切り）",
+    )
+    parser.add_argument(
+        "--swap-interval",
+        type=float,
+        default=0.0,
+        help="この秒数ごとにファイルを入れ替える（0 で入れ替えない）",
+    )
+    parser.add_argument(
+        "--modes", default="threaded,asyncio", help="比較するモード（カンマ区切り）"
+    )
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument(
+        "--workdir", help="合成データの置き場所（既定は一時ディレクトリ）"
+    )
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    if args.workdir:
+        workdir = Path(args.workdir)
+        workdir.mkdir(parents=True, exist_ok=True)
+        for line in asyncio.run(run_benchmark(args, workdir)):
+            print(line)
+        return
+    with tempfile.TemporaryDirectory(prefix="bench-archive-api-") as tmp:
+        for line in asyncio.run(run_benchmark(args, Path(tmp))):
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+"""スレッド版と asyncio 版のゲートウェイを HTTP 取り込みで比べるベンチマーク。
+
+fake_influx と各モードの uvicorn を子プロセスで起動し、keep-alive 接続を
+`--concurrency` 本張って `POST /readings` を送り続け、処理件数/秒と
+応答時間の p50 / p99 を表示する。MQTT は使わない（MQTT_BROKER_URL を空にする）。
+
+    python -m homeiot_mqtt_gateway.bench_modes --requests 5000 --concurrency 64
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+MODES = {
+    "threaded": "homeiot_mqtt_gateway.main:app",
+    "asyncio": "homeiot_mqtt_gateway.async_app:app",
+}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def wait_until_ready(port: int, timeout: float = 20.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        except OSError:
+            await asyncio.sleep(0.1)
+            continue
+        writer.close()
+        return
+    raise RuntimeError(f"ポート {port} が開きませんでした")
+
+
+async def _read_response(reader: asyncio.StreamReader) -> int:
+    head = await reader.readuntil(b"\r\n\r\n")
+    lines = head.decode("latin-1").split("\r\n")
+    status = int(lines[0].split(" ", 2)[1])
+    length = 0
+    for line in lines[1:]:
+        key, _, value = line.partition(":")
+        if key.strip().lower() == "content-length":
+            length = int(value)
+    await reader.readexactly(length)
+    return status
+
+
+async def _connection(
+    port: int, count: int, meter: str, latencies: list[float], failures: list[int]
+) -> None:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    try:
+        for seq in range(count):
+            now = datetime.now(timezone.utc).isoformat()
+            body = json.dumps(
+                {
+                    "meter": meter,
+                    "power_w": 400.0 + seq % 50,
+                    "measured_at": now,
+                    "published_at": now,
+                    "seq": seq,
+                }
+            ).encode()
+            started = time.perf_counter()
+            writer.write(
+                b"POST /readings HTTP/1.1\r\nHost: bench\r\n"
+                b"Content-Type: application/json\r\n"
+                + f"Content-Length: {len(body)}\r\n\r\n".encode()
+                + body
+            )
+            await writer.drain()
+            status = await _read_response(reader)
+            latencies.append(time.perf_counter() - started)
+            if status != 200:
+                failures.append(status)
+    finally:
+        writer.close()
+
+
+async def run_load(port: int, *, requests: int, concurrency: int) -> dict[str, float]:
+    latencies: list[float] = []
+    failures: list[int] = []
+    per_connection = max(requests // concurrency, 1)
+    started = time.perf_counter()
+    await asyncio.gather(
+        *(
+            _connection(port, per_connection, f"meter{i:03d}", latencies, failures)
+            for i in range(concurrency)
+        )
+    )
+    elapsed = time.perf_counter() - started
+    return {
+        "requests": len(latencies),
+        "failures": len(failures),
+        "rps": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+    }
+
+
+def start_process(args: list[str], env: dict[str, str]) -> subprocess.Popen[bytes]:
+    return subprocess.Popen(
+        [sys.executable, *args],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+def stop_process(process: subprocess.Popen[bytes]) -> None:
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+async def run_benchmark(args: argparse.Namespace) -> list[str]:
+    influx_port = free_port()
+    fake = start_process(
+        [
+            "-m",
+            "homeiot_mqtt_gateway.fake_influx",
+            "--port",
+            str(influx_port),
+            "--latency-ms",
+            str(args.influx_latency_ms),
+        ],
+        dict(os.environ),
+    )
+    lines = [
+        f"requests={args.requests} concurrency={args.concurrency} "
+        f"influx_latency={args.influx_latency_ms}ms",
+        f"{'mode':<10}{'req/s':>10}{'p50 [ms]':>10}{'p99 [ms]':>10}{'failed':>8}",
+    ]
+    try:
+        await wait_until_ready(influx_port)
+        for mode in args.modes.split(","):
+            port = free_port()
+            env = dict(
+                os.environ,
+                INFLUX_URL=f"http://127.0.0.1:{influx_port}",
+                INFLUX_TOKEN="bench",
+                INFLUX_ORG="bench",
+                INFLUX_BUCKET="bench",
+                MQTT_BROKER_URL="",
+                # 1 接続を 1 メーターとして毎秒数百件送るので、受け付け制御は切って
+                # 書き込み経路そのものを比べる
+                INGEST_ADMISSION="off",
+            )
+            gateway = start_process(
+                ["-m", "uvicorn", MODES[mode], "--port", str(port), "--no-access-log"],
+                env,
+            )
+            try:
+                await wait_until_ready(port)
+                # 接続と JIT 的な初期化の影響を除くため、少し流してから測る
+                await run_load(
+                    port, requests=args.concurrency, concurrency=args.concurrency
+                )
+                result = await run_load(
+                    port, requests=args.requests, concurrency=args.concurrency
+                )
+            finally:
+                stop_process(gateway)
+            lines.append(
+                f"{mode:<10}{result['rps']:>10.0f}{result['p50_ms']:>10.1f}"
+                f"{result['p99_ms']:>10.1f}{result['failures']:>8.0f}"
+            )
+    finally:
+        stop_process(fake)
+    return lines
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="スレッド版と asyncio 版のゲートウェイの取り込み性能を比べる"
+    )
+    parser.add_argument("--requests", type=int, default=5000, help="送信件数")
+    parser.add_argument("--concurrency", type=int, default=64, help="同時接続数")
+    parser.add_argument(
+        "--influx-latency-ms", type=float, default=5.0, help="fake_influx の応答遅延"
+    )
+    parser.add_argument(
+        "--modes", default="threaded,asyncio", help="比較するモード（カンマ区切り）"
+    )
+    return parser.parse_args()
+
+
+def main() -> None:
+    for line in asyncio.run(run_benchmark(parse_args())):
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
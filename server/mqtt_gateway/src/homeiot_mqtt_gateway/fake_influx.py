@@ -0,0 +1,160 @@
+"""負荷試験用の InfluxDB v2 書き込みエンドポイントの代役。
+
+`POST /api/v2/write` を受けて、指定の遅延のあと 204（一定の割合で 503）を返す。
+受け付けた行数は `GET /stats` で JSON として取れる。`record_points=True` のときは
+行ごとの到着遅れ（到着時刻 - 行のタイムスタンプ）と重複も記録する（loadtest 用）。
+`replay_marker` を含む行（過去分の再送）は `replayed` に数えるだけで、遅れには含めない。
+
+    python -m homeiot_mqtt_gateway.fake_influx --port 8086 --latency-ms 5
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import random
+import time
+
+
+class FakeInflux:
+    def __init__(
+        self,
+        *,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        seed: int | None = None,
+        record_points: bool = False,
+        replay_marker: bytes | None = None,
+    ) -> None:
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.record_points = record_points
+        self.replay_marker = replay_marker
+        self._random = random.Random(seed)
+        self.reset()
+
+    def reset(self) -> None:
+        self.writes = 0
+        self.points = 0
+        self.errors = 0
+        self.duplicates = 0
+        self.replayed = 0
+        self.latencies: list[float] = []
+        self.last_point_at: float | None = None
+        self._seen: set[bytes] = set()
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "writes": self.writes,
+            "points": self.points,
+            "errors": self.errors,
+            "duplicates": self.duplicates,
+            "replayed": self.replayed,
+        }
+
+    def _record(self, lines: list[bytes]) -> None:
+        now = time.time()
+        for line in lines:
+            if self.replay_marker is not None and self.replay_marker in line:
+                self.replayed += 1
+                continue
+            self.last_point_at = now
+            if line in self._seen:
+                self.duplicates += 1
+                continue
+            self._seen.add(line)
+            # 行末のタイムスタンプは ns 精度（influxdb-client の既定）
+            timestamp = line.rsplit(b" ", 1)[-1]
+            if timestamp.isdigit():
+                self.latencies.append(now - int(timestamp) / 1e9)
+
+    async def _respond(self, method: str, path: str, body: bytes) -> tuple[int, bytes]:
+        if method == "POST" and path.startswith("/api/v2/write"):
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if self._random.random() < self.error_rate:
+                self.errors += 1
+                return 503, b'{"code":"unavailable","message":"injected"}'
+            lines = [line for line in body.splitlines() if line.strip()]
+            self.writes += 1
+            self.points += len(lines)
+            if self.record_points:
+                self._record(lines)
+            return 204, b""
+        if path.startswith("/stats"):
+            return 200, json.dumps(self.stats()).encode()
+        if path.startswith(("/ping", "/health")):
+            return 204, b""
+        return 404, b""
+
+    async def handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    return
+                lines = head.decode("latin-1").split("\r\n")
+                method, path, _ = lines[0].split(" ", 2)
+                headers = {
+                    key.strip().lower(): value.strip()
+                    for key, _, value in (line.partition(":") for line in lines[1:])
+                    if key
+                }
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                status, payload = await self._respond(method, path, body)
+                reason = {200: "OK", 204: "No Content", 404: "Not Found"}.get(
+                    status, "Service Unavailable"
+                )
+                writer.write(
+                    f"HTTP/1.1 {status} {reason}\r\n"
+                    f"Content-Length: {len(payload)}\r\n"
+                    "Content-Type: application/json\r\n\r\n".encode()
+                    + payload
+                )
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve(self, host: str, port: int) -> asyncio.Server:
+        return await asyncio.start_server(self.handle, host, port)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="負荷試験用の InfluxDB 書き込みの代役")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8086)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="応答前の遅延")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="遅延に足す揺らぎ")
+    parser.add_argument(
+        "--error-rate", type=float, default=0.0, help="503 を返す割合 (0〜1)"
+    )
+    return parser.parse_args()
+
+
+async def _main(args: argparse.Namespace) -> None:
+    fake = FakeInflux(
+        latency=args.latency_ms / 1000,
+        jitter=args.jitter_ms / 1000,
+        error_rate=args.error_rate,
+    )
+    server = await fake.serve(args.host, args.port)
+    async with server:
+        await server.serve_forever()
+
+
+def main() -> None:
+    try:
+        asyncio.run(_main(parse_args()))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
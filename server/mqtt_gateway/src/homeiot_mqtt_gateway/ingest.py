@@ -0,0 +1,106 @@
+"""スレッド版・asyncio 版のゲートウェイで共有する設定と取り込み処理。"""
+
+from __future__ import annotations
+
+import os
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Optional
+from urllib.parse import urlparse
+
+from influxdb_client import Point
+from pydantic import BaseModel, Field
+
+from .metrics import SEQUENCES, observe_stage
+
+INFLUX_URL = os.getenv("INFLUX_URL")
+INFLUX_TOKEN = os.getenv("INFLUX_TOKEN")
+INFLUX_ORG = os.getenv("INFLUX_ORG")
+INFLUX_BUCKET = os.getenv("INFLUX_BUCKET")
+MQTT_BROKER_URL = os.getenv("MQTT_BROKER_URL", "mqtt://mqtt:1883")
+MQTT_TOPIC = os.getenv("MQTT_TOPIC", "home/power")
+MQTT_TLS_CA_CERT = os.getenv("MQTT_TLS_CA_CERT")
+
+
+class PowerReading(BaseModel):
+    meter: str = Field(description="Logical meter name, e.g. 'home'")
+    power_w: float = Field(description="Instantaneous power in watts")
+    energy_import_kwh: Optional[float] = Field(
+        default=None, description="Cumulative imported energy in kWh"
+    )
+    measured_at: Optional[datetime] = Field(
+        default=None, description="UTC timestamp supplied by the device"
+    )
+    published_at: Optional[datetime] = Field(
+        default=None, description="UTC timestamp when the device published the reading"
+    )
+    seq: Optional[int] = Field(
+        default=None, description="Monotonic sequence number since device start"
+    )
+
+
+@dataclass(frozen=True)
+class BrokerSettings:
+    host: str
+    port: int
+    username: str | None
+    password: str | None
+    tls: bool
+
+
+def parse_broker_url(url: str) -> BrokerSettings | None:
+    parsed = urlparse(url)
+    if not parsed.hostname:
+        print(f"MQTT_BROKER_URL のホストが不正です: {url}")
+        return None
+    tls = parsed.scheme in ("mqtts", "ssl", "tls")
+    return BrokerSettings(
+        host=parsed.hostname,
+        port=parsed.port or (8883 if tls else 1883),
+        username=parsed.username,
+        password=parsed.password or None,
+        tls=tls,
+    )
+
+
+def build_point(reading: PowerReading) -> Point:
+    point = (
+        Point("smartmeter_power")
+        .tag("meter", reading.meter)
+        .field("power_w", float(reading.power_w))
+    )
+    if reading.energy_import_kwh is not None:
+        point.field("energy_import_kwh", float(reading.energy_import_kwh))
+    if reading.measured_at:
+        point.time(reading.measured_at)
+    return point
+
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def record_trace(
+    reading: PowerReading,
+    *,
+    transport: str,
+    received_at: datetime,
+    decoded_at: datetime,
+    committed_at: datetime,
+) -> None:
+    """計測から Influx 書き込み完了までの段階別レイテンシを記録する。"""
+
+    if reading.measured_at and reading.published_at:
+        observe_stage(
+            "device", reading.measured_at, reading.published_at, transport=transport
+        )
+    if reading.published_at:
+        observe_stage("transit", reading.published_at, received_at, transport=transport)
+    observe_stage("decode", received_at, decoded_at, transport=transport)
+    observe_stage("influx_write", decoded_at, committed_at, transport=transport)
+    if reading.measured_at:
+        observe_stage(
+            "end_to_end", reading.measured_at, committed_at, transport=transport
+        )
+    if reading.seq is not None:
+        SEQUENCES.observe(reading.meter, reading.seq)
@@ -0,0 +1,393 @@
+"""MQTT 経由の取り込み容量を測る負荷試験ツール。
+
+N 台の仮想デバイスがローカルのブローカーへ `PowerReading` を QoS 1 で publish し、
+子プロセスで起動したゲートウェイがこのプロセス内の FakeInflux に書き込む。
+FakeInflux に届いた点の measured_at（= publish 時刻）との差を publish から
+Influx 書き込みまでのレイテンシとして集計し、処理件数/秒・欠損・重複・
+p50 / p95 / p99 を表示する。`--min-rate` などの閾値を割ると終了コード 1 を返す。
+`--replay-devices` を付けると、別のデバイス群が過去分（10 秒間隔で
+`--replay-points` 件）を止まらずに送り、再接続直後の一括再送の間に
+live の点の遅れがどうなるかを見られる（遅れの集計は live の点だけ）。
+
+ローカルのブローカー（認証なし）:
+    docker run --rm -p 1883:1883 eclipse-mosquitto:2.0 \\
+        mosquitto -c /mosquitto-no-auth.conf
+
+    python -m homeiot_mqtt_gateway.loadtest --devices 50 --rate 2 --duration 30
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+import uuid
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta, timezone
+
+import paho.mqtt.client as mqtt
+
+from .bench_modes import (
+    MODES,
+    free_port,
+    percentile,
+    start_process,
+    stop_process,
+    wait_until_ready,
+)
+from .fake_influx import FakeInflux
+from .ingest import BrokerSettings, parse_broker_url
+
+PROBE_METER = "loadtest-probe"
+REPLAY_PREFIX = "replay"
+
+
+@dataclass
+class LoadResult:
+    mode: str
+    devices: int
+    offered_rate: float
+    published: int
+    publish_failed: int
+    written: int
+    influx_errors: int
+    duplicates: int
+    dropped: int
+    sustained_rate: float
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    max_ms: float
+    replay_published: int = 0
+    replay_written: int = 0
+
+
+def _payload(meter: str, seq: int, measured_at: datetime | None = None) -> str:
+    now = datetime.now(timezone.utc)
+    # power_w に seq を入れて、同じ時刻に並んだ点も別の行として数えられるようにする
+    return json.dumps(
+        {
+            "meter": meter,
+            "power_w": float(seq),
+            "measured_at": (measured_at or now).isoformat(),
+            "published_at": now.isoformat(),
+            "seq": seq,
+        }
+    )
+
+
+def _connect_device(broker: BrokerSettings, meter: str) -> mqtt.Client:
+    client = mqtt.Client(
+        mqtt.CallbackAPIVersion.VERSION2,
+        client_id=f"{meter}-{uuid.uuid4().hex[:8]}",
+        protocol=mqtt.MQTTv5,
+    )
+    # QoS 1 の未 ack を溜められるだけ溜める（デバイス側で詰まらせない）
+    client.max_inflight_messages_set(1000)
+    if broker.username or broker.password:
+        client.username_pw_set(broker.username, broker.password)
+    if broker.tls:
+        client.tls_set()
+    client.connect(broker.host, broker.port)
+    client.loop_start()
+    return client
+
+
+class DeviceFleet:
+    """仮想デバイス群。publish の成否を数える。"""
+
+    def __init__(
+        self, broker: BrokerSettings, topic: str, devices: int, prefix: str = "load"
+    ) -> None:
+        self.topic = topic
+        self.meters = [f"{prefix}{i:04d}" for i in range(devices)]
+        self.clients = [_connect_device(broker, meter) for meter in self.meters]
+        self.published = 0
+        self.failed = 0
+
+    def publish(
+        self,
+        client: mqtt.Client,
+        meter: str,
+        seq: int,
+        measured_at: datetime | None = None,
+    ) -> None:
+        info = client.publish(self.topic, _payload(meter, seq, measured_at), qos=1)
+        if info.rc == mqtt.MQTT_ERR_SUCCESS:
+            self.published += 1
+        else:
+            self.failed += 1
+
+    async def run(
+        self, *, rate: float, burst: int, duration: float, seed: int | None
+    ) -> None:
+        """各デバイスが平均 `rate` 件/秒、`burst` 件ずつまとめて送る。"""
+
+        loop = asyncio.get_running_loop()
+        interval = burst / rate
+        deadline = loop.time() + duration
+        offsets = random.Random(seed)
+
+        async def device(client: mqtt.Client, meter: str) -> None:
+            # 全台が同じ瞬間に送らないよう開始をずらす
+            next_at = loop.time() + offsets.uniform(0, interval)
+            seq = 0
+            while next_at < deadline:
+                await asyncio.sleep(max(0.0, next_at - loop.time()))
+                for _ in range(burst):
+                    self.publish(client, meter, seq)
+                    seq += 1
+                next_at += interval
+
+        await asyncio.gather(
+            *(device(client, meter) for client, meter in zip(self.clients, self.meters))
+        )
+
+    async def replay(self, *, points: int, interval: float = 10.0) -> None:
+        """各デバイスが `interval` 秒間隔の過去分 `points` 件を止まらずに送る。"""
+
+        start = datetime.now(timezone.utc) - timedelta(seconds=points * interval)
+        for seq in range(points):
+            measured_at = start + timedelta(seconds=seq * interval)
+            for client, meter in zip(self.clients, self.meters):
+                self.publish(client, meter, seq, measured_at)
+            if seq % 100 == 99:
+                # live のデバイスの送信を止めないよう、ときどきループに返す
+                await asyncio.sleep(0)
+
+    def close(self) -> None:
+        for client in self.clients:
+            client.disconnect()
+            client.loop_stop()
+
+
+async def _wait_for_subscription(
+    fake: FakeInflux, broker: BrokerSettings, topic: str, timeout: float = 30.0
+) -> None:
+    """プローブを送り、ゲートウェイが購読して書き込むまで待つ。"""
+
+    probe = _connect_device(broker, PROBE_METER)
+    deadline = time.monotonic() + timeout
+    try:
+        seq = 0
+        while fake.points == 0:
+            if time.monotonic() > deadline:
+                raise RuntimeError("ゲートウェイがプローブを書き込みませんでした")
+            probe.publish(topic, _payload(PROBE_METER, seq), qos=1)
+            seq += 1
+            await asyncio.sleep(0.5)
+    finally:
+        probe.disconnect()
+        probe.loop_stop()
+
+
+async def _drain(fake: FakeInflux, expected: int, idle_timeout: float) -> None:
+    """届く見込みの件数に達するか、`idle_timeout` 秒進みが止まるまで待つ。"""
+
+    last_count = -1
+    last_progress = time.monotonic()
+    while fake.points + fake.errors < expected:
+        count = fake.points + fake.errors
+        if count != last_count:
+            last_count = count
+            last_progress = time.monotonic()
+        elif time.monotonic() - last_progress > idle_timeout:
+            return
+        await asyncio.sleep(0.2)
+
+
+async def run_loadtest(args: argparse.Namespace) -> LoadResult:
+    broker = parse_broker_url(args.broker_url)
+    if broker is None:
+        raise SystemExit(1)
+    topic = f"loadtest/{uuid.uuid4().hex[:8]}"
+    fake = FakeInflux(
+        latency=args.influx_latency_ms / 1000,
+        jitter=args.influx_jitter_ms / 1000,
+        error_rate=args.influx_error_rate,
+        seed=args.seed,
+        record_points=True,
+        replay_marker=f"meter={REPLAY_PREFIX}".encode(),
+    )
+    influx_port = free_port()
+    server = await fake.serve("127.0.0.1", influx_port)
+    gateway_port = free_port()
+    env = dict(
+        os.environ,
+        INFLUX_URL=f"http://127.0.0.1:{influx_port}",
+        INFLUX_TOKEN="loadtest",
+        INFLUX_ORG="loadtest",
+        INFLUX_BUCKET="loadtest",
+        MQTT_BROKER_URL=args.broker_url,
+        MQTT_TOPIC=topic,
+    )
+    gateway = start_process(
+        [
+            "-m",
+            "uvicorn",
+            MODES[args.mode],
+            "--port",
+            str(gateway_port),
+            "--no-access-log",
+        ],
+        env,
+    )
+    fleet: DeviceFleet | None = None
+    replay: DeviceFleet | None = None
+    try:
+        await wait_until_ready(gateway_port)
+        await _wait_for_subscription(fake, broker, topic)
+        fleet = DeviceFleet(broker, topic, args.devices)
+        senders = [
+            fleet.run(
+                rate=args.rate, burst=args.burst, duration=args.duration, seed=args.seed
+            )
+        ]
+        if args.replay_devices:
+            replay = DeviceFleet(
+                broker, topic, args.replay_devices, prefix=REPLAY_PREFIX
+            )
+            senders.append(replay.replay(points=args.replay_points))
+        await asyncio.sleep(0.5)
+        fake.reset()
+        started = time.time()
+        await asyncio.gather(*senders)
+        replay_published = replay.published if replay is not None else 0
+        await _drain(fake, fleet.published + replay_published, args.drain_timeout)
+    finally:
+        for devices in (fleet, replay):
+            if devices is not None:
+                devices.close()
+        stop_process(gateway)
+        server.close()
+
+    latencies = fake.latencies or [0.0]
+    written = len(fake.latencies)
+    elapsed = max((fake.last_point_at or time.time()) - started, 1e-9)
+    return LoadResult(
+        mode=args.mode,
+        devices=args.devices,
+        offered_rate=args.devices * args.rate,
+        published=fleet.published,
+        publish_failed=fleet.failed,
+        written=written,
+        influx_errors=fake.errors,
+        duplicates=fake.duplicates,
+        dropped=max(fleet.published - written, 0),
+        sustained_rate=written / elapsed,
+        p50_ms=percentile(latencies, 0.50) * 1000,
+        p95_ms=percentile(latencies, 0.95) * 1000,
+        p99_ms=percentile(latencies, 0.99) * 1000,
+        max_ms=max(latencies) * 1000,
+        replay_published=replay_published,
+        replay_written=fake.replayed,
+    )
+
+
+def check_thresholds(result: LoadResult, args: argparse.Namespace) -> list[str]:
+    """閾値を割った項目を返す。空なら合格。"""
+
+    failures = []
+    if args.min_rate is not None and result.sustained_rate < args.min_rate:
+        failures.append(f"処理件数/秒 {result.sustained_rate:.1f} < {args.min_rate}")
+    drop_ratio = result.dropped / result.published if result.published else 0.0
+    if args.max_drop_ratio is not None and drop_ratio > args.max_drop_ratio:
+        failures.append(f"欠損率 {drop_ratio:.4f} > {args.max_drop_ratio}")
+    if args.max_p99_ms is not None and result.p99_ms > args.max_p99_ms:
+        failures.append(f"p99 {result.p99_ms:.1f}ms > {args.max_p99_ms}ms")
+    return failures
+
+
+def format_result(result: LoadResult, args: argparse.Namespace) -> list[str]:
+    lines = [
+        f"mode={result.mode} devices={result.devices} rate={args.rate}/s "
+        f"burst={args.burst} duration={args.duration}s "
+        f"influx_latency={args.influx_latency_ms}ms "
+        f"error_rate={args.influx_error_rate}",
+        f"offered       {result.offered_rate:>10.1f} msg/s",
+        f"sustained     {result.sustained_rate:>10.1f} msg/s",
+        f"published     {result.published:>10d}  "
+        f"(publish 失敗 {result.publish_failed})",
+        f"written       {result.written:>10d}  (重複 {result.duplicates})",
+        f"dropped       {result.dropped:>10d}  (うち Influx エラー注入 "
+        f"{result.influx_errors})",
+        f"latency [ms]  p50={result.p50_ms:.1f} p95={result.p95_ms:.1f} "
+        f"p99={result.p99_ms:.1f} max={result.max_ms:.1f}",
+    ]
+    if args.replay_devices:
+        lines.append(
+            f"replay        {result.replay_published:>10d}  "
+            f"(Influx に届いた点 {result.replay_written}、集約後)"
+        )
+    return lines
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="仮想デバイスから MQTT で送り、ゲートウェイの取り込み容量を測る"
+    )
+    parser.add_argument("--broker-url", default="mqtt://127.0.0.1:1883")
+    parser.add_argument("--mode", choices=sorted(MODES), default="threaded")
+    parser.add_argument("--devices", type=int, default=20, help="仮想デバイス数")
+    parser.add_argument(
+        "--rate", type=float, default=1.0, help="1 台あたりの平均送信件数/秒"
+    )
+    parser.add_argument(
+        "--burst",
+        type=int,
+        default=1,
+        help="1 回にまとめて送る件数（1 なら等間隔、平均レートは --rate のまま）",
+    )
+    parser.add_argument("--duration", type=float, default=30.0, help="送信する秒数")
+    parser.add_argument(
+        "--drain-timeout",
+        type=float,
+        default=10.0,
+        help="送信後、書き込みの進みが止まってから諦めるまでの秒数",
+    )
+    parser.add_argument(
+        "--replay-devices",
+        type=int,
+        default=0,
+        help="過去分を一括で再送するデバイス数（live とは別に数える）",
+    )
+    parser.add_argument(
+        "--replay-points",
+        type=int,
+        default=8640,
+        help="再送デバイス 1 台あたりの過去分の件数（10 秒間隔、既定は 1 日分）",
+    )
+    parser.add_argument("--influx-latency-ms", type=float, default=5.0)
+    parser.add_argument("--influx-jitter-ms", type=float, default=0.0)
+    parser.add_argument(
+        "--influx-error-rate", type=float, default=0.0, help="503 を返す割合 (0〜1)"
+    )
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--min-rate", type=float, help="処理件数/秒の下限")
+    parser.add_argument("--max-drop-ratio", type=float, help="欠損率の上限 (0〜1)")
+    parser.add_argument("--max-p99-ms", type=float, help="p99 レイテンシの上限")
+    parser.add_argument("--json", action="store_true", help="結果を JSON で出力する")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    result = asyncio.run(run_loadtest(args))
+    if args.json:
+        print(json.dumps(asdict(result), ensure_ascii=False))
+    else:
+        for line in format_result(result, args):
+            print(line)
+    failures = check_thresholds(result, args)
+    for failure in failures:
+        print(f"容量チェック不合格: {failure}", file=sys.stderr)
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,76 +1,101 @@
+"""スレッド版ゲートウェイ（paho のバックグラウンドスレッド + 同期 Influx 書き込み）。
+
+asyncio 版は `homeiot_mqtt_gateway.async_app:app`。
+"""
+
 from __future__ import annotations
 
 import json
-import os
-from datetime import datetime
-from typing import Optional
-from urllib.parse import urlparse
+import threading
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
 
 import paho.mqtt.client as mqtt
-from fastapi import FastAPI
-from influxdb_client import InfluxDBClient, Point
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import PlainTextResponse
+from influxdb_client import InfluxDBClient
 from influxdb_client.client.write_api import SYNCHRONOUS, WriteApi
-from pydantic import BaseModel, Field
-
-
-INFLUX_URL = os.getenv("INFLUX_URL")
-INFLUX_TOKEN = os.getenv("INFLUX_TOKEN")
-INFLUX_ORG = os.getenv("INFLUX_ORG")
-INFLUX_BUCKET = os.getenv("INFLUX_BUCKET")
-MQTT_BROKER_URL = os.getenv("MQTT_BROKER_URL", "mqtt://mqtt:1883")
-MQTT_TOPIC = os.getenv("MQTT_TOPIC", "home/power")
-MQTT_TLS_CA_CERT = os.getenv("MQTT_TLS_CA_CERT")
 
-app = FastAPI(title="Home IoT Server", version="0.2.0")
-
-
-class PowerReading(BaseModel):
-    meter: str = Field(description="Logical meter name, e.g. 'home'")
-    power_w: float = Field(description="Instantaneous power in watts")
-    energy_import_kwh: Optional[float] = Field(
-        default=None, description="Cumulative imported energy in kWh"
-    )
-    measured_at: Optional[datetime] = Field(
-        default=None, description="UTC timestamp supplied by the device"
+from .admission import (
+    LIVE,
+    SHED,
+    AdmissionController,
+    BacklogEntry,
+    record_deferred,
+)
+from .archive_api import ArchiveReader
+from .archive_api import router as archive_router
+from .ingest import (
+    INFLUX_BUCKET,
+    INFLUX_ORG,
+    INFLUX_TOKEN,
+    INFLUX_URL,
+    MQTT_BROKER_URL,
+    MQTT_TLS_CA_CERT,
+    MQTT_TOPIC,
+    PowerReading,
+    build_point,
+    parse_broker_url,
+    record_trace,
+    utcnow,
+)
+from .metrics import READINGS, render_metrics
+
+
+def _write_to_influx(write_api: WriteApi, reading: PowerReading) -> None:
+    write_api.write(bucket=INFLUX_BUCKET, org=INFLUX_ORG, record=build_point(reading))
+
+
+def _write_backlog(write_api: WriteApi, batch: list[BacklogEntry]) -> None:
+    write_api.write(
+        bucket=INFLUX_BUCKET,
+        org=INFLUX_ORG,
+        record=[entry.to_point() for entry in batch],
     )
 
 
-client = InfluxDBClient(url=INFLUX_URL, token=INFLUX_TOKEN, org=INFLUX_ORG)
-write_api: WriteApi = client.write_api(write_options=SYNCHRONOUS)
+def _drain_backlog(
+    write_api: WriteApi, admission: AdmissionController, stop: threading.Event
+) -> None:
+    """滞留キューを AIMD で決まる速度で書く。live の書き込みとは別スレッド。"""
 
-
-def _write_to_influx(reading: PowerReading) -> None:
-    point = (
-        Point("smartmeter_power")
-        .tag("meter", reading.meter)
-        .field("power_w", float(reading.power_w))
-    )
-    if reading.energy_import_kwh is not None:
-        point.field("energy_import_kwh", float(reading.energy_import_kwh))
-    if reading.measured_at:
-        point.time(reading.measured_at)
-
-    write_api.write(bucket=INFLUX_BUCKET, org=INFLUX_ORG, record=point)
+    while not stop.is_set():
+        batch = admission.next_batch()
+        if not batch:
+            stop.wait(0.2)
+            continue
+        try:
+            _write_backlog(write_api, batch)
+        except Exception as exc:
+            admission.failed(batch)
+            print(f"滞留分の書き込みに失敗: {exc} / {len(batch)} 件を戻して再試行")
+            stop.wait(1.0)
+            continue
+        stop.wait(admission.written(batch))
+    # 停止時は残りを速度制限なしで書き切る
+    while batch := admission.next_batch():
+        try:
+            _write_backlog(write_api, batch)
+        except Exception as exc:
+            admission.failed(batch)
+            print(f"滞留分を書き切れませんでした: {exc} / 残り {admission.pending} 件")
+            return
+        admission.written(batch)
 
 
-def _build_mqtt_client() -> mqtt.Client | None:
-    parsed = urlparse(MQTT_BROKER_URL)
-    if not parsed.hostname:
-        print(f"MQTT_BROKER_URL のホストが不正です: {MQTT_BROKER_URL}")
+def _build_mqtt_client(
+    write_api: WriteApi, admission: AdmissionController
+) -> mqtt.Client | None:
+    broker = parse_broker_url(MQTT_BROKER_URL)
+    if broker is None:
         return None
 
-    host = parsed.hostname
-    if parsed.scheme in ("mqtts", "ssl", "tls"):
-        port = parsed.port or 8883
-    else:
-        port = parsed.port or 1883
-
     mqtt_client = mqtt.Client(protocol=mqtt.MQTTv5)
     mqtt_client.reconnect_delay_set(min_delay=1, max_delay=30)
-    if parsed.username or parsed.password:
-        mqtt_client.username_pw_set(parsed.username, parsed.password or None)
+    if broker.username or broker.password:
+        mqtt_client.username_pw_set(broker.username, broker.password)
 
-    if parsed.scheme in ("mqtts", "ssl", "tls"):
+    if broker.tls:
         tls_kwargs: dict[str, str] = {}
         if MQTT_TLS_CA_CERT:
             tls_kwargs["ca_certs"] = MQTT_TLS_CA_CERT
@@ -82,22 +107,39 @@ def _build_mqtt_client() -> mqtt.Client | None:
             print(f"MQTT 接続に失敗: {reason_code}")
             return
         client.subscribe(MQTT_TOPIC, qos=1)
-        print(f"MQTT 接続完了: {host}:{port} / topic={MQTT_TOPIC}")
+        print(f"MQTT 接続完了: {broker.host}:{broker.port} / topic={MQTT_TOPIC}")
 
     def on_message(client: mqtt.Client, userdata, message: mqtt.MQTTMessage):
+        received_at = utcnow()
         try:
             payload = json.loads(message.payload.decode("utf-8"))
             reading = PowerReading(**payload)
-            _write_to_influx(reading)
+            decoded_at = utcnow()
+            outcome = admission.admit(reading, received_at)
+            if outcome != LIVE:
+                record_deferred(reading, transport="mqtt", outcome=outcome)
+                return
+            _write_to_influx(write_api, reading)
+            committed_at = utcnow()
+            admission.observe_live((committed_at - received_at).total_seconds())
+            record_trace(
+                reading,
+                transport="mqtt",
+                received_at=received_at,
+                decoded_at=decoded_at,
+                committed_at=committed_at,
+            )
+            READINGS.inc(transport="mqtt", outcome="written")
             print(f"MQTT 受信 -> Influx 書き込み完了: {reading}")
         except Exception as exc:
+            READINGS.inc(transport="mqtt", outcome="failed")
             print(f"MQTT メッセージ処理エラー: {exc} / payload={message.payload!r}")
 
     mqtt_client.on_connect = on_connect
     mqtt_client.on_message = on_message
 
     try:
-        mqtt_client.connect_async(host, port)
+        mqtt_client.connect_async(broker.host, broker.port)
         mqtt_client.loop_start()
     except Exception as exc:
         print(f"MQTT 接続開始に失敗しました: {exc}")
@@ -105,23 +147,94 @@ def _build_mqtt_client() -> mqtt.Client | None:
     return mqtt_client
 
 
-mqtt_client = _build_mqtt_client()
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    client = InfluxDBClient(url=INFLUX_URL, token=INFLUX_TOKEN, org=INFLUX_ORG)
+    write_api = client.write_api(write_options=SYNCHRONOUS)
+    admission = AdmissionController.from_env()
+    stop_drain = threading.Event()
+    drainer = threading.Thread(
+        target=_drain_backlog,
+        args=(write_api, admission, stop_drain),
+        name="backlog-drain",
+        daemon=True,
+    )
+    drainer.start()
+    mqtt_client = _build_mqtt_client(write_api, admission)
+    app.state.write_api = write_api
+    app.state.admission = admission
+    app.state.mqtt_client = mqtt_client
+    app.state.archive = ArchiveReader.from_env()
+    try:
+        yield
+    finally:
+        app.state.archive.close()
+        if mqtt_client is not None:
+            # 受信スレッドを止めてから Influx クライアントを閉じる
+            mqtt_client.disconnect()
+            mqtt_client.loop_stop()
+        stop_drain.set()
+        drainer.join()
+        write_api.close()
+        client.close()
+
+
+app = FastAPI(title="Home IoT Server", version="0.2.0", lifespan=lifespan)
+app.include_router(archive_router)
 
 
 @app.get("/health", tags=["meta"])
-def health() -> dict[str, str | bool]:
+def health(request: Request) -> dict[str, str | bool | int]:
     """ヘルスチェック用の軽量エンドポイント。"""
 
     return {
         "status": "ok",
+        "mode": "threaded",
         "influx_url": INFLUX_URL or "not-set",
-        "mqtt_connected": bool(mqtt_client),
+        "mqtt_connected": bool(request.app.state.mqtt_client),
+        "backlog_pending": request.app.state.admission.pending,
     }
 
 
 @app.post("/readings", tags=["power"])
-def ingest_reading(reading: PowerReading) -> dict[str, str]:
-    """HTTP 経由の読み取りデータも InfluxDB に反映する。"""
-
-    _write_to_influx(reading)
+def ingest_reading(
+    reading: PowerReading, request: Request, response: Response
+) -> dict[str, str]:
+    """HTTP 経由の読み取りデータも InfluxDB に反映する。古い点は 202 で後から書く。"""
+
+    received_at = utcnow()
+    admission: AdmissionController = request.app.state.admission
+    outcome = admission.admit(reading, received_at)
+    if outcome != LIVE:
+        record_deferred(reading, transport="http", outcome=outcome)
+        if outcome == SHED:
+            raise HTTPException(
+                status_code=429,
+                detail="滞留キューが一杯です",
+                headers={"Retry-After": "5"},
+            )
+        response.status_code = 202
+        return {"status": "queued"}
+    try:
+        _write_to_influx(request.app.state.write_api, reading)
+    except Exception:
+        READINGS.inc(transport="http", outcome="failed")
+        raise
+    committed_at = utcnow()
+    admission.observe_live((committed_at - received_at).total_seconds())
+    record_trace(
+        reading,
+        transport="http",
+        received_at=received_at,
+        decoded_at=received_at,
+        committed_at=committed_at,
+    )
+    READINGS.inc(transport="http", outcome="written")
     return {"status": "written"}
+
+
+@app.get("/metrics", tags=["meta"], response_class=PlainTextResponse)
+def metrics() -> str:
+    """Prometheus が scrape する段階別レイテンシと欠損数。"""
+
+    return render_metrics()
@@ -0,0 +1,223 @@
+"""Prometheus テキスト形式で公開するゲートウェイのメトリクス。"""
+
+from __future__ import annotations
+
+import bisect
+import threading
+from datetime import datetime, timezone
+
+# 秒単位のバケット上限。MQTT/Influx の段は ms、端から端までは秒のオーダー。
+LATENCY_BUCKETS = (
+    0.001,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+
+
+def _escape_label_value(value: str) -> str:
+    # meter などは送信側が決める値なので、テキスト形式が壊れないようにする
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: tuple[tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    inner = ",".join(f'{key}="{_escape_label_value(value)}"' for key, value in labels)
+    return "{" + inner + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """ラベル付きの累積ヒストグラム。"""
+
+    def __init__(
+        self, name: str, help_text: str, buckets: tuple[float, ...] = LATENCY_BUCKETS
+    ) -> None:
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._series: dict[tuple[tuple[str, str], ...], list[float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # バケットごとの件数 + (+Inf, 合計, 件数)
+                series = self._series[key] = [0.0] * (len(self.buckets) + 3)
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> list[str]:
+        lines = [
+            f"# HELP {self.name} {self.help_text}",
+            f"# TYPE {self.name} histogram",
+        ]
+        with self._lock:
+            snapshot = {key: list(values) for key, values in self._series.items()}
+        for key, values in sorted(snapshot.items()):
+            cumulative = 0.0
+            for bound, count in zip(self.buckets + (float("inf"),), values):
+                cumulative += count
+                bucket_labels = _format_labels(key + (("le", _format_value(bound)),))
+                lines.append(f"{self.name}_bucket{bucket_labels} {int(cumulative)}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {values[-2]!r}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {int(values[-1])}")
+        return lines
+
+
+class Counter:
+    """ラベル付きの単調増加カウンタ。"""
+
+    def __init__(self, name: str, help_text: str) -> None:
+        self.name = name
+        self.help_text = help_text
+        self._lock = threading.Lock()
+        self._values: dict[tuple[tuple[str, str], ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [
+            f"# HELP {self.name} {self.help_text}",
+            f"# TYPE {self.name} counter",
+        ]
+        with self._lock:
+            snapshot = dict(self._values)
+        for key, value in sorted(snapshot.items()):
+            lines.append(f"{self.name}{_format_labels(key)} {_format_value(value)}")
+        return lines
+
+
+class Gauge:
+    """ラベル付きの現在値。"""
+
+    def __init__(self, name: str, help_text: str) -> None:
+        self.name = name
+        self.help_text = help_text
+        self._lock = threading.Lock()
+        self._values: dict[tuple[tuple[str, str], ...], float] = {}
+
+    def set(self, value: float, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = value
+
+    def render(self) -> list[str]:
+        lines = [
+            f"# HELP {self.name} {self.help_text}",
+            f"# TYPE {self.name} gauge",
+        ]
+        with self._lock:
+            snapshot = dict(self._values)
+        for key, value in sorted(snapshot.items()):
+            lines.append(f"{self.name}{_format_labels(key)} {_format_value(value)}")
+        return lines
+
+
+class SequenceTracker:
+    """meter ごとの seq から欠損・重複・再起動を数える。"""
+
+    def __init__(self, gaps: Counter) -> None:
+        self._gaps = gaps
+        self._lock = threading.Lock()
+        self._last: dict[str, int] = {}
+
+    def observe(self, meter: str, seq: int) -> None:
+        with self._lock:
+            last = self._last.get(meter)
+            self._last[meter] = seq
+        if last is None:
+            return
+        if seq > last + 1:
+            self._gaps.inc(seq - last - 1, meter=meter, kind="missing")
+        elif seq == last:
+            self._gaps.inc(meter=meter, kind="duplicate")
+        elif seq < last:
+            # デバイスの再起動で番号が巻き戻った。順序入れ替わりとは区別しない。
+            self._gaps.inc(meter=meter, kind="reset")
+
+
+STAGE_LATENCY = Histogram(
+    "homeiot_gateway_stage_latency_seconds",
+    "Per-stage latency of a reading from meter sample to InfluxDB commit.",
+)
+SEQUENCE_GAPS = Counter(
+    "homeiot_gateway_sequence_gaps_total",
+    "Readings missing, duplicated or reset according to device sequence numbers.",
+)
+READINGS = Counter(
+    "homeiot_gateway_readings_total",
+    "Readings handled by the gateway by transport and outcome.",
+)
+SEQUENCES = SequenceTracker(SEQUENCE_GAPS)
+ARCHIVE_LATENCY = Histogram(
+    "homeiot_gateway_archive_request_seconds",
+    "Latency of archive read API requests by endpoint and cache result.",
+)
+ARCHIVE_REQUESTS = Counter(
+    "homeiot_gateway_archive_requests_total",
+    "Archive read API requests by endpoint and outcome.",
+)
+BACKLOG_PENDING = Gauge(
+    "homeiot_gateway_backlog_pending",
+    "Entries waiting in the ingest backlog (coalesced entries count once).",
+)
+BACKLOG_DRAIN_RATE = Gauge(
+    "homeiot_gateway_backlog_drain_rate",
+    "Current backlog write rate in points per second (AIMD on live latency).",
+)
+
+
+def _seconds_between(start: datetime, end: datetime) -> float:
+    if start.tzinfo is None:
+        start = start.replace(tzinfo=timezone.utc)
+    if end.tzinfo is None:
+        end = end.replace(tzinfo=timezone.utc)
+    # 端末とサーバーの時計ずれで負になった値は 0 として扱う
+    return max(0.0, (end - start).total_seconds())
+
+
+def observe_stage(
+    stage: str, start: datetime, end: datetime, *, transport: str
+) -> None:
+    STAGE_LATENCY.observe(
+        _seconds_between(start, end), stage=stage, transport=transport
+    )
+
+
+def render_metrics() -> str:
+    lines: list[str] = []
+    for metric in (
+        STAGE_LATENCY,
+        SEQUENCE_GAPS,
+        READINGS,
+        ARCHIVE_LATENCY,
+        ARCHIVE_REQUESTS,
+        BACKLOG_PENDING,
+        BACKLOG_DRAIN_RATE,
+    ):
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,269 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from homeiot_mqtt_gateway import admission
+from homeiot_mqtt_gateway.admission import (
+    COALESCED,
+    LIVE,
+    QUEUED,
+    SHED,
+    AdmissionController,
+    Backlog,
+    ShedLog,
+    TokenBucket,
+    get_bool_env,
+)
+from homeiot_mqtt_gateway.ingest import PowerReading, build_point
+
+T0 = datetime(2026, 10, 1, 0, 0, tzinfo=timezone.utc)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def reading(seconds, power=100.0, *, meter="m1", energy=None, seq=None):
+    return PowerReading(
+        meter=meter,
+        power_w=power,
+        energy_import_kwh=energy,
+        measured_at=T0 + timedelta(seconds=seconds),
+        seq=seq,
+    )
+
+
+def coalescing_backlog(max_entries=100):
+    return Backlog(max_entries=max_entries, coalesce_threshold=0, coalesce_seconds=60)
+
+
+def test_token_bucket_refills_at_rate_up_to_burst():
+    bucket = TokenBucket(rate=2.0, burst=3.0, now=0.0)
+
+    assert [bucket.take(0.0) for _ in range(4)] == [True, True, True, False]
+    assert bucket.take(0.5)
+    assert not bucket.take(0.5)
+    assert [bucket.take(100.0) for _ in range(4)] == [True, True, True, False]
+
+
+def test_put_take_put_on_the_same_bucket_rewrites_a_complete_aggregate():
+    backlog = coalescing_backlog()
+    backlog.put(reading(10, 100.0, energy=1.0))
+    backlog.put(reading(20, 200.0, energy=1.5))
+    [first] = backlog.take(10)
+
+    # 書き込み中の区間に届いた点は、書いている分を引き継いだ新しい集約になる
+    assert backlog.put(reading(30, 600.0, energy=1.2)) == COALESCED
+    backlog.commit([first])
+    [second] = backlog.take(10)
+    backlog.commit([second])
+    # 書き込み済みの区間に届いた点も同じ
+    backlog.put(reading(40, 300.0))
+    [third] = backlog.take(10)
+
+    assert (first.samples, first.new_samples) == (2, 2)
+    assert (second.samples, second.new_samples) == (3, 1)
+    assert (third.samples, third.new_samples) == (4, 1)
+    built = third.build()
+    assert built.measured_at == T0
+    assert built.power_w == pytest.approx(300.0)
+    assert built.energy_import_kwh == 1.5
+    assert built.seq is None
+
+
+def test_requeued_bucket_takes_new_points_again():
+    backlog = coalescing_backlog()
+    backlog.put(reading(10, 100.0))
+    batch = backlog.take(10)
+    backlog.requeue(batch)
+
+    assert backlog.put(reading(20, 300.0)) == COALESCED
+    assert len(backlog) == 1
+    [entry] = backlog.take(10)
+    assert entry is batch[0]
+    assert (entry.samples, entry.build().power_w) == (2, 200.0)
+
+
+def test_requeue_keeps_the_older_aggregate_ahead_of_the_one_carrying_it():
+    backlog = coalescing_backlog()
+    backlog.put(reading(10, 100.0))
+    batch = backlog.take(10)
+    backlog.put(reading(20, 300.0))
+    backlog.requeue(batch)
+    backlog.put(reading(30, 500.0))
+
+    older, newer = backlog.take(10)
+    assert older is batch[0]
+    # 後に書く方が全部の点を持つので、同じ時刻の上書きで揃う
+    assert (older.samples, newer.samples) == (1, 3)
+    assert newer.build().power_w == pytest.approx(300.0)
+
+
+def test_aggregates_are_written_to_their_own_series():
+    backlog = coalescing_backlog()
+    backlog.put(reading(10, 100.0))
+    [entry] = backlog.take(10)
+    raw = build_point(reading(0, 100.0))
+
+    point = entry.to_point()
+    assert point.to_line_protocol() != raw.to_line_protocol()
+    assert "coalesced=60s" in point.to_line_protocol()
+    assert (
+        point.to_line_protocol().split(" ")[-1] == raw.to_line_protocol().split(" ")[-1]
+    )
+
+
+def test_take_round_robins_meters_and_sheds_beyond_the_limit():
+    backlog = Backlog(max_entries=3, coalesce_threshold=100, coalesce_seconds=60)
+    outcomes = [
+        backlog.put(reading(0, meter="a")),
+        backlog.put(reading(1, meter="a")),
+        backlog.put(reading(2, meter="b")),
+        backlog.put(reading(3, meter="b")),
+    ]
+
+    assert outcomes == [QUEUED, QUEUED, QUEUED, SHED]
+    assert [entry.reading.meter for entry in backlog.take(10)] == ["a", "b", "a"]
+
+
+def test_admit_routes_old_and_over_rate_points_to_the_backlog():
+    clock = FakeClock()
+    controller = AdmissionController(
+        coalescing_backlog(),
+        meter_rate=1.0,
+        meter_burst=2.0,
+        backlog_age=120.0,
+        clock=clock,
+    )
+    received = T0 + timedelta(seconds=200)
+
+    assert controller.admit(reading(10), received) == COALESCED
+    fresh = [controller.admit(reading(190 + i), received) for i in range(3)]
+    assert fresh == [LIVE, LIVE, COALESCED]
+    clock.now = 1.0
+    assert controller.admit(reading(195), received) == LIVE
+    assert controller.pending == 2
+
+
+def test_queued_reading_without_a_timestamp_keeps_its_receive_time():
+    clock = FakeClock()
+    backlog = Backlog(max_entries=10, coalesce_threshold=10, coalesce_seconds=60)
+    controller = AdmissionController(
+        backlog, meter_rate=1.0, meter_burst=1.0, clock=clock
+    )
+    received = T0 + timedelta(seconds=5)
+    untimed = PowerReading(meter="m1", power_w=2.0)
+
+    assert controller.admit(untimed, received) == LIVE
+    assert controller.admit(untimed, received) == QUEUED
+    [entry] = backlog.take(10)
+
+    assert entry.reading.measured_at == received
+    assert (
+        entry.to_point()
+        .to_line_protocol()
+        .endswith(str(int(received.timestamp() * 1e9)))
+    )
+    assert untimed.measured_at is None
+
+
+def test_idle_full_token_buckets_are_dropped():
+    clock = FakeClock()
+    controller = AdmissionController(
+        coalescing_backlog(), meter_rate=1.0, meter_burst=2.0, clock=clock
+    )
+    received = T0 + timedelta(seconds=10)
+    for meter in ("a", "b", "c"):
+        controller.admit(reading(10, meter=meter), received)
+
+    # 2 秒で満タンに戻る。1.5 秒に 2 件使った c はまだ戻らない
+    clock.now = 1.5
+    controller.admit(reading(11, meter="c"), received)
+    controller.admit(reading(11, meter="c"), received)
+    controller.admit(reading(11, meter="d"), received)
+    assert sorted(controller._buckets) == ["a", "b", "c", "d"]
+    clock.now = 2.5
+    controller.admit(reading(12, meter="d"), received)
+    assert sorted(controller._buckets) == ["c", "d"]
+
+
+def test_admit_passes_everything_through_when_disabled():
+    controller = AdmissionController(coalescing_backlog(), enabled=False)
+
+    assert controller.admit(reading(0), T0 + timedelta(days=1)) == LIVE
+    assert controller.pending == 0
+
+
+def test_drain_rate_follows_aimd_on_the_live_budget():
+    backlog = Backlog(max_entries=100, coalesce_threshold=100, coalesce_seconds=60)
+    controller = AdmissionController(
+        backlog, live_budget=0.5, batch_size=2, min_rate=10.0, max_rate=100.0
+    )
+    for i in range(6):
+        backlog.put(reading(i))
+
+    batch = controller.next_batch()
+    assert controller.rate == 10.0
+    assert controller.written(batch) == pytest.approx(2 / 20.0)
+    controller.written(controller.next_batch())
+    assert controller.rate == 30.0
+    controller.observe_live(0.8)
+    batch = controller.next_batch()
+    assert controller.written(batch) == pytest.approx(2 / 15.0)
+    # 予算超過は書き込みごとに一度だけ効く
+    assert controller.rate == 15.0
+    controller.failed(batch)
+    assert (controller.rate, controller.pending) == (10.0, 2)
+
+
+@pytest.mark.parametrize(
+    ("raw", "expected"),
+    [
+        (None, True),
+        ("off", False),
+        ("false", False),
+        ("No", False),
+        ("0", False),
+        (" on ", True),
+        ("yes", True),
+        ("bogus", True),
+    ],
+)
+def test_bool_env_accepts_the_usual_spellings(monkeypatch, raw, expected):
+    if raw is None:
+        monkeypatch.delenv("INGEST_ADMISSION", raising=False)
+    else:
+        monkeypatch.setenv("INGEST_ADMISSION", raw)
+
+    assert get_bool_env("INGEST_ADMISSION", True) is expected
+
+
+def test_shed_readings_are_logged_with_meter_and_seq_at_a_limited_rate(capsys):
+    clock = FakeClock()
+    log = ShedLog(10.0, clock=clock)
+
+    assert log.record(reading(0, meter="m1", seq=7), "mqtt")
+    assert not log.record(reading(1, meter="m1", seq=8), "mqtt")
+    assert not log.record(reading(2, meter="m2", seq=3), "mqtt")
+    clock.now = 10.0
+    assert log.record(reading(3, meter="m2", seq=4), "mqtt")
+
+    lines = capsys.readouterr().out.splitlines()
+    assert len(lines) == 2
+    assert "meter=m1 seq=7" in lines[0] and "間引いた件数: 0" in lines[0]
+    assert "meter=m2 seq=4" in lines[1] and "間引いた件数: 2" in lines[1]
+
+
+def test_record_deferred_warns_on_shed(monkeypatch):
+    calls = []
+    monkeypatch.setattr(
+        admission.SHED_LOG, "record", lambda item, transport: calls.append(transport)
+    )
+
+    admission.record_deferred(reading(0, seq=1), transport="mqtt", outcome=SHED)
+    admission.record_deferred(reading(0, seq=2), transport="mqtt", outcome=QUEUED)
+
+    assert calls == ["mqtt"]
@@ -0,0 +1,131 @@
+import json
+import os
+from datetime import date, datetime
+from types import SimpleNamespace
+
+import duckdb
+import pytest
+from fastapi import HTTPException
+from homeiot_mqtt_gateway.archive_api import (
+    DAILY_SQL,
+    ArchiveReader,
+    ArchiveUnavailable,
+    energy_daily,
+    energy_hourly,
+)
+
+
+def write_archive(path, days):
+    """`days` の各日に 1 時間 1 件ずつの点と日次集計を持つ DuckDB を書く。"""
+    tmp_path = path.with_name(path.name + ".tmp")
+    with duckdb.connect(tmp_path.as_posix()) as connection:
+        connection.execute(
+            "CREATE TABLE raw_meter_readings (ts_utc TIMESTAMP, ts_jst TIMESTAMP, "
+            "source VARCHAR, instant_power_w DOUBLE, energy_import_kwh DOUBLE, "
+            "energy_export_kwh DOUBLE, ingested_at TIMESTAMP)"
+        )
+        connection.execute(
+            "CREATE TABLE daily_source_rollups (dt DATE, source VARCHAR, "
+            "samples BIGINT, avg_power_w DOUBLE, min_power_w DOUBLE, "
+            "max_power_w DOUBLE, energy_import_kwh DOUBLE, "
+            "first_ts_utc TIMESTAMP, last_ts_utc TIMESTAMP)"
+        )
+        for day in days:
+            connection.execute(
+                """
+                INSERT INTO raw_meter_readings
+                SELECT ts - INTERVAL 9 HOUR, ts, 'meter1', 100 * i, i, NULL, ts
+                FROM (
+                  SELECT CAST($day AS TIMESTAMP) + i * INTERVAL 1 HOUR AS ts, i
+                  FROM range(24) t(i)
+                )
+                """,
+                {"day": day},
+            )
+            connection.execute(
+                "INSERT INTO daily_source_rollups "
+                "VALUES ($day, 'meter1', 24, 1150, 0, 2300, 23, NULL, NULL)",
+                {"day": day},
+            )
+    os.replace(tmp_path, path)
+
+
+def request_for(reader):
+    return SimpleNamespace(app=SimpleNamespace(state=SimpleNamespace(archive=reader)))
+
+
+def daily_rows(reader):
+    params = {"start": date(2026, 1, 1), "end": date(2026, 12, 31), "meter": None}
+    return reader.query(
+        ("daily", 2026), DAILY_SQL, params, lambda rows: json.dumps(len(rows)).encode()
+    )
+
+
+@pytest.fixture
+def archive_path(tmp_path):
+    path = tmp_path / "home_energy.duckdb"
+    write_archive(path, [date(2026, 9, 29)])
+    return path
+
+
+def test_results_are_cached_until_the_file_is_replaced(archive_path):
+    reader = ArchiveReader(archive_path.as_posix(), pool_size=2, cache_size=8)
+
+    assert daily_rows(reader) == (b"1", False)
+    assert daily_rows(reader) == (b"1", True)
+    old = reader._current
+    write_archive(archive_path, [date(2026, 9, 29), date(2026, 9, 30)])
+
+    assert daily_rows(reader) == (b"2", False)
+    assert old.retired and reader._current is not old
+    assert daily_rows(reader) == (b"2", True)
+    reader.close()
+
+
+def test_retired_generation_closes_after_its_borrowed_connection_returns(
+    archive_path,
+):
+    reader = ArchiveReader(archive_path.as_posix(), pool_size=2)
+    reader.generation()
+    owner, connection = reader._checkout()
+    write_archive(archive_path, [date(2026, 9, 30)])
+    reader.generation()
+
+    # 貸し出し中の接続は入れ替え後も古いファイルを読める
+    assert owner.retired
+    assert connection.execute(
+        "SELECT MAX(dt) FROM archive.daily_source_rollups"
+    ).fetchone() == (date(2026, 9, 29),)
+    reader._checkin(owner, connection, healthy=True)
+    assert owner.idle == []
+    with pytest.raises(duckdb.ConnectionException):
+        owner.root.execute("SELECT 1")
+    assert reader.latest_day() == date(2026, 9, 30)
+    reader.close()
+
+
+def test_missing_or_closed_archive_is_unavailable(tmp_path, archive_path):
+    missing = ArchiveReader((tmp_path / "missing.duckdb").as_posix())
+    with pytest.raises(ArchiveUnavailable):
+        daily_rows(missing)
+
+    reader = ArchiveReader(archive_path.as_posix())
+    reader.close()
+    with pytest.raises(ArchiveUnavailable):
+        reader._checkout()
+    with pytest.raises(HTTPException) as excinfo:
+        energy_daily(request_for(missing), start=None, end=None, meter=None)
+    assert excinfo.value.status_code == 503
+
+
+def test_hourly_defaults_to_the_latest_archived_day(archive_path):
+    reader = ArchiveReader(archive_path.as_posix())
+
+    response = energy_hourly(request_for(reader), start=None, end=None, meter=None)
+
+    body = json.loads(response.body)
+    assert (body["from"], body["to"]) == ("2026-09-29", "2026-09-29")
+    assert len(body["rows"]) == 24
+    assert body["rows"][0]["hour"] == datetime(2026, 9, 29).isoformat()
+    assert response.headers["X-Archive-Cache"] == "miss"
+    reader.close()
@@ -0,0 +1,228 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import paho.mqtt.client as mqtt
+from homeiot_mqtt_gateway import async_app
+from homeiot_mqtt_gateway.async_mqtt import AsyncMqttConsumer
+from homeiot_mqtt_gateway.ingest import BrokerSettings
+from homeiot_mqtt_gateway.metrics import READINGS
+
+BROKER = BrokerSettings(
+    host="broker.test", port=1883, username=None, password=None, tls=False
+)
+
+
+class FakeClient:
+    """paho の Client の代わり。呼ばれた操作を順に記録する。"""
+
+    def __init__(self, consumer):
+        self.consumer = consumer
+        self.calls = []
+        self.acks = []
+        self.connect_properties = None
+
+    def connect(self, host, port, *, keepalive, properties):
+        self.calls.append("connect")
+        self.connect_properties = properties
+        return mqtt.MQTT_ERR_SUCCESS
+
+    def ack(self, mid, qos):
+        self.acks.append(mid)
+
+    def unsubscribe(self, topic):
+        self.calls.append("unsubscribe")
+
+    def disconnect(self):
+        self.calls.append("disconnect")
+        self.consumer._on_disconnect(self, None, None, None, None)
+
+
+def message(mid, payload=b"{}", qos=1):
+    msg = mqtt.MQTTMessage(mid=mid, topic=b"home/power")
+    msg.qos = qos
+    msg.payload = payload
+    return msg
+
+
+def make_consumer(handler, **kwargs):
+    consumer = AsyncMqttConsumer(BROKER, "home/power", handler, **kwargs)
+    consumer.client = FakeClient(consumer)
+    return consumer
+
+
+def deliver(consumer, *messages):
+    for msg in messages:
+        consumer._on_message(consumer.client, None, msg)
+
+
+async def settle():
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+def test_ack_is_sent_only_after_handler_finishes():
+    async def scenario():
+        release = asyncio.Event()
+        handled = []
+
+        async def handler(msg):
+            await release.wait()
+            handled.append(msg.mid)
+
+        consumer = make_consumer(handler, workers=2)
+        await consumer.start()
+        deliver(consumer, message(1), message(2), message(3, qos=0))
+        await settle()
+        assert consumer.client.acks == []
+        release.set()
+        await settle()
+        assert sorted(handled) == [1, 2, 3]
+        # QoS 0 には ack を送らない
+        assert sorted(consumer.client.acks) == [1, 2]
+        await consumer.stop()
+
+    asyncio.run(scenario())
+
+
+def test_failed_handler_still_acks_and_counts_failure(monkeypatch):
+    class FailingWriteApi:
+        async def write(self, **kwargs):
+            raise ConnectionError("influx down")
+
+    monkeypatch.setattr(async_app, "MQTT_BROKER_URL", "mqtt://broker.test:1883")
+    monkeypatch.setattr(async_app, "ASYNC_WORKERS", 1)
+
+    async def scenario():
+        admission = SimpleNamespace(admit=lambda reading, received_at: async_app.LIVE)
+        state = async_app.GatewayState(
+            write_api=FailingWriteApi(),
+            write_slots=asyncio.Semaphore(1),
+            admission=admission,
+            mqtt=None,
+        )
+        consumer = async_app._build_consumer(state)
+        consumer.client = FakeClient(consumer)
+        await consumer.start()
+        payload = json.dumps({"meter": "m1", "power_w": 100.0}).encode()
+        deliver(consumer, message(7, payload), message(8, b"not json"))
+        await settle()
+        await consumer.stop()
+        return consumer.client.acks
+
+    key = (("outcome", "failed"), ("transport", "mqtt"))
+    before = READINGS._values.get(key, 0)
+    assert asyncio.run(scenario()) == [7, 8]
+    assert READINGS._values[key] - before == 2
+
+
+def test_receive_maximum_is_sent_and_unacked_messages_wait_for_workers():
+    async def scenario():
+        release = asyncio.Event()
+        running = []
+
+        async def handler(msg):
+            running.append(msg.mid)
+            await release.wait()
+
+        consumer = make_consumer(handler, workers=2, receive_maximum=4)
+        await consumer.start()
+        await settle()
+        # ブローカーは CONNECT の Receive Maximum を超えて未 ack の配信をしない
+        assert consumer.client.connect_properties.ReceiveMaximum == 4
+        deliver(consumer, *(message(mid) for mid in range(1, 5)))
+        await settle()
+        # 処理中は 2 件だけで、残りはキューで待ち、どれもまだ ack されない
+        assert running == [1, 2]
+        assert consumer.pending == 2
+        assert consumer.client.acks == []
+        release.set()
+        await settle()
+        assert sorted(consumer.client.acks) == [1, 2, 3, 4]
+        await consumer.stop()
+
+    asyncio.run(scenario())
+
+
+def test_stop_drains_in_flight_messages_before_disconnect():
+    async def scenario():
+        release = asyncio.Event()
+        handled = []
+
+        async def handler(msg):
+            await release.wait()
+            handled.append(msg.mid)
+
+        consumer = make_consumer(handler, workers=1)
+        await consumer.start()
+        await settle()
+        consumer.connected = True
+        deliver(consumer, message(1), message(2), message(3))
+        await settle()
+        stopping = asyncio.create_task(consumer.stop())
+        await settle()
+        assert not stopping.done()
+        assert consumer.client.calls == ["connect", "unsubscribe"]
+        release.set()
+        await stopping
+        assert handled == [1, 2, 3]
+        assert consumer.client.acks == [1, 2, 3]
+        assert consumer.client.calls == ["connect", "unsubscribe", "disconnect"]
+        assert all(task.done() for task in consumer._tasks)
+
+    asyncio.run(scenario())
+
+
+def test_lifespan_opens_and_closes_influx_and_mqtt_clients(monkeypatch):
+    events = []
+
+    class FakeInflux:
+        def __init__(self, **kwargs):
+            self.kwargs = kwargs
+            events.append("influx.open")
+
+        def write_api(self):
+            return SimpleNamespace()
+
+        async def close(self):
+            events.append("influx.close")
+
+    class FakeConsumer:
+        def __init__(self, broker, topic, handler, **kwargs):
+            self.broker = broker
+            self.kwargs = kwargs
+
+        async def start(self):
+            events.append("mqtt.start")
+
+        async def stop(self):
+            events.append("mqtt.stop")
+
+    class FakeArchive:
+        def close(self):
+            events.append("archive.close")
+
+    monkeypatch.setattr(async_app, "InfluxDBClientAsync", FakeInflux)
+    monkeypatch.setattr(async_app, "AsyncMqttConsumer", FakeConsumer)
+    monkeypatch.setattr(async_app, "MQTT_BROKER_URL", "mqtt://broker.test:1883")
+    monkeypatch.setattr(async_app.ArchiveReader, "from_env", FakeArchive)
+
+    async def scenario():
+        app = SimpleNamespace(state=SimpleNamespace())
+        async with async_app.lifespan(app):
+            assert events == ["influx.open", "mqtt.start"]
+            state = app.state.gateway
+            assert state.mqtt.broker.host == "broker.test"
+            assert (
+                state.mqtt.kwargs["receive_maximum"] == async_app.MQTT_RECEIVE_MAXIMUM
+            )
+
+    asyncio.run(scenario())
+    # 受け取り済みを書き切ってから Influx を閉じる
+    assert events == [
+        "influx.open",
+        "mqtt.start",
+        "archive.close",
+        "mqtt.stop",
+        "influx.close",
+    ]
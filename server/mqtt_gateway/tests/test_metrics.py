@@ -0,0 +1,56 @@
+from homeiot_mqtt_gateway.metrics import Counter, Gauge, Histogram, SequenceTracker
+
+
+def test_histogram_renders_cumulative_buckets_sum_and_count():
+    histogram = Histogram("latency_seconds", "Latency.", buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value, stage="influx")
+
+    assert histogram.render() == [
+        "# HELP latency_seconds Latency.",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{stage="influx",le="0.1"} 2',
+        'latency_seconds_bucket{stage="influx",le="1.0"} 3',
+        'latency_seconds_bucket{stage="influx",le="+Inf"} 4',
+        'latency_seconds_sum{stage="influx"} 3.65',
+        'latency_seconds_count{stage="influx"} 4',
+    ]
+
+
+def test_counter_and_gauge_keep_one_series_per_label_set():
+    counter = Counter("readings_total", "Readings.")
+    counter.inc(transport="mqtt", outcome="written")
+    counter.inc(2, outcome="written", transport="mqtt")
+    counter.inc(transport="http", outcome="shed")
+    gauge = Gauge("pending", "Pending.")
+    gauge.set(5)
+    gauge.set(3)
+
+    assert counter.render()[2:] == [
+        'readings_total{outcome="shed",transport="http"} 1',
+        'readings_total{outcome="written",transport="mqtt"} 3',
+    ]
+    assert gauge.render()[2:] == ["pending 3"]
+
+
+def test_label_values_from_payloads_are_escaped():
+    counter = Counter("readings_total", "Readings.")
+    counter.inc(meter='a"b\\c\nd')
+
+    assert counter.render()[2:] == ['readings_total{meter="a\\"b\\\\c\\nd"} 1']
+
+
+def test_sequence_tracker_counts_gaps_duplicates_and_resets():
+    gaps = Counter("gaps_total", "Gaps.")
+    tracker = SequenceTracker(gaps)
+    for seq in (1, 2, 5, 5, 6, 1, 2):
+        tracker.observe("m1", seq)
+    # メーターごとに別々に追う
+    tracker.observe("m2", 10)
+    tracker.observe("m2", 11)
+
+    assert gaps.render()[2:] == [
+        'gaps_total{kind="duplicate",meter="m1"} 1',
+        'gaps_total{kind="missing",meter="m1"} 2',
+        'gaps_total{kind="reset",meter="m1"} 1',
+    ]